@@ -1,32 +1,64 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, send_from_directory, make_response, session, send_file
-from datetime import datetime
-from langchain_core import embeddings
+from flask import Flask, Request, render_template, request, jsonify, redirect, url_for, send_from_directory, make_response, session, send_file, Response, stream_with_context, g
+from datetime import datetime, timedelta
 from werkzeug.utils import secure_filename
 import os
 import subprocess
 import sys
 import io
+import json
+import time
 # UPDATED IMPORT: Import both generate_quiz and the new grade_quiz function
-from backend.quizes import generate_quiz, grade_quiz 
+from backend.quizes import generate_quiz, generate_quiz_stream, grade_quiz 
+from backend.grading_scheduler import grading_scheduler, GradingQueueFull
+from backend.grading_cache import verdict_cache
+from backend.llm_json import parse_stats
+from backend.quiz_bank import get_or_generate_quiz, stream_quiz_with_bank, bank_stats, start_pregeneration_worker
 from backend.flashcards import generate_flashcards
 from backend.query_rag import query_book_rag
 from rag_com.indexer import indexer
-from backend.slide_decks import generate_slide_deck, create_pdf_from_slides
+from backend.slide_decks import generate_slide_deck, generate_slide_deck_parallel, create_pdf_from_slides, render_pdf_offloaded
+from backend.slide_pdf import stream_zip_of_pdfs, batch_zip_filename, BATCH_EXPORT_MAX_DECKS
 from backend.manage_books import query_book_content
-from langchain_huggingface import HuggingFaceEmbeddings
+from backend.lazy_loading import create_embeddings
+from backend import book_catalog, book_artifacts, retrieval_filters
+from backend.retrieval_filters import RetrievalFilterError
+from backend.metrics import HTTP_REQUEST_SECONDS, render_prometheus, PROMETHEUS_CONTENT_TYPE
+from backend.tracing import begin_trace, end_trace
+from backend.study_context import study_context_store, load_secret_key, new_session_id
+from backend import uploads
+from backend.uploads import UploadError, UploadOffsetMismatch, MAX_UPLOAD_BYTES
+from backend import index_maintenance, index_versions
+from backend.admission import admission, async_admission, AdmissionRejected, client_key
+
+MAX_REQUEST_BYTES = 16 * 1024 * 1024    # JSON bodies of every route except the uploads
+UPLOAD_ENDPOINTS = ('upload_book', 'upload_and_index_book', 'resumable_upload')
+
+class UploadLimitRequest(Request):
+    # Uploads are streamed to disk (backend/uploads.py), so only their routes
+    # accept book-sized bodies; the rest keep MAX_CONTENT_LENGTH
+    @property
+    def max_content_length(self):
+        if self.endpoint in UPLOAD_ENDPOINTS:
+            return MAX_UPLOAD_BYTES + 1024 * 1024  # + multipart overhead
+        return super().max_content_length
 
 app = Flask(__name__)
+app.request_class = UploadLimitRequest
 app.config['BOOKS_FOLDER'] = 'books'
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
-embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
+app.config['MAX_CONTENT_LENGTH'] = MAX_REQUEST_BYTES
+# MiniLM is loaded lazily / on a warm-up thread (LEARNLY_STARTUP=warm|lazy|eager)
+# so the app can serve pages before torch and sentence-transformers are imported.
+embeddings = create_embeddings()
 from dotenv import load_dotenv
 load_dotenv()
-# app.secret_key = 'your-secret-key-here'  # Required for session
+# Signs the session cookie that carries the study-context session id
+app.secret_key = load_secret_key()
+app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(days=30)
 
-# Global variables to store dashboard inputs
-global_class = None
-global_subjects = []
-global_study_topic = None
+# Optional background job that tops up the quiz bank for popular topics.
+# Started on the first request rather than at import: under gunicorn
+# --preload the import runs in the master, whose threads are not forked.
+PREGENERATE_QUIZZES = os.getenv("QUIZ_PREGENERATE") == "1"
 
 # Ensure required directories exist with proper permissions
 os.makedirs(app.config['BOOKS_FOLDER'], exist_ok=True)
@@ -37,21 +69,115 @@ CHROMA_INDEX_DIR = os.path.join(os.getcwd(), 'chroma_index')
 os.makedirs(CHROMA_INDEX_DIR, exist_ok=True)
 os.chmod(CHROMA_INDEX_DIR, 0o777)  # Full read/write permissions
 
+# Indexes written before versioning move under a CURRENT pointer (backend/index_versions.py)
+index_versions.migrate_legacy_layout(CHROMA_INDEX_DIR)
+
+# Pick up books that were copied into books/ (or removed) while the app was down
+book_catalog.sync_with_folder(app.config['BOOKS_FOLDER'], CHROMA_INDEX_DIR)
+uploads.expire_stale_uploads()
+
+def json_flag(data, key: str, default: bool) -> bool:
+    """A boolean request field; the strings "false" / "0" / "no" / "off" count as false."""
+    value = data.get(key, default)
+    if isinstance(value, str):
+        return value.strip().lower() not in ("", "false", "0", "no", "off")
+    return bool(value)
+
+@app.before_request
+def start_background_workers():
+    if PREGENERATE_QUIZZES:
+        start_pregeneration_worker(generate_quiz, embeddings)
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    # Sampled requests (TRACE_SAMPLE_RATE) record a span tree, see backend/tracing.py
+    if request.endpoint not in ('metrics', 'static'):
+        g.trace = begin_trace(request.url_rule.rule if request.url_rule else request.path, method=request.method)
+
+@app.before_request
+def admit_expensive_request():
+    # Generation routes wait for capacity or are refused here (backend/admission.py);
+    # cheap routes have no cost and pass straight through
+    route = request.url_rule.rule if request.url_rule else None
+    if request.method != 'POST' or admission.cost_of(route) is None:
+        return None
+    try:
+        g.admission_ticket = admission.acquire(route, client_key(request.remote_addr, request.headers.get('X-Forwarded-For')))
+    except AdmissionRejected as e:
+        response = jsonify({"error": str(e)})
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response, e.status
+    return None
+
+@app.after_request
+def record_request_latency(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - started,
+            route=request.url_rule.rule if request.url_rule else "unmatched",
+            method=request.method,
+            status=response.status_code,
+        )
+    if g.get('trace'):
+        g.trace[0].set(status=response.status_code)
+    return response
+
+@app.teardown_request
+def finish_trace(error=None):
+    # Runs after streamed bodies finish, so their spans are included
+    end_trace(g.pop('trace', None), error=f"{type(error).__name__}: {error}" if error else None)
+
+@app.teardown_request
+def release_admission(error=None):
+    # Also after streamed bodies, so a running quiz stream keeps its capacity
+    ticket = g.pop('admission_ticket', None)
+    if ticket is not None:
+        admission.release(ticket)
+
+@app.route("/metrics")
+def metrics():
+    # Prometheus text format: per-route latency, per-stage timings, LLM calls/tokens, cache hits
+    return Response(render_prometheus(), content_type=PROMETHEUS_CONTENT_TYPE)
+
+@app.route("/ready")
+def ready():
+    # Readiness probe: 200 once the embedding model is loaded, 503 while it is warming up
+    status = embeddings.status()
+    return jsonify(status), (200 if status['ready'] else 503)
+
 @app.route("/")
 def dashboard():
     return render_template("dashboard.html", active_page='dashboard')
 
+def current_study_context():
+    # Dashboard inputs for this browser session, or None if not submitted yet
+    session_id = session.get('sid')
+    if not session_id:
+        return None
+    return study_context_store.get(session_id, session.get('context_version'))
+
 @app.route('/submit_user_info', methods=['POST'])
 def submit_user_info():
-    global global_class, global_subjects, global_study_topic
-    
     data = request.get_json()
-    global_class = data.get('class')
-    global_subjects = data.get('subjects', [])
-    global_study_topic = data.get('study_topic')
+    context = {
+        'class': data.get('class'),
+        'subjects': data.get('subjects', []),
+        'study_topic': data.get('study_topic'),
+    }
+
+    session.permanent = True
+    session_id = session.get('sid') or new_session_id()
+    session['sid'] = session_id
+    session['context_version'] = study_context_store.save(session_id, context)
     
     return jsonify({"status": "success"})
 
+@app.route('/study_context_stats')
+def study_context_stats():
+    return jsonify(study_context_store.stats())
+
 @app.route("/quizes")
 def quizes():
     return render_template("quizes.html", active_page='quizes')
@@ -68,18 +194,79 @@ def generate_quiz_route():
     num_questions = data.get("num_questions", 10)
     difficulty = data.get("difficulty", "Medium")
     mcq_percent = data.get("mcq_percent", 70) 
+    use_bank = json_flag(data, "use_bank", True)
 
     try:
-        quiz_json = generate_quiz(
-            prompt=prompt, 
-            num_questions=num_questions, 
-            difficulty=difficulty, 
-            mcq_percent=mcq_percent
-        )
+        if use_bank:
+            # Assemble from the question bank; the LLM only generates the shortfall
+            quiz_json = get_or_generate_quiz(
+                generate_quiz,
+                prompt=prompt,
+                num_questions=num_questions,
+                difficulty=difficulty,
+                mcq_percent=mcq_percent,
+                embeddings=embeddings
+            )
+        else:
+            quiz_json = generate_quiz(
+                prompt=prompt, 
+                num_questions=num_questions, 
+                difficulty=difficulty, 
+                mcq_percent=mcq_percent
+            )
         return jsonify(quiz_json)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+# =========================================================
+# STREAMING QUIZ GENERATION ROUTE
+# Emits newline-delimited JSON events (meta, question..., done)
+# so the page can render question 1 while the rest are generated.
+# =========================================================
+@app.route("/generate_quiz_stream", methods=["POST"])
+def generate_quiz_stream_route():
+    data = request.json
+
+    prompt = data.get("prompt", "Generate a general knowledge quiz with 3 questions.")
+    num_questions = data.get("num_questions", 10)
+    difficulty = data.get("difficulty", "Medium")
+    mcq_percent = data.get("mcq_percent", 70)
+    use_bank = json_flag(data, "use_bank", True)
+
+    def event_stream():
+        try:
+            if use_bank:
+                events = stream_quiz_with_bank(
+                    generate_quiz_stream,
+                    prompt=prompt,
+                    num_questions=num_questions,
+                    difficulty=difficulty,
+                    mcq_percent=mcq_percent,
+                    embeddings=embeddings
+                )
+            else:
+                events = generate_quiz_stream(
+                    prompt=prompt,
+                    num_questions=num_questions,
+                    difficulty=difficulty,
+                    mcq_percent=mcq_percent
+                )
+            for event in events:
+                yield json.dumps(event) + "\n"
+        except Exception as e:
+            print(f"Quiz Stream Error: {str(e)}")
+            yield json.dumps({"event": "error", "error": str(e)}) + "\n"
+
+    return Response(
+        stream_with_context(event_stream()),
+        mimetype="application/x-ndjson",
+        headers={"X-Accel-Buffering": "no", "Cache-Control": "no-cache"}
+    )
+
+@app.route("/quiz_bank_stats")
+def quiz_bank_stats():
+    return jsonify(bank_stats())
+
 # =========================================================
 # NEW GRADING ROUTE
 # =========================================================
@@ -88,17 +275,37 @@ def grade_quiz_route():
     data = request.json
     quiz_data = data.get("quiz_data")
     user_answers = data.get("user_answers")
+    batch_grading = json_flag(data, "batch_grading", True)
     
     if not quiz_data or not user_answers:
         return jsonify({"error": "Missing quiz data or user answers"}), 400
 
     try:
         # Call the new grading function
-        graded_results = grade_quiz(quiz_data, user_answers)
+        graded_results = grade_quiz(quiz_data, user_answers, embeddings, batch=batch_grading)
         return jsonify(graded_results)
+    except GradingQueueFull as e:
+        print(f"Grading Rejected: {str(e)}")
+        response = jsonify({"error": "The grader is busy right now. Please resubmit in a few seconds."})
+        response.headers['Retry-After'] = '5'
+        return response, 503
     except Exception as e:
         print(f"Grading Error: {str(e)}")
         return jsonify({"error": f"Failed to grade quiz: {str(e)}"}), 500
+
+@app.route("/admission_stats")
+def admission_stats():
+    # Capacity in use, queue depth per route and rejections on this worker
+    # ("async" is used by the routes asgi.py serves on the event loop)
+    return jsonify({'threaded': admission.stats(), 'async': async_admission.stats()})
+
+@app.route("/grading_stats")
+def grading_stats():
+    # Queue depth of the shared grading scheduler and verdict cache hit rate
+    return jsonify({
+        'scheduler': grading_scheduler.stats(),
+        'verdict_cache': verdict_cache.stats()
+    })
 # =========================================================
 
 @app.route("/flashcards")
@@ -115,18 +322,29 @@ def generate_slide_deck_route():
     try:
         data = request.json
         prompt = data.get("prompt")
-        use_rag = bool(data.get("use_rag", False))
+        use_rag = json_flag(data, "use_rag", False)
         book_name = data.get("book_name") if use_rag else None
+        # "outline": short outline call, then slide bodies generated in parallel
+        mode = data.get("mode", "single")
+        num_slides = data.get("num_slides")
 
         if not prompt:
             return jsonify({"error": "Prompt is required"}), 400
         if use_rag and not book_name:
             return jsonify({"error": "book_name is required when use_rag is True"}), 400
+        # Optional "chapter" / "page_start" / "page_end": retrieve only from those pages
+        try:
+            page_range = retrieval_filters.from_request(book_name, data)
+        except RetrievalFilterError as e:
+            return jsonify({"error": str(e)}), e.status
 
         print(f"Prompt: {prompt}, Use RAG: {use_rag}, Book Name: {book_name}")
 
-        # Generate slide deck using the original function
-        slide_deck_json = generate_slide_deck(embeddings, prompt, use_rag, book_name)
+        if mode == "outline":
+            slide_deck_json = generate_slide_deck_parallel(embeddings, prompt, use_rag, book_name, num_slides, page_range)
+        else:
+            # Generate slide deck using the original function
+            slide_deck_json = generate_slide_deck(embeddings, prompt, use_rag, book_name, page_range)
         print(f"SLLIDE GENERATION DONE")
         return jsonify(slide_deck_json)
 
@@ -142,11 +360,19 @@ def manage_books():
 
 @app.route('/list_books')
 def list_books():
-    books = get_available_books()
-    return jsonify({
-        'status': 'success',
-        'books': books
-    })
+    # The catalog version changes with every upload/index/delete, so an
+    # unchanged ETag lets the browser reuse its copy without a body.
+    etag = book_catalog.catalog_etag()
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+    else:
+        response = jsonify({
+            'status': 'success',
+            'books': get_available_books()
+        })
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
 
 @app.route('/upload_book', methods=['POST'])
 def upload_book():
@@ -159,14 +385,38 @@ def upload_book():
     
     if file:
         filename = secure_filename(file.filename)
-        file_path = os.path.join(app.config['BOOKS_FOLDER'], filename)
-        file.save(file_path)
+        try:
+            book, duplicate = uploads.save_stream(file.stream, filename)
+        except UploadError as e:
+            return jsonify({'status': 'error', 'message': str(e)}), e.status
         
         return jsonify({
             'status': 'success',
-            'message': 'Book uploaded successfully'
+            'message': 'Book already indexed, linked to the existing index' if duplicate else 'Book uploaded successfully',
+            'duplicate': duplicate
         })
 
+def index_uploaded_book(filename):
+    """Indexes a book that was just placed in books/ and builds the JSON response."""
+    book_name = os.path.splitext(filename)[0]
+    print(f"Indexing book: {book_name}")
+    
+    # Call the indexer function directly
+    success = indexer(embeddings, book_name)
+    
+    if success:
+        print("Indexing done")
+        return jsonify({
+            'status': 'success',
+            'message': 'Book uploaded and indexed successfully!'
+        })
+    else:
+        print("Indexing failed")
+        return jsonify({
+            'status': 'error',
+            'message': 'Failed to index the book'
+        }), 500
+
 @app.route('/upload_and_index_book', methods=['POST'])
 def upload_and_index_book():
     if 'book' not in request.files:
@@ -177,39 +427,29 @@ def upload_and_index_book():
         return jsonify({'status': 'error', 'message': 'No file selected'}), 400
     
     if file and file.filename.lower().endswith('.pdf'):
+        filename = secure_filename(file.filename)
+        file_path = os.path.join(app.config['BOOKS_FOLDER'], filename)
         try:
-            # Save the file
-            filename = secure_filename(file.filename)
-            file_path = os.path.join(app.config['BOOKS_FOLDER'], filename)
-            file.save(file_path)
+            # Stream the file to disk, hashing as it is written
+            book, duplicate = uploads.save_stream(file.stream, filename)
             print(f"Book saved to: {file_path}")
-            
-            # Extract book name without extension for indexing
-            book_name = os.path.splitext(filename)[0]
-            print(f"Indexing book: {book_name}")
-            
-            # Call the indexer function directly
-            success = indexer(embeddings, book_name)
-            
-            if success:
-                print("Indexing done")
+            if duplicate:
                 return jsonify({
                     'status': 'success',
-                    'message': 'Book uploaded and indexed successfully!'
+                    'message': 'Book already indexed, linked to the existing index',
+                    'duplicate': True
                 })
-            else:
-                print("Indexing failed")
-                return jsonify({
-                    'status': 'error',
-                    'message': 'Failed to index the book'
-                }), 500
+            return index_uploaded_book(filename)
                 
+        except UploadError as e:
+            return jsonify({'status': 'error', 'message': str(e)}), e.status
         except Exception as e:
             print(f"Error during upload/indexing: {str(e)}")
             # If there was an error, try to clean up the uploaded file
             try:
                 if os.path.exists(file_path):
                     os.remove(file_path)
+                book_catalog.remove_book(filename)
             except:
                 pass
             return jsonify({
@@ -219,6 +459,55 @@ def upload_and_index_book():
     else:
         return jsonify({'status': 'error', 'message': 'Only PDF files are supported'}), 400
 
+# Resumable uploads for large books:
+#   POST   /uploads           {"filename", "size", "sha256"?} -> upload_id
+#   PATCH  /uploads/<id>      raw chunk, Upload-Offset header; ?index=1 indexes after the last chunk
+#   GET    /uploads/<id>      current offset, to resume after a dropped connection
+#   DELETE /uploads/<id>      abandon
+@app.route('/uploads', methods=['POST'])
+def create_upload():
+    data = request.get_json(silent=True) or {}
+    filename = secure_filename(data.get('filename') or '')
+    try:
+        size = int(data.get('size') or 0)
+    except (TypeError, ValueError):
+        return jsonify({'status': 'error', 'message': 'size must be an integer'}), 400
+    if not filename:
+        return jsonify({'status': 'error', 'message': 'No file name provided'}), 400
+
+    try:
+        return jsonify({'status': 'created', **uploads.create_upload(filename, size, data.get('sha256'))}), 201
+    except UploadError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), e.status
+
+@app.route('/uploads/<upload_id>', methods=['GET', 'PATCH', 'DELETE'])
+def resumable_upload(upload_id):
+    try:
+        if request.method == 'GET':
+            return jsonify({'status': 'in_progress', **uploads.upload_status(upload_id)})
+        if request.method == 'DELETE':
+            if not uploads.abort_upload(upload_id):
+                return jsonify({'status': 'error', 'message': 'Unknown or expired upload'}), 404
+            return jsonify({'status': 'success'})
+
+        try:
+            offset = int(request.headers.get('Upload-Offset', ''))
+        except ValueError:
+            return jsonify({'status': 'error', 'message': 'Upload-Offset header is required'}), 400
+        result = uploads.append_chunk(upload_id, offset, request.stream)
+    except UploadOffsetMismatch as e:
+        response = jsonify({'status': 'error', 'message': str(e), 'offset': e.offset})
+        response.headers['Upload-Offset'] = str(e.offset)
+        return response, e.status
+    except UploadError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), e.status
+
+    if result['status'] == 'complete' and request.args.get('index') == '1':
+        return index_uploaded_book(result['book']['name'])
+    response = jsonify(result)
+    response.headers['Upload-Offset'] = str(result['offset'])
+    return response
+
 @app.route('/delete_book', methods=['POST'])
 def delete_book():
     data = request.get_json()
@@ -230,37 +519,80 @@ def delete_book():
     file_path = os.path.join(app.config['BOOKS_FOLDER'], secure_filename(book_name))
     
     try:
-        if os.path.exists(file_path):
+        file_existed = os.path.exists(file_path)
+        if file_existed:
             os.remove(file_path)
-            return jsonify({'status': 'success', 'message': 'Book deleted successfully'})
-        else:
+        # The catalog row goes even when the file was already removed by hand
+        catalogued = book_catalog.remove_book(secure_filename(book_name))
+        if not file_existed and not catalogued:
             return jsonify({'status': 'error', 'message': 'Book not found'}), 404
+        # Drop the index too, unless another upload of the same content aliases it
+        index_maintenance.remove_index_if_orphaned(secure_filename(book_name), CHROMA_INDEX_DIR)
+        book_artifacts.prune_orphaned()
+        return jsonify({'status': 'success', 'message': 'Book deleted successfully'})
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
+def admin_allowed():
+    # Destructive admin routes: X-Admin-Token must match ADMIN_TOKEN, or without one, localhost only
+    token = os.getenv("ADMIN_TOKEN")
+    if token:
+        return request.headers.get('X-Admin-Token') == token
+    return request.remote_addr in ('127.0.0.1', '::1')
+
+@app.route('/admin/indexes')
+def admin_indexes():
+    rows = index_maintenance.scan(CHROMA_INDEX_DIR)
+    return jsonify({'indexes': rows, 'summary': index_maintenance.summary(rows)})
+
+@app.route('/admin/indexes/gc', methods=['POST'])
+def admin_indexes_gc():
+    if not admin_allowed():
+        return jsonify({'status': 'error', 'message': 'Forbidden'}), 403
+    data = request.get_json(silent=True) or {}
+    return jsonify(index_maintenance.collect_garbage(CHROMA_INDEX_DIR, dry_run=bool(data.get('dry_run'))))
+
+@app.route('/admin/indexes/compact', methods=['POST'])
+def admin_indexes_compact():
+    if not admin_allowed():
+        return jsonify({'status': 'error', 'message': 'Forbidden'}), 403
+    data = request.get_json(silent=True) or {}
+    results = index_maintenance.compact_all(CHROMA_INDEX_DIR, book=data.get('book'))
+    status = 500 if any('error' in r for r in results) else 200
+    return jsonify({'results': results}), status
+
 @app.route('/generate_flashcards', methods=['POST'])
 def create_flashcards():
-    global global_class, global_subjects, global_study_topic
-    
     # Get RAG settings from the flashcards page
     data = request.get_json()
-    rag = data.get('use_rag', False)
+    rag = json_flag(data, 'use_rag', False)
     book_name = data.get('book_name')  # Optional parameter
-    # Use global variables from dashboard
-    if not all([global_class, global_subjects, global_study_topic]):
+    # The book's precomputed deck needs no study context and no LLM call
+    if data.get('use_default_deck') and book_name:
+        deck = book_artifacts.default_flashcards(book_name)
+        if deck:
+            return jsonify({"status": "success", "flashcards": deck, "source": "precomputed"})
+    # Use this session's study information from the dashboard
+    context = current_study_context() or {}
+    if not all([context.get('class'), context.get('subjects'), context.get('study_topic')]):
         return jsonify({
             "status": "error",
             "message": "Please fill out the study information on the dashboard first"
         }), 400
+    try:
+        page_range = retrieval_filters.from_request(book_name, data) if rag else None
+    except RetrievalFilterError as e:
+        return jsonify({"status": "error", "message": str(e)}), e.status
     
-    # Generate flashcards using global variables
+    # Generate flashcards using the session's study information
     flashcards = generate_flashcards(
         embeddings=embeddings,
-        sample_query=global_study_topic,
-        class_name=f"Class {global_class}",
-        subjects=global_subjects,
+        sample_query=context['study_topic'],
+        class_name=f"Class {context['class']}",
+        subjects=context['subjects'],
         rag=rag,
-        book_name=book_name
+        book_name=book_name,
+        page_range=page_range
     )
     # print(flashcards)/
     return jsonify({
@@ -277,10 +609,15 @@ def query_book():
     
     if not book_name or not query:
         return jsonify({'status': 'error', 'message': 'Book name and query are required'}), 400
+    try:
+        # Optional "chapter" / "page_start" / "page_end" narrow the search before scoring
+        page_range = retrieval_filters.from_request(book_name, data)
+    except RetrievalFilterError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), e.status
     
     try:
         # Use the RAG query function
-        response_text = query_book_content(embeddings, book_name, query)
+        response_text = query_book_content(embeddings, book_name, query, page_range)
         print(f"Query received - Book: {book_name}, Query: {query}")
         print(f"Response: {response_text}")
         
@@ -295,17 +632,16 @@ def query_book():
             'message': f'Error processing query: {str(e)}'
         }), 500
 
+@app.route('/book_artifacts/<path:book_name>')
+def get_book_artifacts(book_name):
+    artifacts = book_artifacts.get_artifacts(secure_filename(book_name))
+    if artifacts is None:
+        return jsonify({'status': 'error', 'message': 'Book not found'}), 404
+    return jsonify(dict(artifacts, status='success'))
+
 def get_available_books():
-    books = []
-    for filename in os.listdir(app.config['BOOKS_FOLDER']):
-        file_path = os.path.join(app.config['BOOKS_FOLDER'], filename)
-        if os.path.isfile(file_path):
-            file_type = os.path.splitext(filename)[1][1:].upper()
-            books.append({
-                'name': filename,
-                'type': file_type
-            })
-    return books
+    # One indexed query against the catalog (see backend/book_catalog.py)
+    return book_catalog.list_books()
 
 @app.route('/download_slide_deck_pdf', methods=['POST'])
 def download_slide_deck_pdf():
@@ -315,8 +651,8 @@ def download_slide_deck_pdf():
             return jsonify({'error': 'No slide deck data provided'}), 400
             
         try:
-            # Generate PDF
-            pdf_data = create_pdf_from_slides(data)
+            # Generate PDF (cached by deck hash; misses render in the process pool)
+            pdf_data = render_pdf_offloaded(data)
             if not pdf_data:
                 return jsonify({'error': 'Failed to generate PDF - empty data'}), 500
                 
@@ -352,6 +688,33 @@ def download_slide_deck_pdf():
         traceback.print_exc()
         return jsonify({'error': f'Request processing failed: {str(e)}'}), 500
 
+@app.route('/download_slide_decks_zip', methods=['POST'])
+def download_slide_decks_zip():
+    # Batch export: renders every deck in the PDF process pool and streams
+    # the zip back entry by entry as renders finish.
+    data = request.get_json()
+    slide_decks = (data or {}).get('slide_decks')
+    if not isinstance(slide_decks, list) or not slide_decks:
+        return jsonify({'error': 'slide_decks must be a non-empty list of slide deck JSON objects'}), 400
+    if len(slide_decks) > BATCH_EXPORT_MAX_DECKS:
+        return jsonify({'error': f'At most {BATCH_EXPORT_MAX_DECKS} slide decks can be exported at once'}), 400
+    if not all(isinstance(deck, dict) and 'slide_deck' in deck for deck in slide_decks):
+        return jsonify({'error': 'Every entry must contain a slide_deck object'}), 400
+
+    return Response(
+        stream_with_context(stream_zip_of_pdfs(slide_decks)),
+        mimetype='application/zip',
+        headers={
+            'Content-Disposition': f'attachment; filename={batch_zip_filename()}',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+@app.route('/llm_json_stats')
+def llm_json_stats():
+    # Clean / repaired / failed parses and re-requested items per output schema
+    return jsonify(parse_stats())
+
 @app.route('/logout')
 def logout():
     return redirect(url_for('dashboard'))
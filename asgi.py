@@ -0,0 +1,289 @@
+# asgi.py
+#
+# Async entry point for high concurrency:
+#   gunicorn -c gunicorn.conf.py asgi:application     (WEB_WORKER_CLASS=uvicorn.workers.UvicornWorker)
+#   uvicorn asgi:application --port 5089
+# The LLM-bound routes (/generate_quiz, /grade_quiz, /query_book,
+# /generate_slide_deck, /generate_flashcards) are served natively on the
+# event loop: a request waiting on Groq is a suspended coroutine, not a
+# parked thread, so one worker holds thousands of generations in flight.
+# Retrieval, embeddings and SQLite run on backend/async_llm.py's bounded
+# pool. Every other route goes to the unchanged Flask app through
+# asgiref's WSGI adapter. Request and response bodies match the Flask routes.
+
+import json
+import time
+import asyncio
+from http.cookies import SimpleCookie
+
+# Same preload as the WSGI entry point (model, page cache, gc.freeze)
+from wsgi import app, embeddings  # noqa: E402
+from app import json_flag, start_background_workers
+from asgiref.wsgi import WsgiToAsgi
+
+from backend.quizes import generate_quiz_async, grade_quiz_async
+from backend.quiz_bank import get_or_generate_quiz_async
+from backend.flashcards import generate_flashcards_async
+from backend.slide_decks import generate_slide_deck_async, generate_slide_deck_parallel_async
+from backend.manage_books import query_book_content_async
+from backend.study_context import study_context_store
+from backend import book_artifacts, retrieval_filters
+from backend.retrieval_filters import RetrievalFilterError
+from backend.metrics import HTTP_REQUEST_SECONDS
+from backend.tracing import begin_trace, end_trace
+from backend.async_llm import close_http_client, run_blocking
+from backend.admission import async_admission, AdmissionRejected, client_key
+
+# ============= SETTINGS ============
+MAX_JSON_BODY_BYTES = 16 * 1024 * 1024   # quiz_data + answers of a large quiz fit comfortably
+# ==================================
+
+wsgi_fallback = WsgiToAsgi(app)
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, body):
+        super().__init__(str(body))
+        self.status = status
+        self.body = body
+
+
+# ----------------- Request helpers -----------------
+async def read_json(receive):
+    chunks, size = [], 0
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            raise asyncio.CancelledError()
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if size > MAX_JSON_BODY_BYTES:
+            raise HTTPError(413, {"error": "Request body too large"})
+        chunks.append(chunk)
+        if not message.get("more_body"):
+            break
+    try:
+        data = json.loads(b"".join(chunks) or b"null")
+    except ValueError:
+        raise HTTPError(400, {"error": "Request body must be JSON"})
+    if not isinstance(data, dict):
+        raise HTTPError(400, {"error": "Request body must be a JSON object"})
+    return data
+
+
+def header(scope, name: bytes):
+    return next((v.decode("latin-1") for k, v in scope["headers"] if k == name), None)
+
+
+def flask_session(scope):
+    """Decodes Flask's signed session cookie (the flashcards route needs the study context)."""
+    cookie_header = b"; ".join(v for k, v in scope["headers"] if k == b"cookie").decode("latin-1")
+    morsel = SimpleCookie(cookie_header).get(app.config["SESSION_COOKIE_NAME"])
+    serializer = app.session_interface.get_signing_serializer(app)
+    if morsel is None or serializer is None:
+        return {}
+    try:
+        return serializer.loads(morsel.value, max_age=int(app.permanent_session_lifetime.total_seconds()))
+    except Exception:
+        return {}
+
+
+# ----------------- Routes -----------------
+async def generate_quiz_route(data, scope):
+    prompt = data.get("prompt", "Generate a general knowledge quiz with 3 questions.")
+    num_questions = data.get("num_questions", 10)
+    difficulty = data.get("difficulty", "Medium")
+    mcq_percent = data.get("mcq_percent", 70)
+    use_bank = json_flag(data, "use_bank", True)
+    try:
+        if use_bank:
+            return 200, await get_or_generate_quiz_async(
+                generate_quiz_async,
+                prompt=prompt,
+                num_questions=num_questions,
+                difficulty=difficulty,
+                mcq_percent=mcq_percent,
+                embeddings=embeddings
+            )
+        return 200, await generate_quiz_async(
+            prompt=prompt,
+            num_questions=num_questions,
+            difficulty=difficulty,
+            mcq_percent=mcq_percent
+        )
+    except Exception as e:
+        return 500, {"error": str(e)}
+
+
+async def grade_quiz_route(data, scope):
+    quiz_data = data.get("quiz_data")
+    user_answers = data.get("user_answers")
+    if not quiz_data or not user_answers:
+        return 400, {"error": "Missing quiz data or user answers"}
+    try:
+        return 200, await grade_quiz_async(quiz_data, user_answers, embeddings, batch=json_flag(data, "batch_grading", True))
+    except Exception as e:
+        print(f"Grading Error: {str(e)}")
+        return 500, {"error": f"Failed to grade quiz: {str(e)}"}
+
+
+async def query_book_route(data, scope):
+    book_name = data.get('book_name')
+    query = data.get('query')
+    if not book_name or not query:
+        return 400, {'status': 'error', 'message': 'Book name and query are required'}
+    try:
+        page_range = await run_blocking(retrieval_filters.from_request, book_name, data)
+    except RetrievalFilterError as e:
+        return e.status, {'status': 'error', 'message': str(e)}
+    try:
+        response_text = await query_book_content_async(embeddings, book_name, query, page_range)
+        print(f"Query received - Book: {book_name}, Query: {query}")
+        return 200, {'status': 'success', 'response': response_text}
+    except Exception as e:
+        print(f"Error processing query: {str(e)}")
+        return 500, {'status': 'error', 'message': f'Error processing query: {str(e)}'}
+
+
+async def generate_slide_deck_route(data, scope):
+    prompt = data.get("prompt")
+    use_rag = json_flag(data, "use_rag", False)
+    book_name = data.get("book_name") if use_rag else None
+    if not prompt:
+        return 400, {"error": "Prompt is required"}
+    if use_rag and not book_name:
+        return 400, {"error": "book_name is required when use_rag is True"}
+    try:
+        page_range = await run_blocking(retrieval_filters.from_request, book_name, data)
+    except RetrievalFilterError as e:
+        return e.status, {"error": str(e)}
+    try:
+        if data.get("mode", "single") == "outline":
+            return 200, await generate_slide_deck_parallel_async(
+                embeddings, prompt, use_rag, book_name, data.get("num_slides"), page_range
+            )
+        return 200, await generate_slide_deck_async(embeddings, prompt, use_rag, book_name, page_range)
+    except Exception as e:
+        print(f"Error generating slide deck: {str(e)}")
+        return 500, {"error": str(e)}
+
+
+async def generate_flashcards_route(data, scope):
+    if data.get('use_default_deck') and data.get('book_name'):
+        deck = await run_blocking(book_artifacts.default_flashcards, data['book_name'])
+        if deck:
+            return 200, {"status": "success", "flashcards": deck, "source": "precomputed"}
+    session = flask_session(scope)
+    context = {}
+    if session.get('sid'):
+        context = await run_blocking(study_context_store.get, session['sid'], session.get('context_version')) or {}
+    if not all([context.get('class'), context.get('subjects'), context.get('study_topic')]):
+        return 400, {
+            "status": "error",
+            "message": "Please fill out the study information on the dashboard first"
+        }
+    rag = json_flag(data, 'use_rag', False)
+    try:
+        page_range = await run_blocking(retrieval_filters.from_request, data.get('book_name'), data) if rag else None
+    except RetrievalFilterError as e:
+        return e.status, {"status": "error", "message": str(e)}
+    flashcards = await generate_flashcards_async(
+        embeddings=embeddings,
+        sample_query=context['study_topic'],
+        class_name=f"Class {context['class']}",
+        subjects=context['subjects'],
+        rag=rag,
+        book_name=data.get('book_name'),
+        page_range=page_range
+    )
+    return 200, {"status": "success", "flashcards": flashcards}
+
+
+ASYNC_ROUTES = {
+    "/generate_quiz": generate_quiz_route,
+    "/grade_quiz": grade_quiz_route,
+    "/query_book": query_book_route,
+    "/generate_slide_deck": generate_slide_deck_route,
+    "/generate_flashcards": generate_flashcards_route,
+}
+
+
+# ----------------- ASGI application -----------------
+async def send_json(send, status: int, body, headers=()):
+    payload = json.dumps(body).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(payload)).encode()), *headers],
+    })
+    await send({"type": "http.response.body", "body": payload})
+
+
+async def cancel_on_disconnect(receive, task: asyncio.Task):
+    # The LLM calls of a request whose client went away are abandoned, not finished
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            task.cancel()
+            return
+
+
+async def serve_async_route(handler, scope, receive, send):
+    route = scope["path"]
+    started = time.perf_counter()
+    trace = begin_trace(route, method="POST")
+    status, error, ticket = 500, None, None
+    try:
+        # Waits for capacity or is refused before the body is even read (backend/admission.py)
+        client = client_key((scope.get("client") or ("unknown",))[0], header(scope, b"x-forwarded-for"))
+        ticket = await async_admission.acquire_async(route, client)
+        data = await read_json(receive)
+        work = asyncio.ensure_future(handler(data, scope))
+        watcher = asyncio.ensure_future(cancel_on_disconnect(receive, work))
+        try:
+            status, body = await work
+        finally:
+            watcher.cancel()
+        await send_json(send, status, body)
+    except AdmissionRejected as e:
+        status = e.status
+        await send_json(send, status, {"error": str(e)}, [(b"retry-after", str(e.retry_after).encode())])
+    except HTTPError as e:
+        status = e.status
+        await send_json(send, status, e.body)
+    except asyncio.CancelledError:
+        status, error = 499, "client disconnected"
+        raise
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        await send_json(send, 500, {"error": str(e)})
+    finally:
+        if ticket is not None:
+            async_admission.release(ticket)
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, route=route, method="POST", status=status)
+        if trace:
+            trace[0].set(status=status)
+        end_trace(trace, error=error)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            # Runs in each worker after the fork, unlike the module import
+            start_background_workers()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await close_http_client()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await lifespan(receive, send)
+    if scope["type"] == "http" and scope["method"] == "POST":
+        handler = ASYNC_ROUTES.get(scope["path"])
+        if handler is not None:
+            return await serve_async_route(handler, scope, receive, send)
+    return await wsgi_fallback(scope, receive, send)
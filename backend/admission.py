@@ -0,0 +1,272 @@
+# backend/admission.py
+#
+# Admission control for the expensive routes. Each route has a cost weight
+# (roughly how many concurrent LLM calls / CPU it takes); a worker runs at
+# most ADMISSION_CAPACITY cost units at once and queues the rest in arrival
+# order, per route up to ADMISSION_MAX_QUEUE requests and for at most
+# ADMISSION_QUEUE_TIMEOUT seconds. A client may have ADMISSION_PER_CLIENT
+# expensive requests running or queued. Anything over those limits is
+# answered immediately: 429 for a client over its limit, 503 when the queue
+# is full or the wait runs out, both with Retry-After. Routes without a cost
+# (/list_books, pages, static files) never wait here.
+#
+# Under gthread a queued request still occupies a worker thread, so the
+# threaded controller also keeps ADMISSION_RESERVED_THREADS of WEB_THREADS
+# out of reach of expensive routes; cheap routes always find a free thread.
+
+import os
+import math
+import time
+import asyncio
+import threading
+from collections import deque
+from typing import Any, Dict, Optional
+
+from backend.metrics import registry
+
+# ============= SETTINGS ============
+# Cost units per request; routes not listed are not admission-controlled
+ROUTE_COSTS = {
+    "/generate_slide_deck": 4,
+    "/upload_and_index_book": 4,
+    "/generate_flashcards": 3,
+    "/generate_quiz": 2,
+    "/generate_quiz_stream": 2,
+    "/download_slide_decks_zip": 2,
+    "/grade_quiz": 1,
+    "/query_book": 1,
+}
+WEB_THREADS = int(os.getenv("WEB_THREADS", "8"))
+ADMISSION_RESERVED_THREADS = int(os.getenv("ADMISSION_RESERVED_THREADS", "2"))
+ADMISSION_CAPACITY = int(os.getenv("ADMISSION_CAPACITY", str(max(1, WEB_THREADS - ADMISSION_RESERVED_THREADS))))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "16"))          # waiting requests per route
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "10"))  # seconds a request may wait
+ADMISSION_PER_CLIENT = int(os.getenv("ADMISSION_PER_CLIENT", "4"))          # running + queued per client
+# The async routes in asgi.py hold no thread while they wait
+ASYNC_ADMISSION_CAPACITY = int(os.getenv("ASYNC_ADMISSION_CAPACITY", "2000"))
+ASYNC_ADMISSION_MAX_QUEUE = int(os.getenv("ASYNC_ADMISSION_MAX_QUEUE", "1000"))
+# Use the first X-Forwarded-For address as the client (only behind a trusted proxy)
+ADMISSION_TRUST_PROXY = os.getenv("ADMISSION_TRUST_PROXY") == "1"
+RETRY_AFTER_MAX_SECONDS = 60
+# ==================================
+
+ADMISSION_DECISIONS = registry.counter(
+    "learnly_admission_decisions_total",
+    "Admission outcomes for expensive routes (admitted / queued / rejected_client / rejected_queue / timed_out)",
+    ("route", "outcome"),
+)
+ADMISSION_WAIT_SECONDS = registry.histogram(
+    "learnly_admission_wait_seconds",
+    "Time an admitted request waited in the admission queue",
+    ("route",),
+)
+
+
+class AdmissionRejected(Exception):
+    """Request refused without running; `status` is 429 or 503, `retry_after` is in seconds."""
+
+    def __init__(self, message: str, status: int, retry_after: int):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+class Ticket:
+    __slots__ = ("route", "client", "cost", "enqueued_at", "started_at", "granted", "_wake")
+
+    def __init__(self, route: str, client: str, cost: int, wake):
+        self.route = route
+        self.client = client
+        self.cost = cost
+        self.enqueued_at = time.monotonic()
+        self.started_at = None
+        self.granted = False
+        self._wake = wake
+
+
+class AdmissionController:
+    """
+    Cost-weighted admission with one FIFO queue across routes, so a cheap
+    request that arrived later never overtakes an expensive one forever.
+    Waiters can be threads (acquire) or coroutines (acquire_async).
+    """
+
+    def __init__(
+        self,
+        capacity: int,
+        max_queue: int = ADMISSION_MAX_QUEUE,
+        queue_timeout: float = ADMISSION_QUEUE_TIMEOUT,
+        per_client: int = ADMISSION_PER_CLIENT,
+        max_blocked: Optional[int] = None,
+        costs: Optional[Dict[str, int]] = None,
+    ):
+        self.capacity = capacity
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.per_client = per_client
+        self.max_blocked = max_blocked      # cap on running + queued requests (threads), if any
+        self.costs = dict(ROUTE_COSTS if costs is None else costs)
+        self._lock = threading.Lock()
+        self._waiting: "deque[Ticket]" = deque()
+        self._queued_per_route: Dict[str, int] = {}
+        self._per_client: Dict[str, int] = {}
+        self._in_use = 0
+        self._running = 0
+        self._service_seconds: Dict[str, float] = {}   # moving average per route, for Retry-After
+        self._stats = {'admitted': 0, 'queued': 0, 'rejected_client': 0, 'rejected_queue': 0, 'timed_out': 0}
+
+    def cost_of(self, route: str) -> Optional[int]:
+        return self.costs.get(route)
+
+    # ----------------- Decisions (under self._lock) -----------------
+    def _retry_after(self, route: str) -> int:
+        service = self._service_seconds.get(route, 5.0)
+        cost = self.costs.get(route, 1)
+        slots = max(1, self.capacity // max(1, cost))
+        waves = (len(self._waiting) + 1) / slots
+        return max(1, min(RETRY_AFTER_MAX_SECONDS, math.ceil(service * waves)))
+
+    def _reject(self, route: str, outcome: str, status: int, message: str):
+        self._stats[outcome] += 1
+        ADMISSION_DECISIONS.inc(route=route, outcome=outcome)
+        raise AdmissionRejected(message, status, self._retry_after(route))
+
+    def _fits(self, cost: int) -> bool:
+        # A request costlier than the whole capacity still runs, alone
+        return self._in_use + cost <= self.capacity or self._in_use == 0
+
+    def _grant(self, ticket: Ticket):
+        ticket.granted = True
+        ticket.started_at = time.monotonic()
+        self._in_use += ticket.cost
+        self._running += 1
+        self._stats['admitted'] += 1
+        ADMISSION_DECISIONS.inc(route=ticket.route, outcome="admitted")
+
+    def _enter(self, route: str, client: str, wake) -> Ticket:
+        cost = self.costs[route]
+        if self._per_client.get(client, 0) >= self.per_client:
+            self._reject(route, 'rejected_client', 429,
+                         f"Too many requests in progress for this client (limit {self.per_client})")
+        must_wait = bool(self._waiting) or not self._fits(cost)
+        if (self.max_blocked is not None and self._running + len(self._waiting) >= self.max_blocked) or (
+            must_wait and self._queued_per_route.get(route, 0) >= self.max_queue
+        ):
+            self._reject(route, 'rejected_queue', 503, "The server is busy, please retry shortly")
+
+        ticket = Ticket(route, client, cost, wake)
+        self._per_client[client] = self._per_client.get(client, 0) + 1
+        if not must_wait:
+            self._grant(ticket)
+        else:
+            self._waiting.append(ticket)
+            self._queued_per_route[route] = self._queued_per_route.get(route, 0) + 1
+            self._stats['queued'] += 1
+            ADMISSION_DECISIONS.inc(route=route, outcome="queued")
+        return ticket
+
+    def _dispatch(self):
+        while self._waiting and self._fits(self._waiting[0].cost):
+            ticket = self._waiting.popleft()
+            self._queued_per_route[ticket.route] -= 1
+            self._grant(ticket)
+            ticket._wake()
+
+    def _leave_client(self, client: str):
+        remaining = self._per_client.get(client, 1) - 1
+        if remaining:
+            self._per_client[client] = remaining
+        else:
+            self._per_client.pop(client, None)
+
+    def _abandon(self, ticket: Ticket) -> bool:
+        """Drops a ticket that stopped waiting. Returns False if it was granted meanwhile."""
+        if ticket.granted:
+            return False
+        self._waiting.remove(ticket)
+        self._queued_per_route[ticket.route] -= 1
+        self._leave_client(ticket.client)
+        return True
+
+    # ----------------- API -----------------
+    def acquire(self, route: str, client: str) -> Ticket:
+        """Blocks until the request may run. Raises AdmissionRejected."""
+        event = threading.Event()
+        with self._lock:
+            ticket = self._enter(route, client, event.set)
+        if not ticket.granted:
+            event.wait(self.queue_timeout)
+            with self._lock:
+                if self._abandon(ticket):
+                    self._stats['timed_out'] += 1
+                    ADMISSION_DECISIONS.inc(route=route, outcome="timed_out")
+                    raise AdmissionRejected("Timed out waiting for capacity, please retry shortly", 503, self._retry_after(route))
+        ADMISSION_WAIT_SECONDS.observe(time.monotonic() - ticket.enqueued_at, route=route)
+        return ticket
+
+    async def acquire_async(self, route: str, client: str) -> Ticket:
+        """acquire for coroutines; waiting suspends the coroutine, not a thread."""
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(lambda: granted.done() or granted.set_result(True))
+
+        with self._lock:
+            ticket = self._enter(route, client, wake)
+        if not ticket.granted:
+            try:
+                await asyncio.wait_for(granted, self.queue_timeout)
+            except asyncio.TimeoutError:
+                with self._lock:
+                    if self._abandon(ticket):
+                        self._stats['timed_out'] += 1
+                        ADMISSION_DECISIONS.inc(route=route, outcome="timed_out")
+                        raise AdmissionRejected("Timed out waiting for capacity, please retry shortly", 503, self._retry_after(route))
+                # Granted just as the wait ran out: go ahead
+            except BaseException:
+                # Cancelled (client went away); if capacity was granted meanwhile, hand it back
+                with self._lock:
+                    abandoned = self._abandon(ticket)
+                if not abandoned:
+                    self.release(ticket)
+                raise
+        ADMISSION_WAIT_SECONDS.observe(time.monotonic() - ticket.enqueued_at, route=route)
+        return ticket
+
+    def release(self, ticket: Ticket):
+        with self._lock:
+            self._in_use -= ticket.cost
+            self._running -= 1
+            self._leave_client(ticket.client)
+            elapsed = time.monotonic() - ticket.started_at
+            previous = self._service_seconds.get(ticket.route)
+            self._service_seconds[ticket.route] = elapsed if previous is None else 0.8 * previous + 0.2 * elapsed
+            self._dispatch()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(
+                self._stats,
+                capacity=self.capacity,
+                in_use=self._in_use,
+                running=self._running,
+                waiting=len(self._waiting),
+                waiting_by_route={route: n for route, n in self._queued_per_route.items() if n},
+                avg_seconds_by_route={route: round(s, 2) for route, s in self._service_seconds.items()},
+            )
+
+
+def client_key(remote_addr: Optional[str], forwarded_for: Optional[str] = None) -> str:
+    if ADMISSION_TRUST_PROXY and forwarded_for:
+        return forwarded_for.split(",")[0].strip()
+    return remote_addr or "unknown"
+
+
+# Threaded routes (Flask under gthread, or the WSGI fallback in asgi.py)
+admission = AdmissionController(
+    ADMISSION_CAPACITY,
+    max_blocked=max(1, WEB_THREADS - ADMISSION_RESERVED_THREADS),
+)
+# Routes served on the event loop by asgi.py
+async_admission = AdmissionController(ASYNC_ADMISSION_CAPACITY, max_queue=ASYNC_ADMISSION_MAX_QUEUE)
@@ -0,0 +1,75 @@
+# backend/async_llm.py
+#
+# Building blocks for the async (ASGI) serving path, see asgi.py. LLM calls
+# are awaited on one shared HTTP connection pool per worker, so a request
+# waiting on Groq costs a coroutine rather than a thread; the blocking parts
+# (Chroma retrieval, MiniLM embeddings, SQLite, local grading, PDF
+# rendering) go to a bounded thread pool instead of stalling the event loop.
+#   ASYNC_LLM_MAX_CONNECTIONS   concurrent upstream connections per worker (default 1000)
+#   ASYNC_BLOCKING_THREADS      threads for blocking work per worker (default 32)
+
+import os
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Iterable, List, Optional
+
+from backend.tracing import bind_context
+
+# ============= SETTINGS ============
+ASYNC_LLM_MAX_CONNECTIONS = int(os.getenv("ASYNC_LLM_MAX_CONNECTIONS", "1000"))
+ASYNC_BLOCKING_THREADS = int(os.getenv("ASYNC_BLOCKING_THREADS", "32"))
+LLM_CONNECT_TIMEOUT = 10
+LLM_DEFAULT_TIMEOUT = 120
+# ==================================
+
+_client = None
+_client_loop = None
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def http_client():
+    """The worker's shared httpx.AsyncClient (created on first use, bound to the running loop)."""
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _client_loop is not loop:
+        import httpx
+        _client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=ASYNC_LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=min(ASYNC_LLM_MAX_CONNECTIONS, 100),
+            ),
+            timeout=httpx.Timeout(LLM_DEFAULT_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+        )
+        _client_loop = loop
+    return _client
+
+
+async def close_http_client():
+    global _client, _client_loop
+    if _client is not None:
+        await _client.aclose()
+    _client, _client_loop = None, None
+
+
+def _blocking_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=ASYNC_BLOCKING_THREADS, thread_name_prefix="async-blocking")
+    return _executor
+
+
+async def run_blocking(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """Runs fn(*args, **kwargs) on the blocking pool; trace spans stay under the caller's span."""
+    call = bind_context(functools.partial(fn, *args, **kwargs))
+    return await asyncio.get_running_loop().run_in_executor(_blocking_executor(), call)
+
+
+async def gather_limited(factories: Iterable[Callable[[], Awaitable[Any]]], limit: int) -> List[Any]:
+    """Awaits the coroutines made by `factories` with at most `limit` running at once, in order."""
+    semaphore = asyncio.Semaphore(max(1, limit))
+
+    async def run(factory):
+        async with semaphore:
+            return await factory()
+    return await asyncio.gather(*(run(f) for f in factories))
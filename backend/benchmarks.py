@@ -0,0 +1,380 @@
+# backend/benchmarks.py
+#
+# Benchmark suite for the core pipelines with regression checks.
+#   python -m backend.benchmarks                      run everything, write bench_results.json
+#   python -m backend.benchmarks --only pdf_render,grade_quiz
+#   python -m backend.benchmarks --save-baseline      store the results as the baseline
+#   python -m backend.benchmarks --check              exit 1 if a tracked metric regressed
+# Benchmarks whose dependencies or inputs are missing (no books/, no model)
+# are reported as skipped rather than failing the run. Baselines are only
+# comparable on the same machine; store one per CI runner type.
+
+import os
+import sys
+import json
+import time
+import glob
+import random
+import shutil
+import platform
+import argparse
+import tempfile
+import statistics
+from typing import Any, Callable, Dict, List
+
+# ============= SETTINGS ============
+BOOKS_FOLDER = "./books"
+INDEX_FOLDER = "./chroma_index"
+RESULTS_PATH = "bench_results.json"
+BASELINE_PATH = os.path.join("benchmarks", "baseline.json")
+RETRIEVAL_CORPUS_SIZES = (500, 2000, 8000)
+RETRIEVAL_QUERIES = 50
+EMBEDDING_BATCH = 256
+STUB_LLM_LATENCY = 0.05          # seconds per stubbed grading call
+GRADE_QUIZ_QUESTIONS = 40
+
+# metric -> (direction, allowed relative regression)
+TRACKED_METRICS = {
+    "pdf_extraction.pages_per_sec": ("higher", 0.25),
+    "chunking.chunks_per_sec": ("higher", 0.25),
+    "embedding.texts_per_sec": ("higher", 0.20),
+    "embedding.query_ms": ("lower", 0.30),
+    "index_open.mean_ms": ("lower", 0.50),
+    "retrieval.p50_ms@500": ("lower", 0.30),
+    "retrieval.p50_ms@2000": ("lower", 0.30),
+    "retrieval.p50_ms@8000": ("lower", 0.30),
+    "pdf_render.pages_per_sec@50": ("higher", 0.20),
+    "pdf_render.pages_per_sec@200": ("higher", 0.20),
+    "grade_quiz.seconds": ("lower", 0.25),
+    "grade_quiz.llm_calls": ("lower", 0.0),
+}
+# Metrics named after something other than the benchmark that reports them
+METRIC_OWNERS = {"chunking": "pdf_extraction"}
+# ==================================
+
+
+class SkipBenchmark(Exception):
+    """Raised when a benchmark's inputs or optional dependencies are unavailable."""
+
+
+def _require(module: str):
+    try:
+        __import__(module)
+    except ImportError as e:
+        raise SkipBenchmark(f"{module} is not installed ({e})")
+
+
+_embeddings = None
+
+
+def _get_embeddings():
+    global _embeddings
+    if _embeddings is None:
+        _require("langchain_huggingface")
+        from backend.lazy_loading import create_embeddings
+        _embeddings = create_embeddings("eager")
+    return _embeddings
+
+
+def _sample_texts(n: int, seed: int = 7) -> List[str]:
+    rng = random.Random(seed)
+    words = ("cell membrane energy photosynthesis instance cloud pricing storage network "
+             "algebra equation vector matrix protein enzyme history empire trade river "
+             "volcano climate economy market graph theorem proof").split()
+    return [" ".join(rng.choice(words) for _ in range(60)) for _ in range(n)]
+
+
+# ----------------- Benchmarks -----------------
+def bench_pdf_extraction() -> Dict[str, Any]:
+    """PyPDFLoader extraction and 100-token chunking on the PDFs in books/, as the indexer does."""
+    _require("langchain_community")
+    _require("langchain_text_splitters")
+    pdfs = sorted(glob.glob(os.path.join(BOOKS_FOLDER, "*.pdf")))
+    if not pdfs:
+        raise SkipBenchmark(f"no PDFs in {BOOKS_FOLDER}")
+    from rag_com.indexer import load_book
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+    splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(chunk_size=100, chunk_overlap=20)
+
+    pages = chunks = 0
+    extract_seconds = split_seconds = 0.0
+    for path in pdfs:
+        start = time.perf_counter()
+        docs = load_book(path)
+        extract_seconds += time.perf_counter() - start
+        start = time.perf_counter()
+        chunks += len(splitter.split_documents(docs))
+        split_seconds += time.perf_counter() - start
+        pages += len(docs)
+    return {
+        'books': len(pdfs),
+        'pages': pages,
+        'chunks': chunks,
+        'pdf_extraction.pages_per_sec': round(pages / extract_seconds, 1) if extract_seconds else None,
+        'chunking.chunks_per_sec': round(chunks / split_seconds, 1) if split_seconds else None,
+    }
+
+
+def bench_embedding() -> Dict[str, Any]:
+    """MiniLM throughput for document batches and single-query latency."""
+    embeddings = _get_embeddings()
+    texts = _sample_texts(EMBEDDING_BATCH * 4)
+    embeddings.embed_documents(texts[:16])  # warm-up
+    start = time.perf_counter()
+    for i in range(0, len(texts), EMBEDDING_BATCH):
+        embeddings.embed_documents(texts[i:i + EMBEDDING_BATCH])
+    elapsed = time.perf_counter() - start
+
+    query_times = []
+    for text in texts[:50]:
+        start = time.perf_counter()
+        embeddings.embed_query(text[:80])
+        query_times.append(time.perf_counter() - start)
+    return {
+        'texts': len(texts),
+        'embedding.texts_per_sec': round(len(texts) / elapsed, 1),
+        'embedding.query_ms': round(statistics.median(query_times) * 1000, 2),
+    }
+
+
+def bench_index_open() -> Dict[str, Any]:
+    """Time to open each existing book index and run its first query (cold Chroma client)."""
+    _require("langchain_community")
+    books = sorted(d for d in os.listdir(INDEX_FOLDER) if os.path.isdir(os.path.join(INDEX_FOLDER, d))) \
+        if os.path.isdir(INDEX_FOLDER) else []
+    if not books:
+        raise SkipBenchmark(f"no indexes in {INDEX_FOLDER}")
+    from backend.manage_books import load_index
+    embeddings = _get_embeddings()
+    timings = {}
+    for book in books:
+        start = time.perf_counter()
+        db = load_index(book, embeddings)
+        db.similarity_search("introduction", k=1)
+        timings[book] = round((time.perf_counter() - start) * 1000, 1)
+    return {'per_book_ms': timings, 'index_open.mean_ms': round(statistics.mean(timings.values()), 1)}
+
+
+def bench_retrieval() -> Dict[str, Any]:
+    """Top-k similarity_search latency (pre-embedded queries) as the corpus grows."""
+    _require("langchain_community")
+    from langchain_community.vectorstores import Chroma
+    embeddings = _get_embeddings()
+    corpus = _sample_texts(max(RETRIEVAL_CORPUS_SIZES))
+    vectors = embeddings.embed_documents(corpus)
+    queries = [embeddings.embed_query(q[:80]) for q in _sample_texts(RETRIEVAL_QUERIES, seed=11)]
+
+    results = {}
+    for size in RETRIEVAL_CORPUS_SIZES:
+        workdir = tempfile.mkdtemp(prefix="bench_chroma_")
+        try:
+            db = Chroma(persist_directory=workdir, embedding_function=embeddings)
+            for i in range(0, size, 1000):
+                db._collection.add(
+                    ids=[str(j) for j in range(i, min(i + 1000, size))],
+                    embeddings=vectors[i:min(i + 1000, size)],
+                    documents=corpus[i:min(i + 1000, size)],
+                )
+            timings = []
+            for vector in queries:
+                start = time.perf_counter()
+                db.similarity_search_by_vector(vector, k=8)
+                timings.append(time.perf_counter() - start)
+            timings.sort()
+            results[f'retrieval.p50_ms@{size}'] = round(timings[len(timings) // 2] * 1000, 2)
+            results[f'retrieval.p95_ms@{size}'] = round(timings[int(len(timings) * 0.95)] * 1000, 2)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def bench_pdf_render() -> Dict[str, Any]:
+    """create_pdf_from_slides uncached render speed (see backend.slide_pdf.benchmark)."""
+    _require("reportlab")
+    from backend.slide_pdf import benchmark
+    results = {}
+    for row in benchmark(sizes=(10, 50, 200), repeats=3):
+        results[f"pdf_render.pages_per_sec@{row['slides']}"] = row['pages_per_sec']
+        results[f"pdf_render.cached_ms@{row['slides']}"] = round(row['cached_seconds'] * 1000, 3)
+    return results
+
+
+def bench_grade_quiz() -> Dict[str, Any]:
+    """
+    grade_quiz end to end with the Groq call replaced by a fixed-latency stub,
+    so local grading, the verdict cache, batching and scheduling are measured
+    without the network. The verdict cache uses a throwaway database.
+    """
+    _require("requests")
+    from backend import quizes
+    from backend.grading_cache import VerdictCache
+
+    calls = []
+
+    def stub_post_groq(payload, pipeline, timeout=None):
+        calls.append(pipeline)
+        time.sleep(STUB_LLM_LATENCY)
+        content = payload["messages"][1]["content"]
+        if pipeline == "grading_batch":
+            items = json.loads(content.split(":", 1)[1])
+            body = {"results": [{"id": it["id"], "is_correct": True, "llm_explanation": "stub"} for it in items]}
+        else:
+            body = {"is_correct": True, "llm_explanation": "stub"}
+        return {"choices": [{"message": {"content": json.dumps(body)}}], "usage": {}}
+
+    # A realistic mix: MCQs, exact and numeric matches, and free-text answers
+    # with repeats that the verdict cache should absorb.
+    questions, answers = [], {}
+    for i in range(GRADE_QUIZ_QUESTIONS):
+        q_id = f"q{i + 1}"
+        kind = i % 4
+        if kind == 0:
+            questions.append({'id': q_id, 'type': 'mcq', 'question': f'Pick {i}', 'options': ['a', 'b'], 'correct_answer': 'a', 'explanation': ''})
+            answers[f'answer-{q_id}'] = 'a'
+        elif kind == 1:
+            questions.append({'id': q_id, 'type': 'short_answer', 'question': f'Value of {i}?', 'correct_answer': str(i * 3), 'explanation': ''})
+            answers[f'answer-{q_id}'] = str(i * 3)
+        else:
+            questions.append({'id': q_id, 'type': 'short_answer', 'question': 'Explain what the mitochondria does',
+                              'correct_answer': 'It produces energy for the cell through respiration', 'explanation': ''})
+            answers[f'answer-{q_id}'] = f'student phrasing number {i % 6} about power'
+
+    workdir = tempfile.mkdtemp(prefix="bench_grading_")
+    original_post, original_cache = quizes._post_groq, quizes.verdict_cache
+    quizes._post_groq = stub_post_groq
+    quizes.verdict_cache = VerdictCache(db_path=os.path.join(workdir, "bench.db"))
+    try:
+        start = time.perf_counter()
+        result = quizes.grade_quiz({'quiz': {'questions': questions}}, answers, embeddings=None, batch=True)
+        elapsed = time.perf_counter() - start
+    finally:
+        quizes._post_groq, quizes.verdict_cache = original_post, original_cache
+        shutil.rmtree(workdir, ignore_errors=True)
+    return {
+        'questions': len(questions),
+        'graded_by': result['grading_stats']['graded_by'],
+        'grade_quiz.seconds': round(elapsed, 3),
+        'grade_quiz.llm_calls': len(calls),
+    }
+
+
+BENCHMARKS: Dict[str, Callable[[], Dict[str, Any]]] = {
+    'pdf_extraction': bench_pdf_extraction,
+    'embedding': bench_embedding,
+    'index_open': bench_index_open,
+    'retrieval': bench_retrieval,
+    'pdf_render': bench_pdf_render,
+    'grade_quiz': bench_grade_quiz,
+}
+
+
+# ----------------- Running and comparing -----------------
+def run(names: List[str] = None) -> Dict[str, Any]:
+    results: Dict[str, Any] = {}
+    metrics: Dict[str, float] = {}
+    for name in names or list(BENCHMARKS):
+        start = time.perf_counter()
+        try:
+            output = BENCHMARKS[name]()
+        except SkipBenchmark as e:
+            results[name] = {'skipped': str(e)}
+            print(f"[skip] {name}: {e}")
+            continue
+        except Exception as e:
+            results[name] = {'error': f"{type(e).__name__}: {e}"}
+            print(f"[fail] {name}: {type(e).__name__}: {e}")
+            continue
+        output['wall_seconds'] = round(time.perf_counter() - start, 2)
+        results[name] = output
+        metrics.update({k: v for k, v in output.items() if k in TRACKED_METRICS and v is not None})
+        print(f"[ok]   {name} ({output['wall_seconds']}s)")
+    return {
+        'created_at': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'machine': {'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count()},
+        'results': results,
+        'metrics': metrics,
+    }
+
+
+def benchmark_of(metric: str) -> str:
+    prefix = metric.split(".", 1)[0]
+    return METRIC_OWNERS.get(prefix, prefix)
+
+
+def compare(current: Dict[str, float], baseline: Dict[str, float], ran: List[str] = None) -> List[Dict[str, Any]]:
+    """
+    One row per tracked metric in the baseline; 'regressed' rows fail --check.
+    A baseline metric whose benchmark was run (`ran`, default all) but did not
+    report it (error, skip) is a 'missing' row, which also fails --check.
+    """
+    ran = set(ran or BENCHMARKS)
+    rows = []
+    for metric, (direction, allowed) in TRACKED_METRICS.items():
+        if metric not in baseline or not baseline[metric]:
+            continue
+        if metric not in current:
+            if benchmark_of(metric) in ran:
+                rows.append({'metric': metric, 'baseline': baseline[metric], 'current': None,
+                             'change_pct': None, 'allowed_pct': round(allowed * 100, 1),
+                             'regressed': True, 'missing': True})
+            continue
+        old, new = baseline[metric], current[metric]
+        change = (new - old) / old
+        worse = -change if direction == "higher" else change
+        rows.append({
+            'metric': metric,
+            'baseline': old,
+            'current': new,
+            'change_pct': round(change * 100, 1),
+            'allowed_pct': round(allowed * 100, 1),
+            'regressed': worse > allowed,
+            'missing': False,
+        })
+    return rows
+
+
+# Run standalone: python -m backend.benchmarks --help
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the core pipelines")
+    parser.add_argument("--only", help="comma-separated subset of: " + ", ".join(BENCHMARKS))
+    parser.add_argument("--output", default=RESULTS_PATH)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the baseline")
+    parser.add_argument("--check", action="store_true", help="exit 1 if a tracked metric regressed beyond its threshold")
+    args = parser.parse_args()
+
+    names = [n.strip() for n in args.only.split(",")] if args.only else None
+    unknown = [n for n in names or [] if n not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmark(s): {', '.join(unknown)}")
+
+    report = run(names)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline) or ".", exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        sys.exit(0)
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --save-baseline first")
+        sys.exit(1 if args.check else 0)
+
+    with open(args.baseline) as f:
+        baseline = json.load(f).get('metrics', {})
+    rows = compare(report['metrics'], baseline, names)
+    for row in rows:
+        if row['missing']:
+            print(f"{row['metric']:<34} {row['baseline']:>10} -> {'-':>10}  MISSING (benchmark failed or was skipped)")
+            continue
+        flag = "REGRESSED" if row['regressed'] else "ok"
+        print(f"{row['metric']:<34} {row['baseline']:>10} -> {row['current']:>10}  {row['change_pct']:>+7.1f}%  (allowed {row['allowed_pct']}%)  {flag}")
+    failed = [name for name, result in report['results'].items() if 'error' in result]
+    if failed:
+        print(f"Benchmarks that errored: {', '.join(failed)}")
+    if args.check and (failed or any(row['regressed'] for row in rows)):
+        sys.exit(1)
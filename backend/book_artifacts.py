@@ -0,0 +1,445 @@
+# backend/book_artifacts.py
+#
+# Per-book artifacts computed once after a book is indexed, so later
+# requests read them instead of recomputing:
+#   chapters    chapter / section map with page ranges (backend/chapters.py)
+#   centroids   mean MiniLM vector of each chapter's chunks, read from the index
+#   summaries   a 2-3 sentence summary per chapter (one LLM call each)
+#   flashcards  a default flashcard deck for the whole book
+# They are stored in books.db keyed by the book's SHA-256, so another upload
+# of the same content (or a re-index) reuses them. /query_book adds the
+# summary of the chapter nearest to the question to its context, and
+# /generate_flashcards serves the default deck without any LLM call.
+
+import os
+import sys
+import json
+import math
+import argparse
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from backend import book_catalog, index_versions
+from backend.chapters import chapter_map, chapter_for_page
+from backend.database import query_one, query_all, execute, upsert
+from backend.llm_json import extract_json, LLMJSONError
+from backend.metrics import stage, invoke_llm, record_cache
+from backend.tracing import bind_context
+
+# ============= SETTINGS ============
+BOOKS_FOLDER = "./books"
+INDEX_FOLDER = "./chroma_index"
+GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+LLM_MODEL = "gemma2-9b-it"
+SCHEMA_VERSION = 1                 # bump when an artifact's shape or prompt changes
+KINDS = ("chapters", "centroids", "summaries", "flashcards")
+PRECOMPUTE_ON_INDEX = os.getenv("PRECOMPUTE_BOOK_ARTIFACTS", "1") == "1"
+SUMMARY_WORKERS = 4                # concurrent chapter-summary calls per book
+SUMMARY_INPUT_CHARS = 6000         # chapter text sent per summary call
+DEFAULT_DECK_SIZE = 10
+CENTROID_BATCH = 2000              # vectors read from the index per batch
+MEMORY_CACHE_SIZE = 256            # (book, kind) payloads kept in process
+# ==================================
+
+
+# ----------------- Storage -----------------
+_cache: "OrderedDict[tuple, Any]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _store(sha256: str, kind: str, payload: Any):
+    upsert('book_artifacts', ('sha256', 'kind', 'schema_version', 'payload'),
+           [(sha256, kind, SCHEMA_VERSION, json.dumps(payload))], ('sha256', 'kind'))
+    with _cache_lock:
+        _cache.pop((sha256, kind), None)
+
+
+def _load(sha256: str, kind: str) -> Optional[Any]:
+    with _cache_lock:
+        if (sha256, kind) in _cache:
+            _cache.move_to_end((sha256, kind))
+            record_cache("book_artifacts", hit=True)
+            return _cache[(sha256, kind)]
+    record_cache("book_artifacts", hit=False)
+    row = query_one('SELECT payload FROM book_artifacts WHERE sha256 = ? AND kind = ? AND schema_version = ?',
+                    (sha256, kind, SCHEMA_VERSION))
+    if row is None:
+        return None
+    payload = json.loads(row[0])
+    with _cache_lock:
+        _cache[(sha256, kind)] = payload
+        while len(_cache) > MEMORY_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return payload
+
+
+def _catalog_book(book_name: str) -> Optional[Dict[str, Any]]:
+    """Catalog row for a name as the UI sends it ("ec2.pdf" or "ec2")."""
+    book = book_catalog.get_book(book_name)
+    if book is None and not book_name.lower().endswith(".pdf"):
+        book = book_catalog.get_book(f"{book_name}.pdf")
+    return book
+
+
+def load(book_name: str, kind: str) -> Optional[Any]:
+    book = _catalog_book(book_name)
+    if book is None or not book['sha256']:
+        return None
+    return _load(book['sha256'], kind)
+
+
+# ----------------- Computation -----------------
+def _chapter_texts(chapters: List[Dict[str, Any]], pages: Dict[int, str]) -> List[str]:
+    return [
+        "\n".join(pages.get(p, "") for p in range(c["start_page"], c["end_page"] + 1)).strip()
+        for c in chapters
+    ]
+
+
+def compute_centroids(index_name: str, chapters: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Mean (normalized) embedding of every chapter's chunks, from the stored index vectors."""
+    import chromadb
+
+    sums: Dict[int, List[float]] = {}
+    counts: Dict[int, int] = {}
+    lease = index_versions.acquire(index_name, INDEX_FOLDER)
+    try:
+        client = chromadb.PersistentClient(path=lease.path)
+        for collection in client.list_collections():
+            if isinstance(collection, str):   # chromadb >= 0.6 returns names
+                collection = client.get_collection(collection)
+            total = collection.count()
+            for offset in range(0, total, CENTROID_BATCH):
+                batch = collection.get(limit=CENTROID_BATCH, offset=offset, include=["embeddings", "metadatas"])
+                for vector, metadata in zip(batch['embeddings'], batch['metadatas']):
+                    # PyPDFLoader pages are 0-based
+                    chapter = chapter_for_page(chapters, int((metadata or {}).get('page', 0)) + 1)
+                    if chapter is None:
+                        continue
+                    acc = sums.get(chapter["index"])
+                    sums[chapter["index"]] = list(vector) if acc is None else [a + b for a, b in zip(acc, vector)]
+                    counts[chapter["index"]] = counts.get(chapter["index"], 0) + 1
+    finally:
+        lease.release()
+
+    centroids = []
+    for index, total in sorted(sums.items()):
+        norm = math.sqrt(sum(v * v for v in total)) or 1.0
+        centroids.append({"index": index, "chunks": counts[index], "centroid": [round(v / norm, 6) for v in total]})
+    return {"chapters": centroids}
+
+
+def _summarize_chapter(llm, book_title: str, chapter: Dict[str, Any], text: str) -> Optional[Dict[str, Any]]:
+    """The chapter's summary entry, or None when the LLM call failed or returned nothing."""
+    prompt = f"""
+    You are summarizing one chapter of the book "{book_title}" for a student.
+    Chapter: {chapter['title']} (pages {chapter['start_page']}-{chapter['end_page']})
+
+    Chapter text (may be cut off):
+    {text[:SUMMARY_INPUT_CHARS]}
+
+    Write a 2-3 sentence summary of what the chapter covers. Return only the summary.
+    """
+    try:
+        message = invoke_llm(llm, prompt, "book_artifacts")
+        summary = (message.content if hasattr(message, "content") else str(message)).strip()
+    except Exception as e:
+        print(f"Summary of '{chapter['title']}' failed: {e}")
+        return None
+    if not summary:
+        print(f"Summary of '{chapter['title']}' came back empty")
+        return None
+    return {"index": chapter["index"], "title": chapter["title"], "summary": summary}
+
+
+def _failed_summaries(payload: Dict[str, Any]) -> List[int]:
+    # Older payloads stored a failed call as an empty summary
+    return sorted(set(payload.get("failed", [])) | {s["index"] for s in payload["chapters"] if not s.get("summary")})
+
+
+def compute_summaries(llm, book_title: str, chapters: List[Dict[str, Any]], pages: Dict[int, str],
+                      previous: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Summaries of the chapters that have text. Failed calls are listed under
+    "failed" instead of being stored, so the next precompute retries them;
+    with `previous`, only its failed chapters are summarized again.
+    """
+    texts = _chapter_texts(chapters, pages)
+    work = [(c, t) for c, t in zip(chapters, texts) if t]
+    kept: List[Dict[str, Any]] = []
+    if previous is not None:
+        retry = set(_failed_summaries(previous))
+        kept = [s for s in previous["chapters"] if s.get("summary") and s["index"] not in retry]
+        work = [(c, t) for c, t in work if c["index"] in retry]
+    if not work:
+        return {"chapters": kept, "failed": []}
+    with ThreadPoolExecutor(max_workers=min(SUMMARY_WORKERS, len(work))) as executor:
+        summaries = list(executor.map(
+            bind_context(lambda item: _summarize_chapter(llm, book_title, *item)), work
+        ))
+    failed = [c["index"] for (c, _), s in zip(work, summaries) if s is None]
+    done = sorted(kept + [s for s in summaries if s is not None], key=lambda s: s["index"])
+    return {"chapters": done, "failed": failed}
+
+
+def compute_default_deck(llm, book_title: str, summaries: List[Dict[str, Any]]) -> Dict[str, Any]:
+    outline = "\n".join(f"- {s['title']}: {s['summary']}" for s in summaries if s.get("summary"))
+    prompt = f"""
+    You are a teacher. Write exactly {DEFAULT_DECK_SIZE} flashcards that cover the key ideas of the book "{book_title}",
+    spread across its chapters. Chapter summaries:
+    {outline}
+
+    Only return a JSON array in this format:
+    [
+      {{"question": "Short question?", "answer": "One-line answer", "chapter": "Chapter title"}}
+    ]
+    """
+    value, _ = extract_json(invoke_llm(llm, prompt, "book_artifacts"), expect="array", schema="default_deck")
+    cards = [
+        {"question": c["question"].strip(), "answer": str(c.get("answer", "")).strip(), "chapter": c.get("chapter")}
+        for c in value
+        if isinstance(c, dict) and isinstance(c.get("question"), str) and c["question"].strip() and c.get("answer")
+    ]
+    return {"flashcards": cards[:DEFAULT_DECK_SIZE]}
+
+
+def _load_pages(pdf_path: str) -> Dict[int, str]:
+    from rag_com.indexer import load_book
+    return {int(d.metadata.get('page', i)) + 1: d.page_content for i, d in enumerate(load_book(pdf_path))}
+
+
+def precompute(book_name: str, pages: Optional[Dict[int, str]] = None, force: bool = False) -> Dict[str, str]:
+    """
+    Computes the artifacts a book is missing (all of them with force=True).
+    `pages` maps 1-based page numbers to text; the indexer passes the pages
+    it already extracted, otherwise the PDF is read again.
+    Summaries whose LLM call failed are retried on the next run.
+    Returns {kind: "computed" | "retried" | "reused" | "skipped: reason"}.
+    """
+    book = _catalog_book(book_name)
+    if book is None or not book['sha256']:
+        raise FileNotFoundError(f"'{book_name}' is not in the book catalog")
+    sha256, name = book['sha256'], book['name']
+    pdf_path = os.path.join(BOOKS_FOLDER, name)
+    result: Dict[str, str] = {}
+
+    def missing(kind: str) -> bool:
+        if not force and _load(sha256, kind) is not None:
+            result[kind] = "reused"
+            return False
+        return True
+
+    stored_summaries = _load(sha256, "summaries")
+    retry_summaries = bool(stored_summaries and _failed_summaries(stored_summaries))
+    if pages is None and (force or retry_summaries or any(_load(sha256, k) is None for k in ("chapters", "summaries"))):
+        pages = _load_pages(pdf_path)
+    page_count = max(pages) if pages else (book['page_count'] or 0)
+
+    if missing("chapters"):
+        with stage("book_artifacts", "chapters", book=name):
+            _store(sha256, "chapters", chapter_map(pdf_path, page_count, pages))
+        result["chapters"] = "computed"
+    chapters = _load(sha256, "chapters")["chapters"]
+
+    if missing("centroids"):
+        try:
+            with stage("book_artifacts", "centroids", book=name):
+                _store(sha256, "centroids", compute_centroids(book_catalog.index_dir_name(name), chapters))
+            result["centroids"] = "computed"
+        except (ImportError, FileNotFoundError) as e:
+            result["centroids"] = f"skipped: {e}"
+
+    if not GROQ_API_KEY:
+        for kind in ("summaries", "flashcards"):
+            result.setdefault(kind, "skipped: GROQ_API_KEY is not set")
+        return result
+    from langchain_groq import ChatGroq
+    llm = ChatGroq(model=LLM_MODEL, groq_api_key=GROQ_API_KEY)
+    book_title = os.path.splitext(name)[0]
+
+    if missing("summaries") or retry_summaries:
+        previous = stored_summaries if retry_summaries and not force else None
+        with stage("book_artifacts", "summaries", book=name, chapters=len(chapters)):
+            summaries = compute_summaries(llm, book_title, chapters, pages or {}, previous)
+            _store(sha256, "summaries", summaries)
+        result["summaries"] = ("retried" if previous else "computed") + \
+            (f", {len(summaries['failed'])} failed" if summaries["failed"] else "")
+
+    summarized = [s for s in _load(sha256, "summaries")["chapters"] if s.get("summary")]
+    if not summarized:
+        result.setdefault("flashcards", "skipped: no chapter summaries")
+    elif missing("flashcards"):
+        try:
+            with stage("book_artifacts", "flashcards", book=name):
+                deck = compute_default_deck(llm, book_title, summarized)
+            if deck["flashcards"]:
+                _store(sha256, "flashcards", deck)
+                result["flashcards"] = "computed"
+            else:
+                result["flashcards"] = "skipped: no valid flashcards returned"
+        except (LLMJSONError, ValueError) as e:
+            result["flashcards"] = f"skipped: {e}"
+    return result
+
+
+def store_chapter_map(book_name: str, chapters: Dict[str, Any]):
+    """Saves the map the indexer tagged the chunks with, replacing any older one."""
+    book = _catalog_book(book_name)
+    if book is None or not book['sha256']:
+        return
+    previous = _load(book['sha256'], "chapters")
+    if previous is not None and previous["chapters"] != chapters["chapters"]:
+        # Centroids and summaries are per chapter index; recompute them for the new map
+        execute("DELETE FROM book_artifacts WHERE sha256 = ? AND kind IN ('centroids', 'summaries')", (book['sha256'],))
+        with _cache_lock:
+            _cache.pop((book['sha256'], "centroids"), None)
+            _cache.pop((book['sha256'], "summaries"), None)
+    _store(book['sha256'], "chapters", chapters)
+
+
+def chapters_for(book_name: str) -> Optional[List[Dict[str, Any]]]:
+    """The book's chapters, computing and storing the map on first use; None for an unknown book."""
+    book = _catalog_book(book_name)
+    if book is None:
+        return None
+    if book['sha256']:
+        stored = _load(book['sha256'], "chapters")
+        if stored is not None:
+            return stored["chapters"]
+    pdf_path = os.path.join(BOOKS_FOLDER, book['name'])
+    pages = _load_pages(pdf_path)
+    computed = chapter_map(pdf_path, max(pages) if pages else (book['page_count'] or 0), pages)
+    if book['sha256']:
+        _store(book['sha256'], "chapters", computed)
+    return computed["chapters"]
+
+
+# ----------------- Background runs after indexing -----------------
+_running = set()
+_running_lock = threading.Lock()
+
+
+def schedule(book_name: str, pages: Optional[Dict[int, str]] = None) -> bool:
+    """Starts precompute() on a background thread unless one is running for this book."""
+    if not PRECOMPUTE_ON_INDEX:
+        return False
+    with _running_lock:
+        if book_name in _running:
+            return False
+        _running.add(book_name)
+
+    def run():
+        try:
+            result = precompute(book_name, pages)
+            print(f"Artifacts for '{book_name}': {result}")
+        except Exception as e:
+            print(f"Precomputing artifacts for '{book_name}' failed: {e}")
+        finally:
+            with _running_lock:
+                _running.discard(book_name)
+
+    threading.Thread(target=run, name=f"book-artifacts-{book_name}", daemon=True).start()
+    return True
+
+
+# ----------------- Reads used by request paths -----------------
+def get_artifacts(book_name: str) -> Optional[Dict[str, Any]]:
+    """Chapters, summaries and default deck of a book (centroids are internal)."""
+    book = _catalog_book(book_name)
+    if book is None:
+        return None
+    sha256 = book['sha256']
+    payloads = {kind: _load(sha256, kind) if sha256 else None for kind in KINDS}
+    with _running_lock:
+        in_progress = book['name'] in _running or book_name in _running
+    return {
+        'book': book['name'],
+        'state': 'computing' if in_progress else ('ready' if all(payloads.values()) else 'partial'),
+        'available': [kind for kind, payload in payloads.items() if payload is not None],
+        'chapters': (payloads['chapters'] or {}).get('chapters'),
+        'chapter_source': (payloads['chapters'] or {}).get('source'),
+        'summaries': (payloads['summaries'] or {}).get('chapters'),
+        'flashcards': (payloads['flashcards'] or {}).get('flashcards'),
+    }
+
+
+def default_flashcards(book_name: str) -> Optional[List[Dict[str, Any]]]:
+    deck = load(book_name, "flashcards")
+    return deck["flashcards"] if deck else None
+
+
+def nearest_chapter(book_name: str, query_vector: List[float], page_start: int = 1,
+                    page_end: Optional[int] = None) -> Optional[Dict[str, Any]]:
+    """
+    The chapter whose centroid is closest to the query, with its summary if
+    there is one. Only chapters overlapping page_start..page_end are considered.
+    """
+    centroids = load(book_name, "centroids")
+    if not centroids or not centroids["chapters"]:
+        return None
+    chapters = (load(book_name, "chapters") or {}).get("chapters") or []
+    in_range = {
+        c["index"] for c in chapters
+        if c["end_page"] >= page_start and (page_end is None or c["start_page"] <= page_end)
+    }
+    candidates = [c for c in centroids["chapters"] if c["index"] in in_range]
+    if not candidates:
+        return None
+    norm = math.sqrt(sum(v * v for v in query_vector)) or 1.0
+    best = max(candidates, key=lambda c: sum(a * b for a, b in zip(c["centroid"], query_vector)))
+    similarity = sum(a * b for a, b in zip(best["centroid"], query_vector)) / norm
+
+    summaries = {s["index"]: s["summary"] for s in (load(book_name, "summaries") or {}).get("chapters", [])}
+    chapter = next((c for c in chapters if c["index"] == best["index"]), {})
+    return {
+        "index": best["index"],
+        "title": chapter.get("title"),
+        "start_page": chapter.get("start_page"),
+        "end_page": chapter.get("end_page"),
+        "summary": summaries.get(best["index"]),
+        "similarity": round(similarity, 4),
+    }
+
+
+def prune_orphaned() -> int:
+    """Deletes artifacts whose content is no longer in the catalog."""
+    deleted = execute('DELETE FROM book_artifacts WHERE sha256 NOT IN '
+                      '(SELECT sha256 FROM books WHERE sha256 IS NOT NULL)').rowcount
+    if deleted:
+        with _cache_lock:
+            _cache.clear()
+    return deleted
+
+
+# Run standalone: python -m backend.book_artifacts build|show --book NAME [--force]
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute or inspect per-book artifacts")
+    parser.add_argument("command", choices=["build", "show", "prune"])
+    parser.add_argument("--book", help="catalog name, e.g. ec2.pdf (build: default all indexed books)")
+    parser.add_argument("--force", action="store_true", help="build: recompute artifacts that already exist")
+    args = parser.parse_args()
+
+    if args.command == "prune":
+        print(json.dumps({'deleted': prune_orphaned()}))
+    elif args.command == "show":
+        if not args.book:
+            parser.error("show needs --book")
+        artifacts = get_artifacts(args.book)
+        if artifacts is None:
+            sys.exit(f"'{args.book}' is not in the book catalog")
+        print(json.dumps(artifacts, indent=2))
+    else:
+        names = [args.book] if args.book else [
+            b['name'] for b in book_catalog.list_books() if b['index_status'] == 'indexed'
+        ]
+        failed = False
+        for name in names:
+            try:
+                print(json.dumps({'book': name, 'result': precompute(name, force=args.force)}))
+            except Exception as e:
+                failed = True
+                print(json.dumps({'book': name, 'error': str(e)}))
+        if failed:
+            sys.exit(1)
@@ -0,0 +1,172 @@
+# backend/book_catalog.py
+#
+# The book catalog lives in the books table of books.db instead of being
+# rebuilt from os.listdir(books/) on every request. Upload, indexing and
+# delete keep it current; a version counter bumped in the same transaction
+# as every change backs the ETag on /list_books.
+
+import os
+import hashlib
+from typing import Optional, Dict, Any, List
+
+from backend.database import transaction, query_one, query_all
+
+# ============= SETTINGS ============
+HASH_CHUNK_BYTES = 1024 * 1024
+INDEX_STATUSES = ("pending", "indexing", "indexed", "failed")
+# ==================================
+
+
+def _bump_version(conn):
+    conn.execute("UPDATE catalog_meta SET value = value + 1 WHERE key = 'version'")
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def index_dir_name(name: str) -> str:
+    """Folder under chroma_index/ that holds the index for a catalog name."""
+    return os.path.splitext(name)[0].replace(" ", "_")
+
+
+def _row_to_book(row) -> Dict[str, Any]:
+    return {
+        'id': row[0],
+        'name': row[1],
+        'type': row[2],
+        'size_bytes': row[3],
+        'sha256': row[4],
+        'page_count': row[5],
+        'chunk_count': row[6],
+        'index_status': row[7],
+        'indexed_at': row[8],
+        'upload_date': row[9],
+    }
+
+
+_BOOK_COLUMNS = ('id, name, file_type, size_bytes, sha256, page_count, chunk_count, '
+                 'index_status, indexed_at, upload_date')
+
+
+# ----------------- Writes -----------------
+def register_book(file_path: str, sha256: Optional[str] = None, index_status: str = "pending") -> Dict[str, Any]:
+    """Adds or refreshes the catalog row for a file that was just written to books/."""
+    name = os.path.basename(file_path)
+    # Hash before taking the write lock; large books take a while
+    sha256 = sha256 or file_sha256(file_path)
+    with transaction() as conn:
+        conn.execute('''
+            INSERT INTO books (title, file_path, name, file_type, size_bytes, sha256, index_status, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT(name) DO UPDATE SET
+                file_path = excluded.file_path,
+                file_type = excluded.file_type,
+                size_bytes = excluded.size_bytes,
+                sha256 = excluded.sha256,
+                index_status = excluded.index_status,
+                page_count = NULL,
+                chunk_count = NULL,
+                index_error = NULL,
+                indexed_at = NULL,
+                upload_date = CURRENT_TIMESTAMP,
+                updated_at = CURRENT_TIMESTAMP
+        ''', (
+            os.path.splitext(name)[0], file_path, name,
+            os.path.splitext(name)[1][1:].upper(),
+            os.path.getsize(file_path),
+            sha256,
+            index_status,
+        ))
+        _bump_version(conn)
+    return get_book(name)
+
+
+def _set_index_state(name: str, status: str, page_count=None, chunk_count=None, error=None):
+    with transaction() as conn:
+        conn.execute('''
+            UPDATE books SET
+                index_status = ?,
+                page_count = COALESCE(?, page_count),
+                chunk_count = COALESCE(?, chunk_count),
+                index_error = ?,
+                indexed_at = CASE WHEN ? = 'indexed' THEN CURRENT_TIMESTAMP ELSE indexed_at END,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE name = ?
+        ''', (status, page_count, chunk_count, error, status, name))
+        _bump_version(conn)
+
+
+def mark_indexing(name: str):
+    _set_index_state(name, "indexing")
+
+
+def mark_indexed(name: str, page_count: int, chunk_count: int):
+    _set_index_state(name, "indexed", page_count, chunk_count)
+
+
+def mark_index_failed(name: str, error: str):
+    _set_index_state(name, "failed", error=error)
+
+
+def remove_book(name: str) -> bool:
+    with transaction() as conn:
+        deleted = conn.execute('DELETE FROM books WHERE name = ?', (name,)).rowcount
+        if deleted:
+            _bump_version(conn)
+    return bool(deleted)
+
+
+def sync_with_folder(books_folder: str, index_folder: str) -> Dict[str, int]:
+    """
+    One-off reconciliation at startup: registers files that predate the
+    catalog (marking them indexed if an index folder exists) and drops rows
+    whose file is gone. Files already in the catalog are not re-hashed.
+    """
+    on_disk = {
+        name for name in os.listdir(books_folder)
+        if os.path.isfile(os.path.join(books_folder, name))
+    }
+    catalogued = {book['name'] for book in list_books()}
+
+    added = 0
+    for name in sorted(on_disk - catalogued):
+        has_index = os.path.isdir(os.path.join(index_folder, index_dir_name(name)))
+        register_book(os.path.join(books_folder, name), index_status="indexed" if has_index else "pending")
+        added += 1
+
+    removed = sum(1 for name in catalogued - on_disk if remove_book(name))
+    return {'added': added, 'removed': removed}
+
+
+# ----------------- Reads -----------------
+def catalog_version() -> int:
+    row = query_one("SELECT value FROM catalog_meta WHERE key = 'version'")
+    return row[0] if row else 0
+
+
+def catalog_etag() -> str:
+    return f'books-{catalog_version()}'
+
+
+def list_books() -> List[Dict[str, Any]]:
+    rows = query_all(f'SELECT {_BOOK_COLUMNS} FROM books WHERE name IS NOT NULL ORDER BY name')
+    return [_row_to_book(row) for row in rows]
+
+
+def get_book(name: str) -> Optional[Dict[str, Any]]:
+    row = query_one(f'SELECT {_BOOK_COLUMNS} FROM books WHERE name = ?', (name,))
+    return _row_to_book(row) if row else None
+
+
+def find_indexed_by_sha256(sha256: str) -> Optional[Dict[str, Any]]:
+    """An already indexed book with exactly this content, if any."""
+    row = query_one(
+        f"SELECT {_BOOK_COLUMNS} FROM books WHERE sha256 = ? AND index_status = 'indexed' ORDER BY id LIMIT 1",
+        (sha256,)
+    )
+    return _row_to_book(row) if row else None
@@ -0,0 +1,207 @@
+# backend/chapters.py
+#
+# Chapter / section map of a book. The PDF outline (bookmarks) is used
+# when the book has one: top-level entries become chapters, the next level
+# their sections. Without an outline, "Chapter 3" / "Unit IV" style headings
+# at the top of pages mark the chapters and "3.1 ..." headings their
+# sections; "Part 2" headings group the chapters after them. Books with
+# neither are split into fixed page windows so every book still has a
+# map. Pages are 1-based and ranges inclusive; PyPDFLoader's `page`
+# chunk metadata is 0-based.
+
+import re
+import bisect
+from typing import Any, Dict, List, Optional
+
+# ============= SETTINGS ============
+SECTION_PAGES = 10          # pages per section when the book has no outline
+HEADING_SCAN_LINES = 4      # only the first lines of a page can hold its chapter heading
+HEADING_MAX_CHARS = 80
+MIN_HEADING_CHAPTERS = 2    # fewer detected headings than this is treated as noise
+# ==================================
+
+CHAPTER_HEADING = re.compile(
+    r"^(chapter|chap\.|unit|lesson|part)\s+([0-9]{1,3}|[ivxlc]{1,7}|one|two|three|four|five|six|seven|eight|nine|ten)\b[\s.:\-\u2013\u2014]*(.*)$",
+    re.IGNORECASE,
+)
+PART_KEYWORDS = ("part",)   # headings a level above chapters
+SECTION_HEADING = re.compile(r"^([0-9]{1,3})\.([0-9]{1,3})\.?\s+([A-Za-z].*)$")
+
+
+def _outline_entries(pdf_path: str) -> List[Dict[str, Any]]:
+    """(level, title, start_page) for every outline entry that points at a page."""
+    from pypdf import PdfReader
+    reader = PdfReader(pdf_path)
+    try:
+        outline = reader.outline
+    except Exception as e:
+        print(f"Could not read the outline of {pdf_path}: {e}")
+        return []
+
+    entries: List[Dict[str, Any]] = []
+
+    def walk(items, level: int):
+        for item in items:
+            if isinstance(item, list):
+                # A nested list holds the children of the entry before it
+                walk(item, level + 1)
+                continue
+            try:
+                page = reader.get_destination_page_number(item)
+            except Exception:
+                continue
+            title = str(getattr(item, "title", "") or "").strip()
+            if page is None or page < 0 or not title:
+                continue
+            entries.append({"level": level, "title": title, "start_page": page + 1})
+    walk(outline, 0)
+    return entries
+
+
+def _close_ranges(chapters: List[Dict[str, Any]], page_count: int) -> List[Dict[str, Any]]:
+    chapters.sort(key=lambda c: c["start_page"])
+    for i, chapter in enumerate(chapters):
+        following = chapters[i + 1]["start_page"] - 1 if i + 1 < len(chapters) else page_count
+        chapter["end_page"] = max(chapter["start_page"], following)
+        chapter["index"] = i
+    return chapters
+
+
+def outline_chapters(pdf_path: str, page_count: int) -> List[Dict[str, Any]]:
+    entries = _outline_entries(pdf_path)
+    top = min((e["level"] for e in entries), default=0)
+    chapters: List[Dict[str, Any]] = []
+    for entry in entries:
+        if entry["level"] == top:
+            chapters.append({"title": entry["title"], "start_page": entry["start_page"], "sections": []})
+        elif entry["level"] == top + 1 and chapters:
+            chapters[-1]["sections"].append({"title": entry["title"], "start_page": entry["start_page"]})
+    # Front matter before the first chapter becomes its own entry
+    if chapters and min(c["start_page"] for c in chapters) > 1:
+        chapters.append({"title": "Front matter", "start_page": 1, "sections": []})
+    return _close_ranges(chapters, page_count)
+
+
+_WORD_NUMBERS = {w: i + 1 for i, w in enumerate(
+    ("one", "two", "three", "four", "five", "six", "seven", "eight", "nine", "ten"))}
+_ROMAN = {"i": 1, "v": 5, "x": 10, "l": 50, "c": 100}
+
+
+def _chapter_number(token: str) -> str:
+    """"3", "III" and "three" all become "3", so section numbers can be matched to them."""
+    token = token.lower()
+    if token.isdigit():
+        return str(int(token))
+    if token in _WORD_NUMBERS:
+        return str(_WORD_NUMBERS[token])
+    value = 0
+    for i, ch in enumerate(token):
+        digit = _ROMAN[ch]
+        value += -digit if i + 1 < len(token) and _ROMAN[token[i + 1]] > digit else digit
+    return str(value)
+
+
+def _top_lines(text: str) -> List[str]:
+    return [line.strip() for line in (text or "").splitlines() if line.strip()][:HEADING_SCAN_LINES]
+
+
+def heading_chapters(pages: Dict[int, str], page_count: int) -> List[Dict[str, Any]]:
+    """
+    Chapters from headings at the top of pages; [] when too few are found.
+    "Part" headings are a level above chapters: a part's opening pages get
+    their own entry and the chapters after it carry the part's title.
+    """
+    chapters: List[Dict[str, Any]] = []
+    current: Dict[bool, Optional[tuple]] = {True: None, False: None}   # is_part -> (keyword, number)
+    part_title = None
+    for page in sorted(pages):
+        lines = _top_lines(pages[page])
+        # A contents page lists many chapters at once; it starts none of them
+        if sum(1 for line in (pages[page] or "").splitlines() if CHAPTER_HEADING.match(line.strip())) > 2:
+            continue
+        for i, line in enumerate(lines):
+            if len(line) > HEADING_MAX_CHARS:
+                continue
+            match = CHAPTER_HEADING.match(line)
+            if match:
+                keyword = match.group(1).lower()
+                keyword = "chapter" if keyword == "chap." else keyword
+                number = _chapter_number(match.group(2))
+                is_part = keyword in PART_KEYWORDS
+                # Running headers repeat the part / chapter heading on every page
+                if current[is_part] == (keyword, number):
+                    continue
+                current[is_part] = (keyword, number)
+                title = line
+                if (not match.group(3).strip() and i + 1 < len(lines) and len(lines[i + 1]) <= HEADING_MAX_CHARS
+                        and not CHAPTER_HEADING.match(lines[i + 1])):
+                    title = f"{line}: {lines[i + 1]}"
+                if is_part:
+                    # Chapter numbers may restart in a new part; its first chapter can open on the same page
+                    current[False] = None
+                    part_title = title
+                    chapters.append({"title": title, "start_page": page, "sections": [], "_number": None})
+                    continue
+                if chapters and chapters[-1]["_number"] is None and chapters[-1]["start_page"] == page:
+                    # The part has no pages of its own before this chapter
+                    chapters.pop()
+                entry = {"title": title, "start_page": page, "sections": [], "_number": number}
+                if part_title:
+                    entry["part"] = part_title
+                chapters.append(entry)
+                break
+            section = SECTION_HEADING.match(line)
+            if section and chapters and str(int(section.group(1))) == chapters[-1]["_number"]:
+                if not any(s["title"] == line for s in chapters[-1]["sections"]):
+                    chapters[-1]["sections"].append({"title": line, "start_page": page})
+                break
+    if len(chapters) < MIN_HEADING_CHAPTERS:
+        return []
+    for chapter in chapters:
+        del chapter["_number"]
+    if chapters[0]["start_page"] > 1:
+        chapters.append({"title": "Front matter", "start_page": 1, "sections": []})
+    return _close_ranges(chapters, page_count)
+
+
+def page_window_chapters(page_count: int, window: int = SECTION_PAGES) -> List[Dict[str, Any]]:
+    chapters = [
+        {"title": f"Pages {start}-{min(start + window - 1, page_count)}", "start_page": start, "sections": []}
+        for start in range(1, page_count + 1, window)
+    ]
+    return _close_ranges(chapters, page_count)
+
+
+def chapter_map(pdf_path: str, page_count: int, pages: Optional[Dict[int, str]] = None) -> Dict[str, Any]:
+    """
+    {"source": "outline" | "headings" | "pages", "page_count": n,
+     "chapters": [{index, title, start_page, end_page, sections}]}
+    `pages` (1-based page number -> text) enables the heading heuristics.
+    """
+    chapters = []
+    source = "pages"
+    try:
+        chapters = outline_chapters(pdf_path, page_count)
+        source = "outline"
+    except ImportError:
+        pass
+    except Exception as e:
+        # A malformed outline falls back to the headings / page windows
+        print(f"Could not build chapters from the outline of {pdf_path}: {e}")
+    if not chapters and pages:
+        chapters = heading_chapters(pages, page_count)
+        source = "headings"
+    if not chapters:
+        chapters = page_window_chapters(page_count)
+        source = "pages"
+    return {"source": source, "page_count": page_count, "chapters": chapters}
+
+
+def chapter_for_page(chapters: List[Dict[str, Any]], page: int) -> Optional[Dict[str, Any]]:
+    """The chapter containing a 1-based page, or None."""
+    starts = [c["start_page"] for c in chapters]
+    i = bisect.bisect_right(starts, page) - 1
+    if i < 0 or page > chapters[i]["end_page"]:
+        return None
+    return chapters[i]
+
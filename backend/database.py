@@ -1,46 +1,289 @@
+import os
 import sqlite3
+import threading
 from pathlib import Path
+from contextlib import contextmanager
 
 DB_PATH = Path(__file__).parent.parent / 'books.db'
 
+# ============= SETTINGS ============
+BUSY_TIMEOUT_MS = 10000
+STATEMENT_CACHE_SIZE = 256    # prepared statements kept per connection
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",         # readers no longer block behind writers
+    "PRAGMA synchronous = NORMAL",       # safe with WAL, one fsync per checkpoint instead of per commit
+    f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}",
+    "PRAGMA foreign_keys = ON",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -16000",        # ~16MB page cache per connection
+    "PRAGMA mmap_size = 268435456",      # 256MB memory-mapped reads
+)
+# ==================================
+
+# ----------------- Schema migrations -----------------
+# Applied in order; PRAGMA user_version records the last one that ran.
+# Append new entries, never edit old ones. An entry is SQL or a callable(conn).
+
+def _add_book_catalog_columns(conn):
+    # Databases created before the catalog may already have some of these
+    # (they used to be added lazily), so only add what is missing.
+    columns = {
+        'name': 'TEXT',
+        'file_type': 'TEXT',
+        'size_bytes': 'INTEGER',
+        'sha256': 'TEXT',
+        'page_count': 'INTEGER',
+        'chunk_count': 'INTEGER',
+        'index_status': "TEXT NOT NULL DEFAULT 'pending'",
+        'index_error': 'TEXT',
+        'indexed_at': 'TIMESTAMP',
+        'updated_at': 'TIMESTAMP',
+    }
+    existing = {row[1] for row in conn.execute('PRAGMA table_info(books)')}
+    for column, ddl in columns.items():
+        if column not in existing:
+            conn.execute(f'ALTER TABLE books ADD COLUMN {column} {ddl}')
+    conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_books_name ON books(name)')
+    conn.execute('CREATE TABLE IF NOT EXISTS catalog_meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+    conn.execute("INSERT OR IGNORE INTO catalog_meta (key, value) VALUES ('version', 0)")
+
+
+MIGRATIONS = [
+    # 1: books table
+    '''
+    CREATE TABLE IF NOT EXISTS books (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        title TEXT NOT NULL,
+        file_path TEXT NOT NULL,
+        upload_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    ''',
+    # 2: cached short-answer grading verdicts (see backend/grading_cache.py)
+    '''
+    CREATE TABLE IF NOT EXISTS grading_verdicts (
+        cache_key TEXT PRIMARY KEY,
+        is_correct INTEGER NOT NULL,
+        llm_explanation TEXT NOT NULL,
+        hits INTEGER NOT NULL DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    ''',
+    # 3: quiz question bank (see backend/quiz_bank.py)
+    '''
+    CREATE TABLE IF NOT EXISTS quiz_questions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        topic TEXT NOT NULL,
+        topic_norm TEXT NOT NULL,
+        difficulty TEXT NOT NULL,
+        question_type TEXT NOT NULL,
+        question_hash TEXT NOT NULL UNIQUE,
+        question_json TEXT NOT NULL,
+        times_served INTEGER NOT NULL DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE INDEX IF NOT EXISTS idx_quiz_questions_lookup
+        ON quiz_questions (topic_norm, difficulty, question_type, times_served);
+    CREATE TABLE IF NOT EXISTS quiz_topics (
+        topic_norm TEXT PRIMARY KEY,
+        topic TEXT NOT NULL,
+        embedding TEXT,
+        request_count INTEGER NOT NULL DEFAULT 0,
+        last_requested TIMESTAMP
+    );
+    ''',
+    # 4: per-session dashboard inputs (see backend/study_context.py)
+    '''
+    CREATE TABLE IF NOT EXISTS study_contexts (
+        session_id TEXT PRIMARY KEY,
+        class_name TEXT,
+        subjects TEXT NOT NULL DEFAULT '[]',
+        study_topic TEXT,
+        version INTEGER NOT NULL,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    ''',
+    # 5: book catalog columns (see backend/book_catalog.py)
+    _add_book_catalog_columns,
+    # 6: resumable uploads in progress (see backend/uploads.py), dedup lookups by hash
+    '''
+    CREATE TABLE IF NOT EXISTS uploads (
+        upload_id TEXT PRIMARY KEY,
+        filename TEXT NOT NULL,
+        size_bytes INTEGER NOT NULL,
+        expected_sha256 TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE INDEX IF NOT EXISTS idx_books_sha256 ON books(sha256);
+    ''',
+    # 7: per-book artifacts computed after indexing, keyed by content hash (see backend/book_artifacts.py)
+    '''
+    CREATE TABLE IF NOT EXISTS book_artifacts (
+        sha256 TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        schema_version INTEGER NOT NULL,
+        payload TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (sha256, kind)
+    );
+    ''',
+    # 8: verdict cache keys no longer strip punctuation, and missing-key
+    #    failures were cached as wrong answers; start the cache afresh
+    'DELETE FROM grading_verdicts',
+]
+
+
+def migrate(conn) -> int:
+    """Brings the schema up to date. Returns the resulting schema version."""
+    current = conn.execute('PRAGMA user_version').fetchone()[0]
+    for version, step in enumerate(MIGRATIONS[current:], start=current + 1):
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # Another process may have migrated while we waited for the lock
+            if conn.execute('PRAGMA user_version').fetchone()[0] >= version:
+                conn.execute('ROLLBACK')
+                continue
+            if callable(step):
+                step(conn)
+            else:
+                for statement in step.split(';'):
+                    if statement.strip():
+                        conn.execute(statement)
+            conn.execute(f'PRAGMA user_version = {version}')
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+    return len(MIGRATIONS)
+
+
+# ----------------- Connection pool -----------------
+# One connection per (thread, database), reused for the life of the thread.
+# Connections run in autocommit mode; use transaction() to group writes.
+_local = threading.local()
+_migrated = set()
+_migrate_lock = threading.Lock()
+_pool_stats = {'opened': 0}
+
+
+def _open(db_path) -> sqlite3.Connection:
+    conn = sqlite3.connect(
+        db_path,
+        timeout=BUSY_TIMEOUT_MS / 1000,
+        isolation_level=None,
+        check_same_thread=False,
+        cached_statements=STATEMENT_CACHE_SIZE,
+    )
+    for pragma in SQLITE_PRAGMAS:
+        conn.execute(pragma)
+    with _migrate_lock:
+        if db_path not in _migrated:
+            migrate(conn)
+            _migrated.add(db_path)
+        _pool_stats['opened'] += 1
+    return conn
+
+
+def get_connection(db_path=DB_PATH) -> sqlite3.Connection:
+    """This thread's connection to db_path (opened, tuned and migrated on first use)."""
+    db_path = str(db_path)
+    # Connections must not cross a fork (gunicorn preloads the app in the master)
+    if getattr(_local, 'pid', None) != os.getpid():
+        _local.pid = os.getpid()
+        _local.connections = {}
+    conn = _local.connections.get(db_path)
+    if conn is None:
+        conn = _open(db_path)
+        _local.connections[db_path] = conn
+    return conn
+
+
+@contextmanager
+def transaction(db_path=DB_PATH):
+    """
+    Groups statements into one write transaction on this thread's connection.
+    BEGIN IMMEDIATE takes the write lock up front so two writers can't both
+    read, then deadlock upgrading. Nested use joins the outer transaction.
+    """
+    conn = get_connection(db_path)
+    if conn.in_transaction:
+        yield conn
+        return
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        yield conn
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+    conn.execute('COMMIT')
+
+
+def query_one(sql, params=(), db_path=DB_PATH):
+    return get_connection(db_path).execute(sql, params).fetchone()
+
+
+def query_all(sql, params=(), db_path=DB_PATH):
+    return get_connection(db_path).execute(sql, params).fetchall()
+
+
+def execute(sql, params=(), db_path=DB_PATH) -> sqlite3.Cursor:
+    return get_connection(db_path).execute(sql, params)
+
+
+def bulk_insert(table, columns, rows, or_ignore=False, db_path=DB_PATH) -> int:
+    """Inserts many rows in one transaction with a single prepared statement. Returns rows inserted."""
+    rows = list(rows)
+    if not rows:
+        return 0
+    verb = 'INSERT OR IGNORE' if or_ignore else 'INSERT'
+    sql = f'{verb} INTO {table} ({", ".join(columns)}) VALUES ({", ".join("?" for _ in columns)})'
+    with transaction(db_path) as conn:
+        before = conn.total_changes
+        conn.executemany(sql, rows)
+        return conn.total_changes - before
+
+
+def upsert(table, columns, rows, conflict_columns, update_columns=None, db_path=DB_PATH) -> int:
+    """
+    INSERT ... ON CONFLICT DO UPDATE for many rows in one transaction.
+    update_columns defaults to every column that is not part of the conflict key.
+    """
+    rows = list(rows)
+    if not rows:
+        return 0
+    if update_columns is None:
+        update_columns = [c for c in columns if c not in conflict_columns]
+    updates = ", ".join(f'{c} = excluded.{c}' for c in update_columns)
+    sql = (
+        f'INSERT INTO {table} ({", ".join(columns)}) VALUES ({", ".join("?" for _ in columns)}) '
+        f'ON CONFLICT({", ".join(conflict_columns)}) '
+        + (f'DO UPDATE SET {updates}' if updates else 'DO NOTHING')
+    )
+    with transaction(db_path) as conn:
+        before = conn.total_changes
+        conn.executemany(sql, rows)
+        return conn.total_changes - before
+
+
+def pool_stats():
+    return {
+        'connections_opened': _pool_stats['opened'],
+        'schema_version': len(MIGRATIONS),
+    }
+
+
+# ----------------- Books -----------------
 def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
-    # Create books table
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS books (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            title TEXT NOT NULL,
-            file_path TEXT NOT NULL,
-            upload_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    conn.commit()
-    conn.close()
+    get_connection()
 
 def add_book(title, file_path):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute('INSERT INTO books (title, file_path) VALUES (?, ?)', (title, file_path))
-    book_id = c.lastrowid
-    conn.commit()
-    conn.close()
-    return book_id
+    c = execute('INSERT INTO books (title, file_path) VALUES (?, ?)', (title, file_path))
+    return c.lastrowid
 
 def get_all_books():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute('SELECT id, title, file_path, upload_date FROM books ORDER BY upload_date DESC')
-    books = c.fetchall()
-    conn.close()
+    books = query_all('SELECT id, title, file_path, upload_date FROM books ORDER BY upload_date DESC')
     return [{'id': b[0], 'title': b[1], 'file_path': b[2], 'upload_date': b[3]} for b in books]
 
 def get_book_by_id(book_id):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute('SELECT id, title, file_path, upload_date FROM books WHERE id = ?', (book_id,))
-    book = c.fetchone()
-    conn.close()
+    book = query_one('SELECT id, title, file_path, upload_date FROM books WHERE id = ?', (book_id,))
     return book and {'id': book[0], 'title': book[1], 'file_path': book[2], 'upload_date': book[3]}
@@ -51,10 +51,16 @@
 
 
 import os
-import os
-from langchain_community.vectorstores import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_groq import ChatGroq  # ✅ Groq LLM
+# Chroma / ChatGroq are imported inside the functions that use them so
+# importing this module (at app startup) stays cheap.
+import json
+import asyncio
+from typing import Optional
+from backend.llm_json import extract_json, record_parse, valid_flashcard_questions, LLMJSONError
+from backend.metrics import stage, invoke_llm, ainvoke_llm
+from backend.async_llm import run_blocking
+from backend.index_versions import open_index, current_path
+from backend.retrieval_filters import PageRange, filtered
 
 from dotenv import load_dotenv
 
@@ -83,31 +89,33 @@ def load_index(book_name: str, embeddings):
     normalized_name = normalize_book_name(book_name)
     book_index_folder = os.path.join(INDEX_FOLDER, normalized_name)
 
-    if not os.path.exists(book_index_folder) or not os.listdir(book_index_folder):
+    if current_path(normalized_name, INDEX_FOLDER) is None:
         raise FileNotFoundError(
             f"No Chroma index found for '{book_name}' in {book_index_folder}. "
             "Please create the index first."
         )
 
     print(f"Loading existing index for '{book_name}'...")
-    return Chroma(
-        persist_directory=book_index_folder,
-        embedding_function=embeddings
-    )
+    # Pins the live version so a concurrent re-index can't swap it out mid-query
+    return open_index(normalized_name, embeddings, INDEX_FOLDER)
 
 
-def generate_flashcards(embeddings, sample_query: str, class_name: str, subjects: list, rag: bool, book_name: str = None):
-    """
-    Generate 10 flashcards in JSON format.
-    - If rag=True, retrieve context from Chroma index for each question.
-    - If rag=False, generate directly from LLM.
-    """
+def parse_flashcard_questions(response) -> list:
+    """Extract the JSON array of questions; fall back to one question per line."""
     try:
-        # ✅ Initialize Groq LLM
-        llm = ChatGroq(model=LLM_MODEL, groq_api_key=GROQ_API_KEY)
-
-        # Step 1: Generate 10 questions
-        question_prompt = f"""
+        value, _ = extract_json(response, expect="array", schema="flashcards")
+        questions = valid_flashcard_questions(value)
+        if questions:
+            return questions
+    except LLMJSONError:
+        pass
+    # fallback: split by lines if JSON parsing fails
+    text = response.content if hasattr(response, "content") else str(response)
+    return [q.strip("- ").strip() for q in text.split("\n") if q.strip() and q.strip() not in ("[", "]", "```", "```json")]
+
+
+def _question_prompt(sample_query: str, class_name: str, subjects: list) -> str:
+    return f"""
         You are a teacher. Generate exactly 10 short and clear flashcard-style questions
         for students in {class_name} on the topic "{sample_query}".
         Subjects: {", ".join(subjects)}.
@@ -119,30 +127,30 @@ def generate_flashcards(embeddings, sample_query: str, class_name: str, subjects
           ...
         ]
         """
-        question_response = llm.invoke(question_prompt)
-        questions = []
-
-        if hasattr(question_response, "content"):
-            try:
-                import json
-                questions = json.loads(question_response.content)
-            except:
-                # fallback: split by lines if JSON parsing fails
-                questions = [q.strip("- ").strip() for q in question_response.content.split("\n") if q.strip()]
-        else:
-            questions = [q.strip("- ").strip() for q in str(question_response).split("\n") if q.strip()]
 
-        flashcards = []
 
-        # Step 2: For each question, generate short answer
-        for q in questions[:10]:  # ensure max 10
-            context = []
-            if rag and book_name:
-                db = load_index(book_name, embeddings)
-                results = db.similarity_search(q, k=2)
-                context = [res.page_content for res in results]
-
-            answer_prompt = f"""
+def _top_up_prompt(question_prompt: str, questions: list) -> str:
+    # Ask only for the questions that are missing instead of starting over
+    record_parse("flashcards", "rerequested_items", 10 - len(questions))
+    return question_prompt + f"""
+        Generate exactly {10 - len(questions)} more, different from these: {json.dumps(questions)}
+        """
+
+
+def _retrieve_contexts(embeddings, book_name: str, questions: list, page_range: Optional[PageRange] = None) -> list:
+    """Two book chunks per question, from page_range if given (blocking: index open and searches)."""
+    with stage("flashcards", "load_index", book=book_name):
+        db = filtered(load_index(book_name, embeddings), page_range)
+    contexts = []
+    for q in questions:
+        with stage("flashcards", "similarity_search", book=book_name, k=2):
+            results = db.similarity_search(q, k=2)
+        contexts.append([res.page_content for res in results])
+    return contexts
+
+
+def _answer_prompt(q: str, context: list, rag: bool) -> str:
+    return f"""
             You are a teacher answering a flashcard question.
 
             Question: {q}
@@ -152,12 +160,47 @@ def generate_flashcards(embeddings, sample_query: str, class_name: str, subjects
 
             Provide a short answer (1 lines only).
             """
-            answer_response = llm.invoke(answer_prompt)
-            answer = answer_response.content if hasattr(answer_response, "content") else str(answer_response)
+
+
+def _message_text(response) -> str:
+    return response.content if hasattr(response, "content") else str(response)
+
+
+def generate_flashcards(embeddings, sample_query: str, class_name: str, subjects: list, rag: bool, book_name: str = None,
+                        page_range: Optional[PageRange] = None):
+    """
+    Generate 10 flashcards in JSON format.
+    - If rag=True, retrieve context from Chroma index for each question
+      (only from page_range, e.g. one chapter, when given).
+    - If rag=False, generate directly from LLM.
+    """
+    try:
+        # ✅ Initialize Groq LLM
+        from langchain_groq import ChatGroq
+        llm = ChatGroq(model=LLM_MODEL, groq_api_key=GROQ_API_KEY)
+
+        # Step 1: Generate 10 questions
+        question_prompt = _question_prompt(sample_query, class_name, subjects)
+        question_response = invoke_llm(llm, question_prompt, "flashcards")
+        questions = parse_flashcard_questions(question_response)
+
+        if len(questions) < 10:
+            questions += parse_flashcard_questions(invoke_llm(llm, _top_up_prompt(question_prompt, questions), "flashcards"))
+        questions = questions[:10]  # ensure max 10
+
+        contexts = [[] for _ in questions]
+        if rag and book_name:
+            contexts = _retrieve_contexts(embeddings, book_name, questions, page_range)
+
+        flashcards = []
+
+        # Step 2: For each question, generate short answer
+        for q, context in zip(questions, contexts):
+            answer_response = invoke_llm(llm, _answer_prompt(q, context, rag), "flashcards")
 
             flashcards.append({
                 "question": q,
-                "answer": answer.strip()
+                "answer": _message_text(answer_response).strip()
             })
 
         return flashcards
@@ -166,6 +209,47 @@ def generate_flashcards(embeddings, sample_query: str, class_name: str, subjects
         return {"status": "error", "message": str(e)}
 
 
+_async_llm = None
+
+
+def _shared_async_llm():
+    # One client per worker on the async path, so its connection pool is reused
+    global _async_llm
+    if _async_llm is None:
+        from langchain_groq import ChatGroq
+        _async_llm = ChatGroq(model=LLM_MODEL, groq_api_key=GROQ_API_KEY)
+    return _async_llm
+
+
+async def generate_flashcards_async(embeddings, sample_query: str, class_name: str, subjects: list, rag: bool, book_name: str = None,
+                                    page_range: Optional[PageRange] = None):
+    """generate_flashcards for the async serving path; the 10 answers are requested concurrently."""
+    try:
+        llm = _shared_async_llm()
+
+        question_prompt = _question_prompt(sample_query, class_name, subjects)
+        questions = parse_flashcard_questions(await ainvoke_llm(llm, question_prompt, "flashcards"))
+        if len(questions) < 10:
+            questions += parse_flashcard_questions(await ainvoke_llm(llm, _top_up_prompt(question_prompt, questions), "flashcards"))
+        questions = questions[:10]
+
+        contexts = [[] for _ in questions]
+        if rag and book_name:
+            contexts = await run_blocking(_retrieve_contexts, embeddings, book_name, questions, page_range)
+
+        answers = await asyncio.gather(*(
+            ainvoke_llm(llm, _answer_prompt(q, context, rag), "flashcards")
+            for q, context in zip(questions, contexts)
+        ))
+        return [
+            {"question": q, "answer": _message_text(answer).strip()}
+            for q, answer in zip(questions, answers)
+        ]
+
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+
+
 # Run standalone (for testing)
 # if __name__ == "__main__":
 #     result = generate_flashcards(
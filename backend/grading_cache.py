@@ -0,0 +1,108 @@
+# backend/grading_cache.py
+
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional, Dict, Any
+
+from backend.database import DB_PATH, get_connection
+from backend.metrics import record_cache
+
+# ============= SETTINGS ============
+MEMORY_CACHE_SIZE = 5000   # verdicts kept in-process in front of SQLite
+# ==================================
+
+
+def _key_text(text: str) -> str:
+    # Only case and whitespace are folded: "a*b" and "a/b" are different answers
+    return " ".join((text or "").split()).casefold()
+
+
+def verdict_cache_key(question: str, correct_answer: str, user_answer: str) -> str:
+    """Hash of the question text, the expected answer and the student answer."""
+    parts = [_key_text(question), _key_text(correct_answer), _key_text(user_answer)]
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+class VerdictCache:
+    """
+    Short-answer grading verdicts shared across requests.
+    Reads go memory -> SQLite (books.db); writes go to both.
+    """
+
+    def __init__(self, db_path=DB_PATH, memory_size: int = MEMORY_CACHE_SIZE):
+        self.db_path = db_path
+        self.memory_size = memory_size
+        self._memory: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'memory_hits': 0, 'db_hits': 0, 'misses': 0, 'stores': 0}
+
+    def _remember(self, key: str, verdict: Dict[str, Any]):
+        with self._lock:
+            self._memory[key] = verdict
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            verdict = self._memory.get(key)
+            if verdict is not None:
+                self._memory.move_to_end(key)
+                self._stats['memory_hits'] += 1
+                record_cache("grading_verdicts", hit=True)
+                return verdict
+
+        try:
+            conn = get_connection(self.db_path)
+            row = conn.execute(
+                'SELECT is_correct, llm_explanation FROM grading_verdicts WHERE cache_key = ?', (key,)
+            ).fetchone()
+            if row:
+                conn.execute('UPDATE grading_verdicts SET hits = hits + 1 WHERE cache_key = ?', (key,))
+        except sqlite3.Error as e:
+            print(f"Verdict cache read failed: {e}")
+            row = None
+
+        with self._lock:
+            if row is None:
+                self._stats['misses'] += 1
+                record_cache("grading_verdicts", hit=False)
+                return None
+            self._stats['db_hits'] += 1
+        record_cache("grading_verdicts", hit=True)
+        verdict = {'is_correct': bool(row[0]), 'llm_explanation': row[1]}
+        self._remember(key, verdict)
+        return verdict
+
+    def put(self, key: str, verdict: Dict[str, Any]):
+        if verdict.get('grading_error'):
+            # Timeouts, API errors and a missing key say nothing about the answer
+            return
+        stored = {'is_correct': bool(verdict.get('is_correct')), 'llm_explanation': verdict.get('llm_explanation', '')}
+        self._remember(key, stored)
+        try:
+            get_connection(self.db_path).execute(
+                'INSERT OR REPLACE INTO grading_verdicts (cache_key, is_correct, llm_explanation) VALUES (?, ?, ?)',
+                (key, int(stored['is_correct']), stored['llm_explanation'])
+            )
+        except sqlite3.Error as e:
+            print(f"Verdict cache write failed: {e}")
+            return
+        with self._lock:
+            self._stats['stores'] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits = self._stats['memory_hits'] + self._stats['db_hits']
+            lookups = hits + self._stats['misses']
+            return {
+                **self._stats,
+                'memory_entries': len(self._memory),
+                'hit_rate': round(hits / lookups, 3) if lookups else 0.0,
+            }
+
+
+# Process-wide verdict cache
+verdict_cache = VerdictCache()
@@ -0,0 +1,194 @@
+# backend/grading_scheduler.py
+
+import os
+import time
+import uuid
+import threading
+from collections import deque, OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from backend.tracing import span, is_tracing, bind_context
+
+# ============= SETTINGS ============
+GRADING_WORKERS = int(os.getenv("GRADING_WORKERS", "16"))            # process-wide LLM grading budget
+GRADING_MAX_QUEUE = int(os.getenv("GRADING_MAX_QUEUE", "2000"))      # queued tasks before we refuse new work
+GRADING_DEADLINE_SECONDS = float(os.getenv("GRADING_DEADLINE_SECONDS", "45"))
+# ==================================
+
+
+class GradingQueueFull(Exception):
+    """Raised when the shared grading queue is at capacity (the route answers 503)."""
+
+
+class _Task:
+    __slots__ = ("fn", "args", "future", "deadline", "enqueued_at")
+
+    def __init__(self, fn, args, deadline):
+        self.fn = fn
+        self.args = args
+        self.future = Future()
+        self.deadline = deadline
+        self.enqueued_at = time.monotonic()
+
+
+def _traced_task(fn: Callable, request_key: str) -> Callable:
+    """Runs fn as a "grading.task" span under the submitting request's trace."""
+    enqueued_at = time.monotonic()
+
+    def run(*args):
+        with span("grading.task", request=request_key, queue_wait_ms=round((time.monotonic() - enqueued_at) * 1000, 1)):
+            return fn(*args)
+    return bind_context(run)
+
+
+class GradingScheduler:
+    """
+    Fixed pool of worker threads shared by every /grade_quiz request.
+    Each request gets its own FIFO queue and workers serve the queues
+    round-robin, so one 50-question quiz cannot starve a 5-question one.
+    Tasks whose deadline passes while queued are dropped without running.
+    """
+
+    def __init__(self, workers: int = GRADING_WORKERS, max_queue: int = GRADING_MAX_QUEUE):
+        self.workers = workers
+        self.max_queue = max_queue
+        self._queues: "OrderedDict[str, deque]" = OrderedDict()
+        self._cond = threading.Condition()
+        self._queued = 0
+        self._running = 0
+        self._threads: List[threading.Thread] = []
+        self._stats = {
+            'submitted': 0,
+            'completed': 0,
+            'failed': 0,
+            'expired': 0,
+            'rejected': 0,
+            'max_queue_depth': 0,
+            'total_wait_seconds': 0.0,
+        }
+
+    def _ensure_started(self):
+        if self._threads:
+            return
+        for i in range(self.workers):
+            t = threading.Thread(target=self._worker, name=f"grading-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def submit(self, request_key: str, fn: Callable, *args, deadline: Optional[float] = None) -> Future:
+        """Queues fn(*args) under request_key; deadline is an absolute time.monotonic() value."""
+        with self._cond:
+            if self._queued >= self.max_queue:
+                self._stats['rejected'] += 1
+                raise GradingQueueFull(f"Grading queue is full ({self._queued} tasks waiting)")
+            self._ensure_started()
+            if is_tracing():
+                fn = _traced_task(fn, request_key)
+            task = _Task(fn, args, deadline)
+            self._queues.setdefault(request_key, deque()).append(task)
+            self._queued += 1
+            self._stats['submitted'] += 1
+            self._stats['max_queue_depth'] = max(self._stats['max_queue_depth'], self._queued)
+            self._cond.notify()
+            return task.future
+
+    def _next_task(self) -> _Task:
+        """Round-robin: take one task from the oldest request, then move it to the back."""
+        with self._cond:
+            while not self._queues:
+                self._cond.wait()
+            request_key, queue = next(iter(self._queues.items()))
+            task = queue.popleft()
+            if queue:
+                self._queues.move_to_end(request_key)
+            else:
+                del self._queues[request_key]
+            self._queued -= 1
+            self._running += 1
+            return task
+
+    def _worker(self):
+        while True:
+            task = self._next_task()
+            try:
+                if not task.future.set_running_or_notify_cancel():
+                    continue
+                now = time.monotonic()
+                with self._cond:
+                    self._stats['total_wait_seconds'] += now - task.enqueued_at
+                if task.deadline is not None and now > task.deadline:
+                    with self._cond:
+                        self._stats['expired'] += 1
+                    task.future.set_exception(FutureTimeoutError("Grading deadline passed while queued"))
+                    continue
+                try:
+                    result = task.fn(*task.args)
+                except BaseException as e:
+                    with self._cond:
+                        self._stats['failed'] += 1
+                    task.future.set_exception(e)
+                else:
+                    with self._cond:
+                        self._stats['completed'] += 1
+                    task.future.set_result(result)
+            finally:
+                with self._cond:
+                    self._running -= 1
+
+    def map(
+        self,
+        fn: Callable,
+        items: Iterable[Any],
+        deadline: Optional[float] = None,
+        on_timeout: Optional[Callable[[Any], Any]] = None,
+    ) -> List[Any]:
+        """
+        Runs fn(item) for every item under one request key and waits for all of them.
+        deadline is an absolute time.monotonic() value (default: now + GRADING_DEADLINE_SECONDS).
+        Items that miss the deadline (or fail) are replaced with on_timeout(item).
+        """
+        items = list(items)
+        if not items:
+            return []
+        request_key = uuid.uuid4().hex
+        if deadline is None:
+            deadline = time.monotonic() + GRADING_DEADLINE_SECONDS
+        futures: List[Future] = []
+        try:
+            for item in items:
+                futures.append(self.submit(request_key, fn, item, deadline=deadline))
+        except GradingQueueFull:
+            # Don't leave half a quiz queued behind a rejection
+            for future in futures:
+                future.cancel()
+            raise
+
+        results = []
+        for item, future in zip(items, futures):
+            try:
+                results.append(future.result(timeout=max(0.0, deadline - time.monotonic())))
+            except Exception as e:
+                future.cancel()
+                if on_timeout is None:
+                    raise
+                print(f"Grading task did not finish: {type(e).__name__}: {e}")
+                results.append(on_timeout(item))
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            finished = self._stats['completed'] + self._stats['failed'] + self._stats['expired']
+            return {
+                'workers': self.workers,
+                'queue_depth': self._queued,
+                'active_requests': len(self._queues),
+                'running': self._running,
+                'max_queue': self.max_queue,
+                'avg_wait_seconds': round(self._stats['total_wait_seconds'] / finished, 4) if finished else 0.0,
+                **{k: v for k, v in self._stats.items() if k != 'total_wait_seconds'},
+            }
+
+
+# Process-wide scheduler shared by every grading request
+grading_scheduler = GradingScheduler()
@@ -0,0 +1,311 @@
+# backend/index_maintenance.py
+#
+# Lifecycle tooling for chroma_index/. Deleting a book used to leave its
+# index folder behind, and every re-run of Chroma.from_documents appended a
+# second copy of each chunk, so cold disk use and open time grew with the
+# history of the folder rather than with the live catalog.
+#   report   per index: disk use, vectors, duplicate chunks, orphaned or not
+#   gc       delete indexes (and alias links) no catalog book points at
+#   compact  rebuild an index without duplicates or deleted HNSW entries, then VACUUM
+# Indexes are versioned (backend/index_versions.py): statistics describe the
+# live version, and gc also retires superseded versions nobody is reading.
+# Run standalone: python -m backend.index_maintenance report|gc|compact [--book NAME] [--dry-run]
+# The same operations are served on /admin/indexes.
+
+import os
+import sys
+import json
+import shutil
+import sqlite3
+import argparse
+from typing import Dict, Any, List, Optional, Set
+
+from backend import book_catalog, index_versions
+from backend.metrics import stage
+
+# ============= SETTINGS ============
+BOOKS_FOLDER = "./books"
+INDEX_FOLDER = "./chroma_index"
+CHROMA_DB_FILE = "chroma.sqlite3"
+COMPACT_BATCH = 5000          # vectors copied per get/add round trip
+# ==================================
+
+
+def _dir_bytes(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def _read_chroma_stats(index_path: str) -> Dict[str, Any]:
+    """
+    Vector and duplicate counts read straight from chroma.sqlite3 (read-only),
+    so reporting needs neither chromadb nor the embedding model.
+    """
+    db_file = os.path.join(index_path, CHROMA_DB_FILE)
+    if not os.path.exists(db_file):
+        return {'vectors': None, 'unique_chunks': None, 'segment_dirs': [], 'stale_segment_dirs': []}
+    conn = sqlite3.connect(f'file:{db_file}?mode=ro', uri=True)
+    try:
+        vectors = conn.execute('SELECT COUNT(*) FROM embeddings').fetchone()[0]
+        # A chunk is a duplicate when its text and page/source are identical
+        unique = conn.execute('''
+            SELECT COUNT(*) FROM (
+                SELECT DISTINCT d.string_value, p.int_value, s.string_value
+                FROM embeddings e
+                LEFT JOIN embedding_metadata d ON d.id = e.id AND d.key = 'chroma:document'
+                LEFT JOIN embedding_metadata p ON p.id = e.id AND p.key = 'page'
+                LEFT JOIN embedding_metadata s ON s.id = e.id AND s.key = 'source'
+            )
+        ''').fetchone()[0]
+        segments = {row[0] for row in conn.execute("SELECT id FROM segments WHERE scope = 'VECTOR'")}
+    except sqlite3.Error as e:
+        print(f"Could not read {db_file}: {e}")
+        return {'vectors': None, 'unique_chunks': None, 'segment_dirs': [], 'stale_segment_dirs': []}
+    finally:
+        conn.close()
+    # HNSW files live in one folder per vector segment; others are leftovers
+    segment_dirs = [d for d in os.listdir(index_path) if os.path.isdir(os.path.join(index_path, d))]
+    return {
+        'vectors': vectors,
+        'unique_chunks': unique,
+        'segment_dirs': segment_dirs,
+        'stale_segment_dirs': [d for d in segment_dirs if d not in segments],
+    }
+
+
+def live_index_names(index_folder: str = INDEX_FOLDER) -> Set[str]:
+    """
+    Index folders a book reads from, following alias symlinks. A PDF still in
+    books/ keeps its index alive even if the catalog has not caught up yet.
+    """
+    names = {book['name'] for book in book_catalog.list_books()}
+    if os.path.isdir(BOOKS_FOLDER):
+        names |= {n for n in os.listdir(BOOKS_FOLDER) if os.path.isfile(os.path.join(BOOKS_FOLDER, n))}
+    live = set()
+    for book_name in names:
+        name = book_catalog.index_dir_name(book_name)
+        live.add(name)
+        path = os.path.join(index_folder, name)
+        if os.path.islink(path):
+            live.add(os.path.basename(os.path.realpath(path)))
+    return live
+
+
+def scan(index_folder: str = INDEX_FOLDER) -> List[Dict[str, Any]]:
+    """One row per entry in chroma_index/: size, vectors, duplicates and whether it is still used."""
+    if not os.path.isdir(index_folder):
+        return []
+    live = live_index_names(index_folder)
+    rows = []
+    for name in sorted(os.listdir(index_folder)):
+        path = os.path.join(index_folder, name)
+        if os.path.islink(path):
+            target = os.readlink(path)
+            rows.append({
+                'name': name,
+                'kind': 'alias',
+                'alias_of': target,
+                'bytes': 0,
+                'orphaned': name not in live or not os.path.isdir(path),
+            })
+            continue
+        if not os.path.isdir(path):
+            continue
+        version = index_versions.current_version(name, index_folder)
+        version_path = index_versions.current_path(name, index_folder)
+        stats = _read_chroma_stats(version_path) if version_path else _read_chroma_stats(path)
+        duplicates = (stats['vectors'] - stats['unique_chunks']) if stats['vectors'] is not None else None
+        rows.append({
+            'name': name,
+            'kind': 'index',
+            'version': version,
+            'versions': sum(1 for e in os.listdir(path) if index_versions.is_version_dir(e)),
+            'bytes': _dir_bytes(path),
+            'vectors': stats['vectors'],
+            'duplicates': duplicates,
+            'stale_segment_dirs': [os.path.join(version or '', d) for d in stats['stale_segment_dirs']],
+            'orphaned': name not in live,
+        })
+    return rows
+
+
+def remove_index(name: str, index_folder: str = INDEX_FOLDER):
+    # Leased versions outlive this call until their readers finish
+    index_versions.retire_book(name, index_folder)
+
+
+def remove_index_if_orphaned(book_name: str, index_folder: str = INDEX_FOLDER) -> bool:
+    """
+    Called after a book leaves the catalog: drops its index folder (or alias
+    link) unless another book still reads from it through an alias.
+    """
+    name = book_catalog.index_dir_name(book_name)
+    if name in live_index_names(index_folder):
+        return False
+    path = os.path.join(index_folder, name)
+    if not (os.path.islink(path) or os.path.exists(path)):
+        return False
+    remove_index(name, index_folder)
+    print(f"Retired index '{name}'")
+    return True
+
+
+def collect_garbage(index_folder: str = INDEX_FOLDER, dry_run: bool = False) -> Dict[str, Any]:
+    """
+    Deletes orphaned indexes, dangling aliases, stale segment folders and
+    superseded versions no reader holds (the latter only when not a dry run).
+    """
+    removed, reclaimed = [], 0
+    for row in scan(index_folder):
+        path = os.path.join(index_folder, row['name'])
+        if row['orphaned']:
+            removed.append(row['name'])
+            reclaimed += row['bytes']
+            if not dry_run:
+                remove_index(row['name'], index_folder)
+            continue
+        if row['kind'] != 'index':
+            continue
+        for segment in row['stale_segment_dirs']:
+            segment_path = os.path.join(path, segment)
+            removed.append(f"{row['name']}/{segment}")
+            reclaimed += _dir_bytes(segment_path)
+            if not dry_run:
+                shutil.rmtree(segment_path, ignore_errors=True)
+        if not dry_run:
+            before = _dir_bytes(path)
+            retired = index_versions.retire_old_versions(row['name'], index_folder)
+            removed += [f"{row['name']}/{version}" for version in retired]
+            reclaimed += before - _dir_bytes(path)
+    return {'removed': removed, 'reclaimed_bytes': reclaimed, 'dry_run': dry_run}
+
+
+def _vacuum(index_path: str):
+    conn = sqlite3.connect(os.path.join(index_path, CHROMA_DB_FILE))
+    try:
+        conn.execute('VACUUM')
+    finally:
+        conn.close()
+
+
+def compact_index(name: str, index_folder: str = INDEX_FOLDER) -> Dict[str, Any]:
+    """
+    Rebuilds one index as a new version keeping the first copy of every
+    chunk; readers switch to it atomically and the old version is retired
+    once they finish. A fresh HNSW graph also drops the tombstones of
+    deleted vectors, which Chroma never reclaims in place. The stored
+    embeddings are copied, so the model is not needed.
+    """
+    import chromadb
+
+    path = os.path.join(index_folder, name)
+    if os.path.islink(path) or index_versions.current_path(name, index_folder) is None:
+        raise FileNotFoundError(f"No index folder '{name}' in {index_folder}")
+    before = _dir_bytes(path)
+
+    with stage("index_maintenance", "compact", book=name):
+        lease = index_versions.acquire(name, index_folder)
+        try:
+            with index_versions.build(name, index_folder) as staging:
+                source = chromadb.PersistentClient(path=lease.path)
+                target = chromadb.PersistentClient(path=staging)
+                kept = dropped = 0
+                for collection in source.list_collections():
+                    if isinstance(collection, str):   # chromadb >= 0.6 returns names
+                        collection = source.get_collection(collection)
+                    copy = target.create_collection(collection.name, metadata=collection.metadata)
+                    seen = set()
+                    total = collection.count()
+                    for offset in range(0, total, COMPACT_BATCH):
+                        batch = collection.get(limit=COMPACT_BATCH, offset=offset,
+                                               include=["embeddings", "documents", "metadatas"])
+                        ids, embeddings, documents, metadatas = [], [], [], []
+                        for i, doc_id in enumerate(batch['ids']):
+                            metadata = batch['metadatas'][i] or {}
+                            key = (batch['documents'][i], metadata.get('page'), metadata.get('source'))
+                            if key in seen:
+                                dropped += 1
+                                continue
+                            seen.add(key)
+                            ids.append(doc_id)
+                            embeddings.append(batch['embeddings'][i])
+                            documents.append(batch['documents'][i])
+                            metadatas.append(metadata or None)
+                        if ids:
+                            copy.add(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+                            kept += len(ids)
+                del source, target
+                index_versions.forget_chroma_client(staging)
+                _vacuum(staging)
+        finally:
+            lease.release()
+
+    after = _dir_bytes(path)
+    print(f"Compacted '{name}': kept {kept}, dropped {dropped} duplicates, {before} -> {after} bytes")
+    return {'name': name, 'kept': kept, 'dropped_duplicates': dropped, 'bytes_before': before, 'bytes_after': after}
+
+
+def compact_all(index_folder: str = INDEX_FOLDER, book: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Compacts every live index (or one book's), skipping aliases and orphans."""
+    results = []
+    for row in scan(index_folder):
+        if row['kind'] != 'index' or row['orphaned']:
+            continue
+        if book and row['name'] != book_catalog.index_dir_name(book):
+            continue
+        try:
+            results.append(compact_index(row['name'], index_folder))
+        except Exception as e:
+            print(f"Compaction of '{row['name']}' failed: {e}")
+            results.append({'name': row['name'], 'error': str(e)})
+    return results
+
+
+def summary(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {
+        'indexes': sum(1 for r in rows if r['kind'] == 'index'),
+        'orphaned': sum(1 for r in rows if r['orphaned']),
+        'total_bytes': sum(r['bytes'] for r in rows),
+        'orphaned_bytes': sum(r['bytes'] for r in rows if r['orphaned']),
+        'vectors': sum(r.get('vectors') or 0 for r in rows),
+        'duplicates': sum(r.get('duplicates') or 0 for r in rows),
+    }
+
+
+# Run standalone: python -m backend.index_maintenance report|gc|compact [--book NAME] [--dry-run]
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report, garbage-collect and compact chroma_index/")
+    parser.add_argument("command", choices=["report", "gc", "compact"])
+    parser.add_argument("--book", help="compact only this book")
+    parser.add_argument("--dry-run", action="store_true", help="gc: list what would be removed")
+    parser.add_argument("--json", action="store_true", help="print machine-readable output")
+    parser.add_argument("--index-folder", default=INDEX_FOLDER)
+    args = parser.parse_args()
+
+    if args.command == "report":
+        rows = scan(args.index_folder)
+        if args.json:
+            print(json.dumps({'indexes': rows, 'summary': summary(rows)}, indent=2))
+            sys.exit(0)
+        for r in rows:
+            state = "ORPHANED" if r['orphaned'] else ""
+            if r['kind'] == 'alias':
+                print(f"{r['name']:<40} alias -> {r['alias_of']}  {state}")
+            else:
+                print(f"{r['name']:<40} {r['bytes'] / 1e6:>9.2f} MB  {r.get('vectors')!s:>8} vectors  "
+                      f"{r.get('duplicates')!s:>7} duplicates  {state}")
+        print(json.dumps(summary(rows)))
+    elif args.command == "gc":
+        result = collect_garbage(args.index_folder, dry_run=args.dry_run)
+        print(json.dumps(result, indent=2))
+    else:
+        results = compact_all(args.index_folder, args.book)
+        print(json.dumps(results, indent=2))
+        if any('error' in r for r in results):
+            sys.exit(1)
@@ -0,0 +1,338 @@
+# backend/index_versions.py
+#
+# Versioned book indexes with an atomic switch-over. Each book folder in
+# chroma_index/ holds immutable versions and a pointer to the live one:
+#   chroma_index/<book>/CURRENT          "v1718000000000000000"
+#   chroma_index/<book>/v1718.../        a complete Chroma persist directory
+#   chroma_index/<book>/v1719....building  a re-index in progress
+# Re-indexing builds a new version next to the live one and only then
+# replaces CURRENT (write + rename), so /query_book never sees a half-built
+# index and keeps using the previous version until the swap. Readers hold a
+# shared flock on the version's .readers file for as long as they use it;
+# a version is deleted only once it is no longer current and that lock can
+# be taken exclusively, i.e. no thread in any worker is still reading it.
+# Releases only queue that check; a per-process daemon thread deletes.
+
+import os
+import time
+import queue
+import fcntl
+import shutil
+import weakref
+import threading
+from contextlib import contextmanager
+from typing import Optional, List, Dict
+
+# ============= SETTINGS ============
+INDEX_FOLDER = "./chroma_index"
+POINTER_FILE = "CURRENT"
+READERS_FILE = ".readers"
+WRITE_LOCK_FILE = ".write.lock"
+RETIRED_FILE = ".retired"      # the book was removed; drop the folder once its versions are gone
+BUILDING_SUFFIX = ".building"
+LEGACY_VERSION = "v0"          # name given to indexes from before versioning
+# ==================================
+
+
+def book_path(name: str, index_folder: str = INDEX_FOLDER) -> str:
+    return os.path.join(index_folder, name)
+
+
+def is_version_dir(entry: str) -> bool:
+    return entry.startswith("v") and entry[1:].split(".")[0].isdigit()
+
+
+def current_version(name: str, index_folder: str = INDEX_FOLDER) -> Optional[str]:
+    try:
+        with open(os.path.join(book_path(name, index_folder), POINTER_FILE)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def current_path(name: str, index_folder: str = INDEX_FOLDER) -> Optional[str]:
+    """Persist directory of the live version, or None if the book has no index yet."""
+    version = current_version(name, index_folder)
+    if version is None:
+        return None
+    path = os.path.join(book_path(name, index_folder), version)
+    return path if os.path.isdir(path) else None
+
+
+def _write_pointer(folder: str, version: str):
+    tmp = os.path.join(folder, f".{POINTER_FILE}.{os.getpid()}.tmp")
+    with open(tmp, "w") as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, os.path.join(folder, POINTER_FILE))
+
+
+@contextmanager
+def _write_lock(folder: str, blocking: bool = True):
+    """One writer per book across threads and workers; yields False if non-blocking and busy."""
+    fd = os.open(os.path.join(folder, WRITE_LOCK_FILE), os.O_RDWR | os.O_CREAT, 0o666)
+    try:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            yield False
+            return
+        yield True
+    finally:
+        os.close(fd)
+
+
+def forget_chroma_client(path: str):
+    # chromadb caches one client per persist directory for the life of the
+    # process; stop it so its sqlite and HNSW handles on this version close.
+    for module in ("chromadb.api.shared_system_client", "chromadb.api.client"):
+        try:
+            SharedSystemClient = getattr(__import__(module, fromlist=["SharedSystemClient"]), "SharedSystemClient")
+        except (ImportError, AttributeError):
+            continue
+        system = SharedSystemClient._identifier_to_system.pop(path, None)
+        if system is not None:
+            try:
+                system.stop()
+            except Exception as e:
+                print(f"Closing Chroma client for {path} failed: {e}")
+        return
+
+
+# ----------------- Readers -----------------
+# Per-process count of open leases per version path, so the cached Chroma
+# client of a superseded version is closed when this worker stops using it.
+_local_readers: Dict[str, int] = {}
+_local_lock = threading.Lock()
+
+
+class Lease:
+    """Keeps one version alive while a reader uses it. Released explicitly or when its index is collected."""
+
+    def __init__(self, name: str, version: str, path: str, fd: int, index_folder: str):
+        self.name = name
+        self.version = version
+        self.path = path
+        self.index_folder = index_folder
+        self._fd = fd
+        self._released = False
+
+    def release(self):
+        with _local_lock:
+            if self._released:
+                return
+            self._released = True
+            os.close(self._fd)
+            _local_readers[self.path] -= 1
+            last_local_reader = _local_readers[self.path] == 0
+            if last_local_reader:
+                del _local_readers[self.path]
+        if current_version(self.name, self.index_folder) != self.version:
+            # Often called from weakref.finalize, wherever the collector runs;
+            # closing the client and deleting happen on the retirement thread
+            schedule_retirement(self.name, self.index_folder, self.path if last_local_reader else None)
+
+
+def acquire(name: str, index_folder: str = INDEX_FOLDER) -> Lease:
+    """Pins the live version of a book. Raises FileNotFoundError if it has no index."""
+    folder = book_path(name, index_folder)
+    for _ in range(5):
+        version = current_version(name, index_folder)
+        if version is None:
+            break
+        path = os.path.join(folder, version)
+        try:
+            fd = os.open(os.path.join(path, READERS_FILE), os.O_RDWR | os.O_CREAT, 0o666)
+        except FileNotFoundError:
+            continue   # retired between reading CURRENT and opening it; read CURRENT again
+        fcntl.flock(fd, fcntl.LOCK_SH)
+        if not os.path.isdir(path):
+            os.close(fd)
+            continue
+        with _local_lock:
+            _local_readers[path] = _local_readers.get(path, 0) + 1
+        return Lease(name, version, path, fd, index_folder)
+    raise FileNotFoundError(f"No index version for '{name}' in {index_folder}")
+
+
+def open_index(name: str, embeddings, index_folder: str = INDEX_FOLDER):
+    """
+    Chroma over the live version of a book's index. The version stays pinned
+    until the returned object is garbage collected, which in a request is
+    when the pipeline function returns.
+    """
+    lease = acquire(name, index_folder)
+    try:
+        from langchain_community.vectorstores import Chroma
+        db = Chroma(persist_directory=lease.path, embedding_function=embeddings)
+    except BaseException:
+        lease.release()
+        raise
+    weakref.finalize(db, lease.release)
+    return db
+
+
+# ----------------- Retirement -----------------
+# SimpleQueue.put is safe to call from finalizers, unlike locks and Queue.
+# The thread is started on first use, so each forked worker gets its own.
+_retire_queue: "queue.SimpleQueue" = queue.SimpleQueue()
+_retire_thread: Optional[threading.Thread] = None
+_retire_thread_lock = threading.RLock()
+
+
+def _retirement_loop():
+    while True:
+        name, index_folder, forget_path = _retire_queue.get()
+        try:
+            if forget_path:
+                forget_chroma_client(forget_path)
+            retire_old_versions(name, index_folder)
+        except Exception as e:
+            print(f"Retiring index versions of '{name}' failed: {e}")
+
+
+def schedule_retirement(name: str, index_folder: str = INDEX_FOLDER, forget_path: Optional[str] = None):
+    """Queues retire_old_versions (and closing the Chroma client of forget_path) for the retirement thread."""
+    global _retire_thread
+    _retire_queue.put((name, index_folder, forget_path))
+    with _retire_thread_lock:
+        if _retire_thread is None or not _retire_thread.is_alive():
+            _retire_thread = threading.Thread(target=_retirement_loop, name="index-retirement", daemon=True)
+            _retire_thread.start()
+
+
+# ----------------- Writers -----------------
+@contextmanager
+def build(name: str, index_folder: str = INDEX_FOLDER):
+    """
+    Yields an empty directory to build a new version in. On success it is
+    renamed into place and CURRENT switched to it; on error it is removed
+    and the previous version keeps serving.
+    """
+    folder = book_path(name, index_folder)
+    if os.path.islink(folder):
+        # The name was an alias of another book's index; it now gets its own
+        os.remove(folder)
+    os.makedirs(folder, exist_ok=True)
+
+    with _write_lock(folder):
+        # A book uploaded again under a removed name keeps its folder
+        if os.path.exists(os.path.join(folder, RETIRED_FILE)):
+            os.remove(os.path.join(folder, RETIRED_FILE))
+        version = f"v{time.time_ns()}"
+        staging = os.path.join(folder, version + BUILDING_SUFFIX)
+        os.makedirs(staging)
+        try:
+            yield staging
+            forget_chroma_client(staging)
+            os.rename(staging, os.path.join(folder, version))
+            _write_pointer(folder, version)
+        except BaseException:
+            forget_chroma_client(staging)
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+    print(f"Index '{name}' switched to {version}")
+    retire_old_versions(name, index_folder)
+
+
+def retire_old_versions(name: str, index_folder: str = INDEX_FOLDER) -> List[str]:
+    """
+    Deletes versions other than the current one that no reader holds, and
+    builds left behind by a crashed writer. Safe to call at any time.
+    """
+    folder = book_path(name, index_folder)
+    if os.path.islink(folder) or not os.path.isdir(folder):
+        return []
+    current = current_version(name, index_folder)
+    removed = []
+    for entry in os.listdir(folder):
+        path = os.path.join(folder, entry)
+        if not os.path.isdir(path) or entry == current or not is_version_dir(entry):
+            continue
+        if entry.endswith(BUILDING_SUFFIX):
+            with _write_lock(folder, blocking=False) as free:
+                if free:
+                    shutil.rmtree(path, ignore_errors=True)
+                    removed.append(entry)
+            continue
+        try:
+            fd = os.open(os.path.join(path, READERS_FILE), os.O_RDWR | os.O_CREAT, 0o666)
+        except FileNotFoundError:
+            continue
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            continue   # still being read; the last reader's release retries
+        try:
+            forget_chroma_client(path)
+            shutil.rmtree(path, ignore_errors=True)
+            removed.append(entry)
+        finally:
+            os.close(fd)
+    if removed:
+        print(f"Retired index versions of '{name}': {', '.join(sorted(removed))}")
+    if current is None and os.path.exists(os.path.join(folder, RETIRED_FILE)):
+        with _write_lock(folder, blocking=False) as free:
+            if free and not any(is_version_dir(e) for e in os.listdir(folder)):
+                shutil.rmtree(folder, ignore_errors=True)
+                print(f"Removed index '{name}'")
+    return removed
+
+
+def retire_book(name: str, index_folder: str = INDEX_FOLDER) -> bool:
+    """
+    Removes a book's index without pulling it from under a reader: CURRENT
+    goes first so no new lease can be taken, versions nobody holds are
+    deleted now and the rest (with the folder) when their last lease is
+    released. Returns False if the book had no index.
+    """
+    folder = book_path(name, index_folder)
+    if os.path.islink(folder) or os.path.isfile(folder):
+        os.remove(folder)
+        return True
+    if not os.path.isdir(folder):
+        return False
+    if not any(is_version_dir(e) for e in os.listdir(folder)):
+        # Not a versioned index, so nothing can hold a lease on it
+        shutil.rmtree(folder, ignore_errors=True)
+        return True
+    with _write_lock(folder):
+        open(os.path.join(folder, RETIRED_FILE), "w").close()
+        try:
+            os.remove(os.path.join(folder, POINTER_FILE))
+        except FileNotFoundError:
+            pass
+    retire_old_versions(name, index_folder)
+    return True
+
+
+def migrate_legacy_layout(index_folder: str = INDEX_FOLDER) -> int:
+    """
+    Moves indexes written straight into chroma_index/<book>/ into a v0
+    version with a CURRENT pointer. Run at startup, before readers exist.
+    """
+    if not os.path.isdir(index_folder):
+        return 0
+    migrated = 0
+    for name in os.listdir(index_folder):
+        folder = book_path(name, index_folder)
+        if os.path.islink(folder) or not os.path.isdir(folder):
+            continue
+        if os.path.exists(os.path.join(folder, POINTER_FILE)) or not os.listdir(folder):
+            continue
+        with _write_lock(folder):
+            if os.path.exists(os.path.join(folder, POINTER_FILE)):
+                continue   # another worker got here first
+            target = os.path.join(folder, LEGACY_VERSION)
+            os.makedirs(target, exist_ok=True)
+            for entry in os.listdir(folder):
+                if entry in (LEGACY_VERSION, WRITE_LOCK_FILE) or is_version_dir(entry):
+                    continue
+                os.rename(os.path.join(folder, entry), os.path.join(target, entry))
+            _write_pointer(folder, LEGACY_VERSION)
+        migrated += 1
+    if migrated:
+        print(f"Moved {migrated} index(es) to the versioned layout")
+    return migrated
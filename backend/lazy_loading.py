@@ -0,0 +1,131 @@
+# backend/lazy_loading.py
+#
+# Deferred loading of the MiniLM embedding model so the app can serve
+# pages before sentence-transformers/torch are imported.
+#   LEARNLY_STARTUP=warm   (default) start serving, load the model on a background thread
+#   LEARNLY_STARTUP=lazy   load the model on first use
+#   LEARNLY_STARTUP=eager  load the model before the app starts serving
+
+import os
+import sys
+import time
+import json
+import threading
+import subprocess
+
+from langchain_core.embeddings import Embeddings
+
+# ============= SETTINGS ============
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+STARTUP_MODE = os.getenv("LEARNLY_STARTUP", "warm")
+# ==================================
+
+
+class LazyEmbeddings(Embeddings):
+    """
+    Drop-in stand-in for HuggingFaceEmbeddings. The real model is built the
+    first time it is needed (or by warm_up_async) and every call is then
+    delegated to it, so Chroma and the graders can be handed this object
+    at import time.
+    """
+
+    def __init__(self, model_name: str = EMBEDDING_MODEL_NAME):
+        self.model_name = model_name
+        self._model = None
+        self._lock = threading.Lock()
+        self._loading_started_at = None
+        self.load_seconds = None
+        self.load_error = None
+
+    def _load(self):
+        if self._model is not None:
+            return self._model
+        with self._lock:
+            if self._model is None:
+                self._loading_started_at = time.time()
+                start = time.perf_counter()
+                try:
+                    from langchain_huggingface import HuggingFaceEmbeddings
+                    self._model = HuggingFaceEmbeddings(model_name=self.model_name)
+                except Exception as e:
+                    self.load_error = str(e)
+                    raise
+                self.load_seconds = round(time.perf_counter() - start, 3)
+                self.load_error = None
+                print(f"Embedding model '{self.model_name}' loaded in {self.load_seconds}s")
+        return self._model
+
+    def warm_up_async(self) -> threading.Thread:
+        """Loads the model on a daemon thread so the first request doesn't pay for it."""
+        def warm():
+            try:
+                self._load()
+                # One tiny embedding also initialises the tokenizer and kernels
+                self._model.embed_query("warm up")
+            except Exception as e:
+                print(f"Embedding warm-up failed: {e}")
+
+        thread = threading.Thread(target=warm, name="embedding-warm-up", daemon=True)
+        thread.start()
+        return thread
+
+    def is_ready(self) -> bool:
+        return self._model is not None
+
+    def status(self):
+        return {
+            'model': self.model_name,
+            'ready': self.is_ready(),
+            'loading': self._loading_started_at is not None and self._model is None and self.load_error is None,
+            'load_seconds': self.load_seconds,
+            'error': self.load_error,
+        }
+
+    def embed_documents(self, texts):
+        return self._load().embed_documents(texts)
+
+    def embed_query(self, text):
+        return self._load().embed_query(text)
+
+
+def create_embeddings(mode: str = STARTUP_MODE) -> LazyEmbeddings:
+    embeddings = LazyEmbeddings()
+    if mode == "eager":
+        embeddings._load()
+    elif mode == "warm":
+        embeddings.warm_up_async()
+    return embeddings
+
+
+# ----------------- Startup measurement -----------------
+def measure_startup(module: str = "app", runs: int = 3):
+    """
+    Times `import <module>` in fresh interpreters (what every restart or
+    autoscale event pays) for each startup mode. "eager" loads the model
+    before import returns, like the app did before lazy loading.
+    """
+    code = (
+        "import time, json; t = time.perf_counter(); import {module}; "
+        "print(json.dumps({{'import_seconds': time.perf_counter() - t}}))"
+    ).format(module=module)
+    results = {}
+    for mode in ("eager", "lazy", "warm"):
+        timings = []
+        for _ in range(runs):
+            env = dict(os.environ, LEARNLY_STARTUP=mode)
+            out = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True)
+            if out.returncode != 0:
+                results[mode] = {'error': (out.stderr.strip().splitlines() or ['unknown error'])[-1]}
+                break
+            timings.append(json.loads(out.stdout.strip().splitlines()[-1])['import_seconds'])
+        else:
+            results[mode] = {'best_import_seconds': round(min(timings), 3)}
+    return results
+
+
+# Run standalone: python -m backend.lazy_loading --measure
+if __name__ == "__main__":
+    if "--measure" in sys.argv:
+        print(json.dumps(measure_startup(), indent=2))
+    else:
+        print("Usage: python -m backend.lazy_loading --measure")
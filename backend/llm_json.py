@@ -0,0 +1,343 @@
+# backend/llm_json.py
+#
+# One tolerant JSON extractor for every LLM output in the app (quizzes,
+# grading verdicts, slide decks, flashcards). It finds the JSON value in
+# noisy output (code fences, prose before/after), repairs trailing commas
+# and truncated output where that is safe, and validates the result
+# against the expected schema so callers can re-request only the broken
+# items instead of regenerating everything.
+
+import json
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from backend.metrics import stage
+
+# ============= SETTINGS ============
+MAX_START_CANDIDATES = 32   # opening braces tried before giving up on finding the JSON
+# ==================================
+
+SLIDE_TYPES = ("title_slide", "paragraph", "unordered_list", "ordered_list")
+QUESTION_TYPES = ("mcq", "short_answer")
+
+
+class LLMJSONError(ValueError):
+    """Raised when no usable JSON value can be recovered from the model output."""
+
+
+# ----------------- Parse statistics -----------------
+_stats_lock = threading.Lock()
+_parse_stats: Dict[str, Dict[str, int]] = {}
+
+
+def record_parse(schema: str, outcome: str, count: int = 1):
+    """outcome: clean | repaired | failed | invalid_items | rerequested_items"""
+    with _stats_lock:
+        bucket = _parse_stats.setdefault(schema, {})
+        bucket[outcome] = bucket.get(outcome, 0) + count
+
+
+def parse_stats() -> Dict[str, Dict[str, int]]:
+    with _stats_lock:
+        return {schema: dict(counts) for schema, counts in _parse_stats.items()}
+
+
+# ----------------- Scanning helpers -----------------
+def _strip_fences(text: str) -> str:
+    """Returns the body of the first ``` fenced block, or the text unchanged."""
+    start = text.find("```")
+    if start < 0:
+        return text
+    body_start = text.find("\n", start)
+    if body_start < 0:
+        return text
+    end = text.find("```", body_start)
+    return text[body_start + 1:end] if end >= 0 else text[body_start + 1:]
+
+
+def _find_starts(text: str, expect: Optional[str], limit: int = MAX_START_CANDIDATES) -> List[int]:
+    """Positions of the first `limit` openers; prose before the JSON may contain braces too."""
+    openers = {"object": "{", "array": "["}.get(expect, "{[")
+    return [i for i, ch in enumerate(text) if ch in openers][:limit]
+
+
+def _looks_like_json(candidate: str) -> bool:
+    """'{"key"...' or '[{' / '["' / '[1' rather than a brace in prose like '{x}'."""
+    inner = candidate[1:].lstrip()
+    return bool(inner) and (inner[0] == '"' if candidate[0] == "{" else inner[0] in '{["-0123456789]')
+
+
+def _scan(text: str, start: int):
+    """
+    Walks a JSON value starting at `start`.
+    Returns (end_index or -1 if truncated, last_safe_cut, stack_at_safe_cut).
+    A safe cut is a position where everything before it is a sequence of
+    complete values, so closing the open containers yields valid JSON.
+    """
+    stack: List[str] = []
+    in_string = False
+    escape = False
+    safe_cut, safe_stack = start, []
+    for i in range(start, len(text)):
+        ch = text[i]
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+            safe_cut, safe_stack = i + 1, list(stack)
+        elif ch in "}]":
+            if not stack:
+                return i, safe_cut, safe_stack
+            stack.pop()
+            if not stack:
+                return i, safe_cut, safe_stack
+            safe_cut, safe_stack = i + 1, list(stack)
+        elif ch == ",":
+            safe_cut, safe_stack = i, list(stack)
+    return -1, safe_cut, safe_stack
+
+
+def _strip_trailing_commas(text: str) -> str:
+    out = []
+    in_string = False
+    escape = False
+    for i, ch in enumerate(text):
+        if in_string:
+            out.append(ch)
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch == ",":
+            j = i + 1
+            while j < len(text) and text[j] in " \t\r\n":
+                j += 1
+            if j < len(text) and text[j] in "}]":
+                continue
+        out.append(ch)
+    return "".join(out)
+
+
+def _close_truncated(text: str, cut: int, stack: List[str], start: int) -> str:
+    """Cuts at the last complete value and closes every still-open container."""
+    body = text[start:cut].rstrip()
+    while body.endswith(",") or body.endswith(":"):
+        if body.endswith(":"):
+            # dangling key: drop it together with its quotes
+            key_start = body.rfind('"', 0, body.rfind('"'))
+            body = body[:key_start].rstrip()
+        else:
+            body = body[:-1].rstrip()
+    return body + "".join(reversed(stack))
+
+
+# ----------------- Public API -----------------
+def extract_json(text: Any, expect: Optional[str] = None, schema: str = "generic") -> Tuple[Any, str]:
+    """
+    Finds and parses the JSON object/array in `text` (a string or a LangChain
+    message). expect is "object", "array" or None for either.
+    Returns (value, status) where status is "clean" or "repaired".
+    Raises LLMJSONError if nothing usable can be recovered.
+    """
+    with stage(schema, "parse_json"):
+        return _extract_json(text, expect, schema)
+
+
+def _extract_json(text: Any, expect: Optional[str], schema: str) -> Tuple[Any, str]:
+    raw = text.content if hasattr(text, "content") else str(text)
+    raw = raw.strip()
+
+    try:
+        value = json.loads(raw)
+        if expect is None or isinstance(value, dict if expect == "object" else list):
+            record_parse(schema, "clean")
+            return value, "clean"
+    except json.JSONDecodeError:
+        pass
+
+    body = _strip_fences(raw)
+    starts = _find_starts(body, expect)
+    if not starts:
+        record_parse(schema, "failed")
+        raise LLMJSONError(f"No JSON {expect or 'value'} found in model output: {raw[:500]}")
+
+    # Complete values first, from each candidate start in order ("Use {x} notation ... {...}")
+    truncated = None
+    skip_until = -1
+    for start in starts:
+        if start <= skip_until:
+            continue
+        end, safe_cut, safe_stack = _scan(body, start)
+        if end < 0:
+            # Runs to the end of the output, so every later start is inside it
+            truncated = (start, safe_cut, safe_stack)
+            break
+        candidate = body[start:end + 1]
+        for attempt, status in ((candidate, "clean"), (_strip_trailing_commas(candidate), "repaired")):
+            try:
+                value = json.loads(attempt)
+            except json.JSONDecodeError:
+                continue
+            record_parse(schema, status)
+            return value, status
+        if _looks_like_json(candidate):
+            # Broken JSON rather than prose: don't return a fragment of it
+            skip_until = end
+
+    # Then the first value cut off by the token limit, closed at its last complete element
+    if truncated is not None:
+        start, safe_cut, safe_stack = truncated
+        try:
+            value = json.loads(_strip_trailing_commas(_close_truncated(body, safe_cut, safe_stack, start)))
+            record_parse(schema, "repaired")
+            return value, "repaired"
+        except json.JSONDecodeError:
+            pass
+
+    record_parse(schema, "failed")
+    raise LLMJSONError(f"Model returned invalid JSON: {raw[:500]}")
+
+
+class StreamingArrayParser:
+    """
+    Incremental extraction of the objects inside the array stored under
+    `array_key` (e.g. "questions", "slides") while the model is still
+    streaming. feed() returns the objects completed by the new text.
+    `prefix` holds everything before the key once it has been seen.
+    """
+
+    def __init__(self, array_key: str):
+        self.array_key = array_key
+        self.buffer = ""
+        self.prefix: Optional[str] = None
+        self._pos = -1
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._obj_start = -1
+        self.closed = False
+
+    def feed(self, text: str) -> List[Any]:
+        self.buffer += text
+        completed: List[Any] = []
+
+        if self._pos < 0:
+            key_pos = self.buffer.find(f'"{self.array_key}"')
+            if key_pos < 0:
+                return completed
+            bracket = self.buffer.find("[", key_pos)
+            if bracket < 0:
+                return completed
+            self.prefix = self.buffer[:key_pos]
+            self._pos = bracket + 1
+
+        while self._pos < len(self.buffer) and not self.closed:
+            ch = self.buffer[self._pos]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch == "{":
+                if self._depth == 0:
+                    self._obj_start = self._pos
+                self._depth += 1
+            elif ch == "}":
+                self._depth -= 1
+                if self._depth == 0 and self._obj_start >= 0:
+                    raw = self.buffer[self._obj_start:self._pos + 1]
+                    self._obj_start = -1
+                    try:
+                        completed.append(json.loads(_strip_trailing_commas(raw)))
+                    except json.JSONDecodeError:
+                        pass
+            elif ch == "]" and self._depth == 0:
+                self.closed = True
+            self._pos += 1
+
+        return completed
+
+    def parse_prefix(self, wrapper_key: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Parses the partial object that precedes the array (title, topic, metadata...)."""
+        if self.prefix is None:
+            return None
+        start = self.prefix.find("{")
+        if start < 0:
+            return None
+        partial = self.prefix[start:].rstrip().rstrip(",")
+        try:
+            value, _ = extract_json(partial + "}" * (2 if wrapper_key else 1), expect="object", schema="stream_prefix")
+        except LLMJSONError:
+            return None
+        if wrapper_key:
+            value = value.get(wrapper_key) if isinstance(value, dict) else None
+        return value if isinstance(value, dict) else None
+
+
+# ----------------- Schema validation -----------------
+def is_valid_question(q: Any) -> bool:
+    if not isinstance(q, dict) or q.get("type") not in QUESTION_TYPES:
+        return False
+    if not isinstance(q.get("question"), str) or not q["question"].strip():
+        return False
+    if not isinstance(q.get("correct_answer"), (str, int, float)) or not str(q["correct_answer"]).strip():
+        return False
+    if q["type"] == "mcq":
+        options = q.get("options")
+        if not isinstance(options, list) or len(options) < 2:
+            return False
+        if str(q["correct_answer"]).strip().lower() not in [str(o).strip().lower() for o in options]:
+            return False
+    return True
+
+
+def normalize_question(q: Dict[str, Any], index: int) -> Dict[str, Any]:
+    q = dict(q)
+    q["id"] = str(q.get("id") or f"q{index + 1}")
+    q["correct_answer"] = str(q["correct_answer"])
+    q.setdefault("explanation", "")
+    return q
+
+
+def split_valid_questions(questions: Any) -> Tuple[List[Dict[str, Any]], int]:
+    """Returns (valid questions, number of broken ones)."""
+    if not isinstance(questions, list):
+        return [], 0
+    valid = [normalize_question(q, i) for i, q in enumerate(questions) if is_valid_question(q)]
+    return valid, len(questions) - len(valid)
+
+
+def is_valid_slide(slide: Any) -> bool:
+    if not isinstance(slide, dict) or slide.get("slide_type") not in SLIDE_TYPES:
+        return False
+    if not isinstance(slide.get("slide_title"), str):
+        return False
+    content = slide.get("slide_content")
+    if isinstance(content, list):
+        return bool(content) and all(isinstance(item, str) for item in content)
+    return isinstance(content, str) and bool(content.strip())
+
+
+def valid_flashcard_questions(value: Any) -> List[str]:
+    if isinstance(value, dict):
+        value = value.get("questions", [])
+    if not isinstance(value, list):
+        return []
+    return [q.strip() for q in value if isinstance(q, str) and q.strip()]
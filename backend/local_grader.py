@@ -0,0 +1,222 @@
+# backend/local_grader.py
+
+import re
+import sys
+import json
+import math
+import string
+from difflib import SequenceMatcher
+from typing import Optional, Dict, Any, List, Tuple
+
+# ============= SETTINGS ============
+# Integer answers (years, counts) must match exactly; decimal answers are
+# accepted when they agree to the decimal places the expected answer gives
+NUMERIC_ABS_TOLERANCE = 1e-9
+FUZZY_ACCEPT = 0.90            # SequenceMatcher ratio above which we accept a one-word answer (typos)
+EMBED_ACCEPT = 0.85            # MiniLM cosine above which we accept
+EMBED_REJECT = 0.15            # MiniLM cosine below which we reject as off-topic
+MIN_JUNK_ALNUM = 1             # answers with fewer alphanumeric chars are junk
+# ==================================
+
+_ARTICLES = {"a", "an", "the"}
+_PUNCT_TABLE = str.maketrans({c: " " for c in string.punctuation if c not in ".-"})
+_THOUSANDS_RE = re.compile(r"(?<=\d),(?=\d{3}\b)")
+_NUMBER_RE = re.compile(r"^[-+]?(\d+(\.\d*)?|\.\d+)([eE][-+]?\d+)?$")
+# A one-word answer and its negation differ by a few letters: "permeable" / "impermeable"
+_NEGATION_PREFIXES = ("non", "un", "in", "im", "il", "ir", "dis", "anti", "a")
+_NEGATION_WORDS = {"not", "no", "never", "cannot", "without"}
+
+
+def normalize_answer(text: str) -> str:
+    """Lowercase, drop punctuation and articles, collapse whitespace."""
+    text = (text or "").lower().translate(_PUNCT_TABLE)
+    words = [w.rstrip(".") for w in text.split()]
+    return " ".join(w for w in words if w.strip("-") and w not in _ARTICLES)
+
+
+def _parse_number(text: str) -> Optional[Tuple[float, str, Optional[str]]]:
+    """
+    (value, literal, unit) if the answer is a single number optionally followed
+    by one unit word ("5 km" -> (5.0, "5", "km")), else None.
+    """
+    # Thousands separators go before normalize_answer turns commas into spaces
+    tokens = normalize_answer(_THOUSANDS_RE.sub("", text or "")).split()
+    if not tokens or len(tokens) > 2 or not _NUMBER_RE.match(tokens[0]):
+        return None
+    try:
+        return float(tokens[0]), tokens[0], (tokens[1] if len(tokens) == 2 else None)
+    except ValueError:
+        return None
+
+
+def _numeric_tolerance(literal: str) -> Optional[float]:
+    """None for an integer literal (exact match only); half a unit in the last given decimal place otherwise."""
+    mantissa, _, exponent = literal.lower().lstrip("+-").partition("e")
+    if "." not in mantissa and not exponent:
+        return None
+    decimals = len(mantissa.partition(".")[2]) - int(exponent or 0)
+    return 0.5 * 10 ** -decimals + NUMERIC_ABS_TOLERANCE
+
+
+def _is_negation_pair(a: str, b: str) -> bool:
+    a, b = a.replace("-", ""), b.replace("-", "")
+    return any(a == prefix + b or b == prefix + a for prefix in _NEGATION_PREFIXES)
+
+
+def _negation_count(words: List[str]) -> int:
+    # normalize_answer turns "isn't" into "isn t"
+    return sum(1 for w in words if w in _NEGATION_WORDS or w == "t")
+
+
+def _differs_by_negation(user_norm: str, correct_norm: str) -> bool:
+    """True when one answer negates the other ("not permeable", "impermeable")."""
+    user_words, correct_words = user_norm.split(), correct_norm.split()
+    if _negation_count(user_words) % 2 != _negation_count(correct_words) % 2:
+        return True
+    extra_user, extra_correct = set(user_words) - set(correct_words), set(correct_words) - set(user_words)
+    return any(_is_negation_pair(u, c) for u in extra_user for c in extra_correct)
+
+
+def _cosine(a: List[float], b: List[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+def local_grade_short_answer(user_answer: str, correct_answer: str, embeddings=None) -> Optional[Dict[str, Any]]:
+    """
+    Tries to grade a short answer without the LLM.
+    Returns {'is_correct', 'tier', 'confidence', 'llm_explanation'} when the
+    verdict is clear-cut, or None when the answer is ambiguous and should go
+    to semantically_grade_short_answer.
+    """
+    user_norm = normalize_answer(user_answer)
+    correct_norm = normalize_answer(correct_answer)
+
+    # Tier 0: junk (no letters or digits at all)
+    if sum(ch.isalnum() for ch in user_answer) < MIN_JUNK_ALNUM:
+        return {
+            'is_correct': False,
+            'tier': 'junk',
+            'confidence': 1.0,
+            'llm_explanation': f"Your answer did not contain a recognisable response. The expected answer was: {correct_answer}."
+        }
+
+    # Tier 1: normalized exact match
+    if user_norm and user_norm == correct_norm:
+        return {
+            'is_correct': True,
+            'tier': 'exact',
+            'confidence': 1.0,
+            'llm_explanation': f"Correct. Your answer matches the expected answer: {correct_answer}."
+        }
+
+    # Tier 2: numeric answers (exact for integers, to the given precision for decimals)
+    expected = _parse_number(correct_answer)
+    given = _parse_number(user_answer) if expected is not None else None
+    if expected is not None and given is not None:
+        expected_num, expected_literal, expected_unit = expected
+        given_num, _, given_unit = given
+        # "5 km" vs "5 m", or a unit on one side only: the LLM decides
+        if expected_unit != given_unit:
+            return None
+        tolerance = _numeric_tolerance(expected_literal)
+        is_correct = given_num == expected_num if tolerance is None else abs(given_num - expected_num) <= tolerance
+        return {
+            'is_correct': is_correct,
+            'tier': 'numeric',
+            'confidence': 1.0,
+            'llm_explanation': (
+                f"Correct. {user_answer} matches the expected value {correct_answer}."
+                if is_correct else
+                f"Incorrect. You answered {user_answer}, but the expected value was {correct_answer}."
+            )
+        }
+
+    # A negation ("not permeable", "impermeable") flips the meaning while the
+    # text and its embedding stay close to the expected answer
+    if _differs_by_negation(user_norm, correct_norm):
+        return None
+
+    # Tier 3: fuzzy string similarity, for typos in one-word answers only; in
+    # longer answers one changed word can change the meaning
+    single_word = len(user_norm.split()) == 1 and len(correct_norm.split()) == 1
+    ratio = SequenceMatcher(None, user_norm, correct_norm).ratio() if single_word else 0.0
+    if ratio >= FUZZY_ACCEPT:
+        return {
+            'is_correct': True,
+            'tier': 'fuzzy',
+            'confidence': round(ratio, 3),
+            'llm_explanation': f"Correct. Your answer closely matches the expected answer: {correct_answer}."
+        }
+
+    # Tier 4: embedding cosine similarity with the already-loaded MiniLM model
+    if embeddings is not None:
+        try:
+            user_vec, correct_vec = embeddings.embed_documents([user_answer, correct_answer])
+            similarity = _cosine(user_vec, correct_vec)
+        except Exception as e:
+            print(f"Local embedding grading failed: {e}")
+            return None
+        if similarity >= EMBED_ACCEPT:
+            return {
+                'is_correct': True,
+                'tier': 'embedding',
+                'confidence': round(similarity, 3),
+                'llm_explanation': f"Correct. Your answer means the same as the expected answer: {correct_answer}."
+            }
+        if similarity <= EMBED_REJECT:
+            return {
+                'is_correct': False,
+                'tier': 'embedding',
+                'confidence': round(1 - similarity, 3),
+                'llm_explanation': f"Your answer does not address the question. The expected answer was: {correct_answer}."
+            }
+
+    # Ambiguous: leave it to the LLM
+    return None
+
+
+def measure_llm_avoidance(recorded_submissions: List[Dict[str, Any]], embeddings=None) -> Dict[str, Any]:
+    """
+    Replays recorded quiz submissions ({"quiz_data": ..., "user_answers": ...})
+    through the local tier and reports how many LLM calls it would avoid.
+    """
+    tiers: Dict[str, int] = {}
+    short_answers = 0
+    for submission in recorded_submissions:
+        user_answers = submission.get("user_answers", {})
+        for q in submission["quiz_data"]["quiz"]["questions"]:
+            if q.get("type") != "short_answer":
+                continue
+            answer = user_answers.get(f"answer-{q['id']}", "").strip()
+            if not answer:
+                continue
+            short_answers += 1
+            result = local_grade_short_answer(answer, q["correct_answer"].strip(), embeddings)
+            tier = result['tier'] if result else 'llm'
+            tiers[tier] = tiers.get(tier, 0) + 1
+
+    avoided = short_answers - tiers.get('llm', 0)
+    return {
+        'short_answers': short_answers,
+        'tiers': tiers,
+        'llm_calls_avoided': avoided,
+        'llm_calls_avoided_pct': round(100 * avoided / short_answers, 1) if short_answers else 0.0
+    }
+
+
+# Run standalone: python -m backend.local_grader recorded_submissions.jsonl [--embeddings]
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python -m backend.local_grader <recorded_submissions.jsonl> [--embeddings]")
+        sys.exit(1)
+
+    model = None
+    if "--embeddings" in sys.argv:
+        from langchain_huggingface import HuggingFaceEmbeddings
+        model = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
+
+    with open(sys.argv[1]) as f:
+        submissions = [json.loads(line) for line in f if line.strip()]
+    print(json.dumps(measure_llm_avoidance(submissions, model), indent=2))
@@ -61,9 +61,14 @@
 #     indexer(embeddings, "ec2", "what is ec2?")
 
 import os
-from langchain_community.vectorstores import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_groq import ChatGroq  # ✅ Groq LLM
+from typing import Optional
+# Chroma / ChatGroq are imported inside the functions that use them so
+# importing this module (at app startup) stays cheap.
+from backend.metrics import stage, invoke_llm, ainvoke_llm
+from backend.async_llm import run_blocking
+from backend.index_versions import open_index, current_path
+from backend import book_artifacts
+from backend.retrieval_filters import PageRange, filtered
 
 # Embeddings model
 # embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
@@ -93,36 +98,42 @@ def load_index(book_name: str, embeddings):
     normalized_name = normalize_book_name(book_name)
     book_index_folder = os.path.join(INDEX_FOLDER, normalized_name)
 
-    if not os.path.exists(book_index_folder) or not os.listdir(book_index_folder):
+    if current_path(normalized_name, INDEX_FOLDER) is None:
         raise FileNotFoundError(
             f"No Chroma index found for '{book_name}' in {book_index_folder}. "
             "Please create the index first."
         )
 
     print(f"Loading existing index for '{book_name}'...")
-    return Chroma(
-        persist_directory=book_index_folder,
-        embedding_function=embeddings
-    )
+    # Pins the live version so a concurrent re-index can't swap it out mid-query
+    return open_index(normalized_name, embeddings, INDEX_FOLDER)
 
 
-def query_book_content(embeddings, book_name: str, query: str) -> str:
+def _retrieve_context(embeddings, book_name: str, query: str, page_range: Optional[PageRange] = None) -> list:
     """
-    Query a book's Chroma index, pass context to Groq LLM,
-    and return ONLY the LLM's response.
+    Top chunks of the book for the query (blocking: index open, embedding, search).
+    With a page_range only chunks on those pages are searched.
     """
-    try:
-        db = load_index(book_name, embeddings)
-        results = db.similarity_search(query, k=8)  # retrieve top-3 chunks for richer context
-
-        # Gather context
-        context = [res.page_content for res in results]
+    with stage("query_book", "load_index", book=book_name):
+        db = filtered(load_index(book_name, embeddings), page_range)
+    # Embed and search separately so each shows up as its own stage
+    with stage("query_book", "embed_query"):
+        query_vector = embeddings.embed_query(query)
+    with stage("query_book", "similarity_search", book=book_name, k=8):
+        results = db.similarity_search_by_vector(query_vector, k=8)  # retrieve top-3 chunks for richer context
+
+    # Gather context; the summary of the closest chapter gives the chunks their setting
+    context = [res.page_content for res in results]
+    chapter = book_artifacts.nearest_chapter(
+        book_name, query_vector, *((page_range.start, page_range.end) if page_range else ())
+    )
+    if chapter and chapter.get("summary"):
+        context.insert(0, f"Chapter \"{chapter['title']}\" (pages {chapter['start_page']}-{chapter['end_page']}): {chapter['summary']}")
+    return context
 
-        # Initialize Groq LLM
-        llm = ChatGroq(model=LLM_MODEL, groq_api_key=GROQ_API_KEY)
 
-        # Prepare prompt for RAG
-        rag_prompt = f"""
+def _rag_prompt(context: list, query: str) -> str:
+    return f"""
         You are a helpful assistant answering questions about a book.  
 
         - If relevant context is provided, use it to guide your answer.  
@@ -139,7 +150,19 @@ def query_book_content(embeddings, book_name: str, query: str) -> str:
         """
 
 
-        llm_response = llm.invoke(rag_prompt)
+def query_book_content(embeddings, book_name: str, query: str, page_range: Optional[PageRange] = None) -> str:
+    """
+    Query a book's Chroma index (optionally only a chapter / page range),
+    pass context to Groq LLM, and return ONLY the LLM's response.
+    """
+    try:
+        context = _retrieve_context(embeddings, book_name, query, page_range)
+
+        # Initialize Groq LLM
+        from langchain_groq import ChatGroq
+        llm = ChatGroq(model=LLM_MODEL, groq_api_key=GROQ_API_KEY)
+
+        llm_response = invoke_llm(llm, _rag_prompt(context, query), "query_book")
 
         # ✅ Return only the LLM response
         return llm_response.content if hasattr(llm_response, "content") else str(llm_response)
@@ -148,6 +171,29 @@ def query_book_content(embeddings, book_name: str, query: str) -> str:
         return f"Error: {str(e)}"
 
 
+_async_llm = None
+
+
+def _shared_async_llm():
+    # One client per worker on the async path, so its connection pool is reused
+    global _async_llm
+    if _async_llm is None:
+        from langchain_groq import ChatGroq
+        _async_llm = ChatGroq(model=LLM_MODEL, groq_api_key=GROQ_API_KEY)
+    return _async_llm
+
+
+async def query_book_content_async(embeddings, book_name: str, query: str, page_range: Optional[PageRange] = None) -> str:
+    """query_book_content for the async serving path: retrieval on the blocking pool, LLM awaited."""
+    try:
+        context = await run_blocking(_retrieve_context, embeddings, book_name, query, page_range)
+        llm_response = await ainvoke_llm(_shared_async_llm(), _rag_prompt(context, query), "query_book")
+        return llm_response.content if hasattr(llm_response, "content") else str(llm_response)
+
+    except Exception as e:
+        return f"Error: {str(e)}"
+
+
 # # Run standalone (for testing)
 # if __name__ == "__main__":
 #     result = query_book_content(embeddings, "ec2.pdf", "what is ec2?")
@@ -0,0 +1,234 @@
+# backend/metrics.py
+#
+# In-process instrumentation exposed in Prometheus text format on /metrics.
+# Pipelines wrap their steps in stage("query_book", "similarity_search")
+# and report LLM usage / cache lookups through the helpers below, so a slow
+# request can be broken down into load_index, embedding, retrieval, the
+# Groq call and JSON parsing instead of guessing from print statements.
+# Each process keeps its own registry; under gunicorn, scrape every worker
+# or aggregate with sum() by the `pid` label.
+
+import os
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from typing import Dict, Tuple, Optional, Sequence, Any
+
+from backend.tracing import span, set_attributes
+
+# ============= SETTINGS ============
+# Seconds; covers sub-millisecond cache hits up to multi-minute slide decks
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+# ==================================
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in values)
+    return "{" + ",".join(f'{n}="{v}"' for n, v in zip(names, escaped)) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            return self._values.get(key, 0)
+
+    def render(self, extra_names=(), extra_values=()):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames + extra_names, key + extra_values)} {value:g}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [bucket counts..., +Inf count, sum]
+        self._values: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def summary(self, **labels) -> Dict[str, float]:
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                return {'count': 0, 'sum': 0.0}
+            return {'count': sum(series[:-1]), 'sum': series[-1]}
+
+    def render(self, extra_names=(), extra_values=()):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        names = self.labelnames + extra_names + ("le",)
+        with self._lock:
+            for key, series in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), series[:-1]):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                    lines.append(f"{self.name}_bucket{_format_labels(names, key + extra_values + (le,))} {cumulative}")
+                base = _format_labels(self.labelnames + extra_names, key + extra_values)
+                lines.append(f"{self.name}_sum{base} {series[-1]:.6f}")
+                lines.append(f"{self.name}_count{base} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name, help_text, labelnames=()) -> Counter:
+        metric = Counter(name, help_text, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, help_text, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        # The pid label keeps series from different gunicorn workers apart
+        lines = []
+        for metric in self._metrics:
+            lines += metric.render(("pid",), (str(os.getpid()),))
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+HTTP_REQUEST_SECONDS = registry.histogram(
+    "learnly_http_request_duration_seconds",
+    "Time until the response is returned (streamed bodies continue after this)",
+    ("route", "method", "status"),
+)
+STAGE_SECONDS = registry.histogram(
+    "learnly_stage_duration_seconds",
+    "Duration of one pipeline stage (load_index, embed_query, similarity_search, llm, parse_json, render...)",
+    ("pipeline", "stage"),
+)
+STAGE_ERRORS = registry.counter(
+    "learnly_stage_errors_total",
+    "Pipeline stages that raised",
+    ("pipeline", "stage"),
+)
+LLM_CALLS = registry.counter(
+    "learnly_llm_calls_total",
+    "LLM requests by outcome (ok / error)",
+    ("pipeline", "outcome"),
+)
+LLM_TOKENS = registry.counter(
+    "learnly_llm_tokens_total",
+    "Tokens sent to (in) and received from (out) the LLM",
+    ("pipeline", "direction"),
+)
+CACHE_LOOKUPS = registry.counter(
+    "learnly_cache_lookups_total",
+    "Cache lookups by cache and result (hit / miss)",
+    ("cache", "result"),
+)
+
+
+@contextmanager
+def stage(pipeline: str, name: str, **attrs):
+    """
+    Times a block into learnly_stage_duration_seconds; exceptions are counted
+    and re-raised. In a sampled request the block is also a trace span
+    "<pipeline>.<name>" carrying attrs (book, k...).
+    """
+    start = time.perf_counter()
+    try:
+        with span(f"{pipeline}.{name}", **attrs):
+            yield
+    except BaseException:
+        STAGE_ERRORS.inc(pipeline=pipeline, stage=name)
+        raise
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, pipeline=pipeline, stage=name)
+
+
+def record_llm_call(pipeline: str, ok: bool = True, prompt_tokens: Optional[int] = None, completion_tokens: Optional[int] = None):
+    LLM_CALLS.inc(pipeline=pipeline, outcome="ok" if ok else "error")
+    set_attributes(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+    if prompt_tokens:
+        LLM_TOKENS.inc(prompt_tokens, pipeline=pipeline, direction="in")
+    if completion_tokens:
+        LLM_TOKENS.inc(completion_tokens, pipeline=pipeline, direction="out")
+
+
+def record_openai_usage(pipeline: str, data: Any):
+    """Token usage from a Groq/OpenAI-style response body ({"usage": {...}})."""
+    usage = (data.get("usage") if isinstance(data, dict) else None) or {}
+    record_llm_call(pipeline, True, usage.get("prompt_tokens"), usage.get("completion_tokens"))
+
+
+def record_langchain_usage(pipeline: str, message: Any):
+    """Token usage from a LangChain chat message (usage_metadata or response_metadata)."""
+    usage = getattr(message, "usage_metadata", None) or {}
+    if usage:
+        record_llm_call(pipeline, True, usage.get("input_tokens"), usage.get("output_tokens"))
+        return
+    token_usage = (getattr(message, "response_metadata", None) or {}).get("token_usage") or {}
+    record_llm_call(pipeline, True, token_usage.get("prompt_tokens"), token_usage.get("completion_tokens"))
+
+
+def invoke_llm(llm, prompt, pipeline: str):
+    """llm.invoke(prompt) timed as the pipeline's "llm" stage, with call and token counters."""
+    try:
+        with stage(pipeline, "llm"):
+            message = llm.invoke(prompt)
+            record_langchain_usage(pipeline, message)
+    except Exception:
+        record_llm_call(pipeline, ok=False)
+        raise
+    return message
+
+
+async def ainvoke_llm(llm, prompt, pipeline: str):
+    """Awaitable invoke_llm for the async serving path (llm.ainvoke)."""
+    try:
+        with stage(pipeline, "llm"):
+            message = await llm.ainvoke(prompt)
+            record_langchain_usage(pipeline, message)
+    except Exception:
+        record_llm_call(pipeline, ok=False)
+        raise
+    return message
+
+
+def record_cache(cache: str, hit: bool):
+    CACHE_LOOKUPS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+def render_prometheus() -> str:
+    return registry.render()
+
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
@@ -0,0 +1,392 @@
+# backend/quiz_bank.py
+
+import os
+import json
+import math
+import time
+import random
+import sqlite3
+import hashlib
+import datetime
+import threading
+from typing import Optional, Dict, Any, List, Callable, Tuple
+
+from backend.database import transaction, query_one, query_all, bulk_insert
+from backend.metrics import CACHE_LOOKUPS
+
+# ============= SETTINGS ============
+TOPIC_MATCH_THRESHOLD = 0.80     # MiniLM cosine above which two topics share questions
+POPULAR_MIN_REQUESTS = 3         # topic requests before it is pre-generated
+BANK_TARGET_PER_TOPIC = 30       # questions to keep per topic/difficulty
+PREGENERATE_BATCH = 10           # questions per pre-generation LLM call
+PREGENERATE_INTERVAL_SECONDS = int(os.getenv("QUIZ_PREGENERATE_INTERVAL", "900"))
+# ==================================
+
+_topic_vectors: Dict[str, List[float]] = {}   # topic_norm -> embedding, loaded lazily
+_topic_vectors_loaded = False
+_topic_lock = threading.Lock()
+
+
+def normalize_topic(topic: str) -> str:
+    return " ".join((topic or "").lower().split())
+
+
+def _cosine(a: List[float], b: List[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+def _question_hash(q: Dict[str, Any]) -> str:
+    key = " ".join(str(q.get("question", "")).lower().split()) + "\x1f" + str(q.get("correct_answer", "")).strip().lower()
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def _new_topic_vector(topic: str, embeddings=None) -> Optional[List[float]]:
+    """
+    Embeds a topic the bank hasn't seen yet. Called before the write
+    transaction is opened so the model doesn't run while holding the lock.
+    """
+    topic_norm = normalize_topic(topic)
+    if embeddings is None or query_one('SELECT 1 FROM quiz_topics WHERE topic_norm = ?', (topic_norm,)):
+        return None
+    try:
+        return embeddings.embed_query(topic_norm)
+    except Exception as e:
+        print(f"Topic embedding failed: {e}")
+        return None
+
+
+def _ensure_topic(conn, topic: str, vector: Optional[List[float]] = None, count_request: bool = False) -> str:
+    """Registers a topic (with its embedding) and optionally bumps its request counter."""
+    topic_norm = normalize_topic(topic)
+    row = conn.execute('SELECT embedding FROM quiz_topics WHERE topic_norm = ?', (topic_norm,)).fetchone()
+    if row is None:
+        conn.execute(
+            'INSERT INTO quiz_topics (topic_norm, topic, embedding) VALUES (?, ?, ?)',
+            (topic_norm, topic, json.dumps(vector) if vector else None)
+        )
+        if vector:
+            with _topic_lock:
+                _topic_vectors[topic_norm] = vector
+    if count_request:
+        conn.execute(
+            'UPDATE quiz_topics SET request_count = request_count + 1, last_requested = CURRENT_TIMESTAMP WHERE topic_norm = ?',
+            (topic_norm,)
+        )
+    return topic_norm
+
+
+def _matching_topics(conn, topic_norm: str, embeddings=None) -> List[str]:
+    """The topic itself plus any stored topics whose embedding is close enough."""
+    matches = [topic_norm]
+    if embeddings is None:
+        return matches
+
+    global _topic_vectors_loaded
+    with _topic_lock:
+        if not _topic_vectors_loaded:
+            for name, vector in conn.execute('SELECT topic_norm, embedding FROM quiz_topics WHERE embedding IS NOT NULL'):
+                _topic_vectors[name] = json.loads(vector)
+            _topic_vectors_loaded = True
+        candidates = dict(_topic_vectors)
+
+    target = candidates.get(topic_norm)
+    if target is None:
+        return matches
+    scored = [(name, _cosine(target, vec)) for name, vec in candidates.items() if name != topic_norm]
+    matches += [name for name, score in sorted(scored, key=lambda x: -x[1]) if score >= TOPIC_MATCH_THRESHOLD]
+    return matches
+
+
+def add_quiz_to_bank(quiz_json: Dict[str, Any], topic: str, difficulty: str, embeddings=None) -> int:
+    """Stores every question of a generated quiz; duplicates are ignored. Returns the number added."""
+    questions = quiz_json.get("quiz", {}).get("questions", [])
+    added = 0
+    try:
+        vector = _new_topic_vector(topic, embeddings)
+        with transaction() as conn:
+            topic_norm = _ensure_topic(conn, topic, vector)
+            rows = [
+                (topic, topic_norm, difficulty.lower(), q["type"], _question_hash(q), json.dumps(q))
+                for q in questions
+                if q.get("type") in ("mcq", "short_answer") and q.get("question") and q.get("correct_answer")
+            ]
+            added = bulk_insert(
+                'quiz_questions',
+                ('topic', 'topic_norm', 'difficulty', 'question_type', 'question_hash', 'question_json'),
+                rows, or_ignore=True
+            )
+    except sqlite3.Error as e:
+        print(f"Quiz bank write failed: {e}")
+    return added
+
+
+def _take_questions(conn, topics: List[str], difficulty: str, question_type: str, limit: int) -> List[Dict[str, Any]]:
+    if limit <= 0:
+        return []
+    placeholders = ",".join("?" for _ in topics)
+    rows = conn.execute(
+        f'''SELECT id, question_json FROM quiz_questions
+            WHERE topic_norm IN ({placeholders}) AND difficulty = ? AND question_type = ?
+            ORDER BY times_served ASC, RANDOM() LIMIT ?''',
+        (*topics, difficulty.lower(), question_type, limit)
+    ).fetchall()
+    if rows:
+        conn.executemany('UPDATE quiz_questions SET times_served = times_served + 1 WHERE id = ?', [(r[0],) for r in rows])
+    return [json.loads(r[1]) for r in rows]
+
+
+def assemble_from_bank(topic: str, num_questions: int, difficulty: str, mcq_percent: int, embeddings=None) -> Tuple[List[Dict[str, Any]], int, int]:
+    """
+    Picks the least-served matching questions from the bank.
+    Returns (questions, missing_mcq, missing_short_answer).
+    """
+    num_mcq = round(num_questions * (mcq_percent / 100))
+    num_short = num_questions - num_mcq
+    try:
+        vector = _new_topic_vector(topic, embeddings)
+        with transaction() as conn:
+            topic_norm = _ensure_topic(conn, topic, vector, count_request=True)
+            topics = _matching_topics(conn, topic_norm, embeddings)
+            mcqs = _take_questions(conn, topics, difficulty, "mcq", num_mcq)
+            shorts = _take_questions(conn, topics, difficulty, "short_answer", num_short)
+    except sqlite3.Error as e:
+        print(f"Quiz bank read failed: {e}")
+        return [], num_mcq, num_short
+    served = len(mcqs) + len(shorts)
+    CACHE_LOOKUPS.inc(served, cache="quiz_bank", result="hit")
+    CACHE_LOOKUPS.inc(num_questions - served, cache="quiz_bank", result="miss")
+    return mcqs + shorts, num_mcq - len(mcqs), num_short - len(shorts)
+
+
+def _wrap_quiz(topic: str, difficulty: str, questions: List[Dict[str, Any]], from_bank: int, shuffle: bool = True) -> Dict[str, Any]:
+    if shuffle:
+        random.shuffle(questions)
+    # Bank questions come from different quizzes, so give them fresh unique ids
+    questions = [dict(q, id=f"q{i + 1}") for i, q in enumerate(questions)]
+    return {
+        "quiz": {
+            "title": f"{topic.strip().title()} Quiz",
+            "topic": topic,
+            "metadata": {
+                "difficulty": difficulty,
+                "num_questions": len(questions),
+                "generated_at": datetime.datetime.now().isoformat(),
+                "from_bank": from_bank,
+                "source": "bank" if from_bank == len(questions) else ("mixed" if from_bank else "llm")
+            },
+            "questions": questions
+        }
+    }
+
+
+def get_or_generate_quiz(
+    generate_fn: Callable[..., Dict[str, Any]],
+    prompt: str,
+    num_questions: int,
+    difficulty: str,
+    mcq_percent: int,
+    embeddings=None
+) -> Dict[str, Any]:
+    """
+    Assembles a quiz from the bank and asks the LLM (generate_fn, e.g.
+    generate_quiz) only for the shortfall. Newly generated questions are
+    added to the bank.
+    """
+    num_questions = int(num_questions)
+    banked, missing_mcq, missing_short = assemble_from_bank(prompt, num_questions, difficulty, mcq_percent, embeddings)
+    shortfall = missing_mcq + missing_short
+    print(f"Quiz bank: {len(banked)} from bank, {shortfall} to generate")
+
+    if shortfall == 0:
+        return _wrap_quiz(prompt, difficulty, banked, len(banked))
+
+    generated = generate_fn(
+        prompt=prompt,
+        num_questions=shortfall,
+        difficulty=difficulty,
+        mcq_percent=round(100 * missing_mcq / shortfall)
+    )
+    add_quiz_to_bank(generated, prompt, difficulty, embeddings)
+
+    if not banked:
+        return generated
+    new_questions = generated.get("quiz", {}).get("questions", [])
+    return _wrap_quiz(prompt, difficulty, banked + new_questions, len(banked))
+
+
+async def get_or_generate_quiz_async(
+    agenerate_fn: Callable[..., Any],
+    prompt: str,
+    num_questions: int,
+    difficulty: str,
+    mcq_percent: int,
+    embeddings=None
+) -> Dict[str, Any]:
+    """get_or_generate_quiz with an awaitable generator (generate_quiz_async); bank I/O runs on the blocking pool."""
+    from backend.async_llm import run_blocking
+
+    num_questions = int(num_questions)
+    banked, missing_mcq, missing_short = await run_blocking(
+        assemble_from_bank, prompt, num_questions, difficulty, mcq_percent, embeddings
+    )
+    shortfall = missing_mcq + missing_short
+    print(f"Quiz bank: {len(banked)} from bank, {shortfall} to generate")
+
+    if shortfall == 0:
+        return _wrap_quiz(prompt, difficulty, banked, len(banked))
+
+    generated = await agenerate_fn(
+        prompt=prompt,
+        num_questions=shortfall,
+        difficulty=difficulty,
+        mcq_percent=round(100 * missing_mcq / shortfall)
+    )
+    await run_blocking(add_quiz_to_bank, generated, prompt, difficulty, embeddings)
+
+    if not banked:
+        return generated
+    new_questions = generated.get("quiz", {}).get("questions", [])
+    return _wrap_quiz(prompt, difficulty, banked + new_questions, len(banked))
+
+
+def stream_quiz_with_bank(
+    stream_fn: Callable[..., Any],
+    prompt: str,
+    num_questions: int,
+    difficulty: str,
+    mcq_percent: int,
+    embeddings=None
+):
+    """
+    Streaming counterpart of get_or_generate_quiz: banked questions are
+    emitted immediately, then the shortfall is streamed from stream_fn
+    (e.g. generate_quiz_stream). Yields the same events as generate_quiz_stream.
+    """
+    num_questions = int(num_questions)
+    banked, missing_mcq, missing_short = assemble_from_bank(prompt, num_questions, difficulty, mcq_percent, embeddings)
+    shortfall = missing_mcq + missing_short
+    random.shuffle(banked)
+    banked = [dict(q, id=f"q{i + 1}") for i, q in enumerate(banked)]
+
+    if banked:
+        header = _wrap_quiz(prompt, difficulty, [], 0)["quiz"]
+        header["metadata"]["num_questions"] = num_questions
+        header.pop("questions")
+        yield {"event": "meta", "quiz": header}
+        for i, q in enumerate(banked):
+            yield {"event": "question", "index": i, "question": q}
+
+    if shortfall == 0:
+        yield {"event": "done", "quiz": _wrap_quiz(prompt, difficulty, banked, len(banked), shuffle=False)}
+        return
+
+    offset = len(banked)
+    for event in stream_fn(
+        prompt=prompt,
+        num_questions=shortfall,
+        difficulty=difficulty,
+        mcq_percent=round(100 * missing_mcq / shortfall)
+    ):
+        if event["event"] == "meta":
+            if not banked:
+                yield event
+        elif event["event"] == "question":
+            yield {
+                "event": "question",
+                "index": offset + event["index"],
+                "question": dict(event["question"], id=f"q{offset + event['index'] + 1}")
+            }
+        elif event["event"] == "done":
+            generated = event["quiz"]
+            add_quiz_to_bank(generated, prompt, difficulty, embeddings)
+            # Same q{n} ids as the question events above, so submitted answers match
+            new_questions = generated.get("quiz", {}).get("questions", [])
+            yield {"event": "done", "quiz": _wrap_quiz(prompt, difficulty, banked + new_questions, len(banked), shuffle=False)}
+        else:
+            yield event
+
+
+def bank_stats() -> Dict[str, Any]:
+    try:
+        total = query_one('SELECT COUNT(*) FROM quiz_questions')[0]
+        by_topic = query_all(
+            '''SELECT topic_norm, difficulty, question_type, COUNT(*) FROM quiz_questions
+               GROUP BY topic_norm, difficulty, question_type ORDER BY COUNT(*) DESC LIMIT 50'''
+        )
+    except sqlite3.Error as e:
+        return {'error': str(e)}
+    return {
+        'total_questions': total,
+        'by_topic': [
+            {'topic': t, 'difficulty': d, 'type': qt, 'count': c} for t, d, qt, c in by_topic
+        ]
+    }
+
+
+# ----------------------------------------------------------------------
+# BACKGROUND PRE-GENERATION
+# ----------------------------------------------------------------------
+
+def pregenerate_popular_topics(generate_fn: Callable[..., Dict[str, Any]], embeddings=None, difficulties=("Easy", "Medium", "Hard")) -> int:
+    """Tops up popular topics to BANK_TARGET_PER_TOPIC questions per difficulty. Returns questions added."""
+    try:
+        topics = query_all(
+            'SELECT topic FROM quiz_topics WHERE request_count >= ? ORDER BY request_count DESC LIMIT 20',
+            (POPULAR_MIN_REQUESTS,)
+        )
+    except sqlite3.Error as e:
+        print(f"Quiz bank pre-generation skipped: {e}")
+        return 0
+
+    added = 0
+    for (topic,) in topics:
+        for difficulty in difficulties:
+            have = query_one(
+                'SELECT COUNT(*) FROM quiz_questions WHERE topic_norm = ? AND difficulty = ?',
+                (normalize_topic(topic), difficulty.lower())
+            )[0]
+            if have >= BANK_TARGET_PER_TOPIC:
+                continue
+            try:
+                quiz_json = generate_fn(
+                    prompt=topic,
+                    num_questions=min(PREGENERATE_BATCH, BANK_TARGET_PER_TOPIC - have),
+                    difficulty=difficulty,
+                    mcq_percent=70
+                )
+            except Exception as e:
+                print(f"Pre-generation failed for '{topic}' ({difficulty}): {e}")
+                continue
+            added += add_quiz_to_bank(quiz_json, topic, difficulty, embeddings)
+    if added:
+        print(f"Quiz bank pre-generation added {added} questions")
+    return added
+
+
+_pregeneration_thread: Optional[threading.Thread] = None
+_pregeneration_lock = threading.Lock()
+
+
+def start_pregeneration_worker(generate_fn: Callable[..., Dict[str, Any]], embeddings=None, interval: int = PREGENERATE_INTERVAL_SECONDS) -> threading.Thread:
+    """
+    Runs pregenerate_popular_topics every `interval` seconds on a daemon
+    thread. Returns the running thread if this process already has one; a
+    forked worker does not inherit its parent's, so it starts its own.
+    """
+    global _pregeneration_thread
+
+    def loop():
+        while True:
+            try:
+                pregenerate_popular_topics(generate_fn, embeddings)
+            except Exception as e:
+                print(f"Quiz bank pre-generation error: {e}")
+            time.sleep(interval)
+
+    with _pregeneration_lock:
+        if _pregeneration_thread is None or not _pregeneration_thread.is_alive():
+            _pregeneration_thread = threading.Thread(target=loop, name="quiz-bank-pregenerate", daemon=True)
+            _pregeneration_thread.start()
+        return _pregeneration_thread
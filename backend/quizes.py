@@ -3,33 +3,76 @@
 import os
 import requests
 import json
+import asyncio
 import datetime
-from typing import Optional, Dict, Any, List
-from concurrent.futures import ThreadPoolExecutor # NEW: For concurrent grading
+import time
+from typing import Optional, Dict, Any, List, Tuple
+from backend.grading_scheduler import grading_scheduler, GRADING_DEADLINE_SECONDS
+from backend.local_grader import local_grade_short_answer
+from backend.grading_cache import verdict_cache, verdict_cache_key
+from backend.metrics import stage, record_llm_call, record_openai_usage, STAGE_SECONDS
+from backend.async_llm import http_client, run_blocking, gather_limited
+from backend.llm_json import (
+    extract_json, record_parse, StreamingArrayParser,
+    is_valid_question, normalize_question, split_valid_questions
+)
 
 # Ensure this is set in your environment
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 GROQ_API_URL = "https://api.groq.com/openai/v1/chat/completions"
 
-def generate_quiz(
+# Per-request cap on concurrent grading calls on the async path
+ASYNC_GRADING_CONCURRENCY = int(os.getenv("ASYNC_GRADING_CONCURRENCY", "8"))
+
+try:
+    import httpx
+    _HTTP_ERRORS: Tuple[type, ...] = (requests.exceptions.RequestException, httpx.HTTPError)
+except ImportError:
+    _HTTP_ERRORS = (requests.exceptions.RequestException,)
+
+def _groq_headers() -> Dict[str, str]:
+    return {
+        "Authorization": f"Bearer {GROQ_API_KEY}",
+        "Content-Type": "application/json"
+    }
+
+def _post_groq(payload: Dict[str, Any], pipeline: str, timeout: Optional[float] = None) -> Dict[str, Any]:
+    """POSTs a chat completion and returns the JSON body, timed as the pipeline's "llm" stage."""
+    try:
+        with stage(pipeline, "llm"):
+            response = requests.post(GROQ_API_URL, headers=_groq_headers(), json=payload, timeout=timeout)
+            response.raise_for_status()
+            data = response.json()
+            record_openai_usage(pipeline, data)
+    except Exception:
+        record_llm_call(pipeline, ok=False)
+        raise
+    return data
+
+async def _apost_groq(payload: Dict[str, Any], pipeline: str, timeout: Optional[float] = None) -> Dict[str, Any]:
+    """Awaitable _post_groq over the worker's shared async connection pool."""
+    try:
+        with stage(pipeline, "llm"):
+            response = await http_client().post(
+                GROQ_API_URL, headers=_groq_headers(), json=payload,
+                **({"timeout": timeout} if timeout is not None else {})
+            )
+            response.raise_for_status()
+            data = response.json()
+            record_openai_usage(pipeline, data)
+    except Exception:
+        record_llm_call(pipeline, ok=False)
+        raise
+    return data
+
+def _build_quiz_payload(
     prompt: str,
     num_questions: int,
     difficulty: str,
     mcq_percent: int,
-    rag_context: Optional[str] = None # Added for future RAG integration
+    rag_context: Optional[str] = None
 ) -> Dict[str, Any]:
-    """
-    Calls the Groq LLM to generate a quiz based on user-defined parameters.
-    (This function remains the same as the previous version)
-    """
-    if not GROQ_API_KEY:
-        raise ValueError("Missing GROQ_API_KEY environment variable")
-
-    headers = {
-        "Authorization": f"Bearer {GROQ_API_KEY}",
-        "Content-Type": "application/json"
-    }
-    
+    """Builds the Groq chat payload shared by the blocking and streaming quiz generators."""
     # Calculate question mix
     num_mcq = round(num_questions * (mcq_percent / 100))
     num_short_answer = num_questions - num_mcq
@@ -88,48 +131,276 @@ def generate_quiz(
         "temperature": 0.5,
         "max_tokens": 8000
     }
+    return payload
 
-    response = requests.post(GROQ_API_URL, headers=headers, json=payload)
-    response.raise_for_status()
-    data = response.json()
+def generate_quiz(
+    prompt: str,
+    num_questions: int,
+    difficulty: str,
+    mcq_percent: int,
+    rag_context: Optional[str] = None # Added for future RAG integration
+) -> Dict[str, Any]:
+    """
+    Calls the Groq LLM to generate a quiz based on user-defined parameters.
+    Broken or missing questions are re-requested on their own rather than
+    regenerating the whole quiz.
+    """
+    if not GROQ_API_KEY:
+        raise ValueError("Missing GROQ_API_KEY environment variable")
+
+    payload = _build_quiz_payload(prompt, num_questions, difficulty, mcq_percent, rag_context)
+
+    data = _post_groq(payload, "quiz")
+    quiz_json, questions, quiz_text = _parse_quiz_response(data)
+
+    # Re-request only the missing/broken questions instead of the whole quiz
+    shortfall = int(num_questions) - len(questions)
+    extra = None
+    if shortfall > 0:
+        extra = _request_missing_questions(prompt, shortfall, difficulty, mcq_percent, questions, rag_context)
+    return _complete_quiz(quiz_json, questions, extra, difficulty, quiz_text)
+
+async def generate_quiz_async(
+    prompt: str,
+    num_questions: int,
+    difficulty: str,
+    mcq_percent: int,
+    rag_context: Optional[str] = None
+) -> Dict[str, Any]:
+    """generate_quiz for the async serving path; same result shape."""
+    if not GROQ_API_KEY:
+        raise ValueError("Missing GROQ_API_KEY environment variable")
+
+    payload = _build_quiz_payload(prompt, num_questions, difficulty, mcq_percent, rag_context)
 
-    # Extract quiz JSON text
+    data = await _apost_groq(payload, "quiz")
+    quiz_json, questions, quiz_text = _parse_quiz_response(data)
+
+    shortfall = int(num_questions) - len(questions)
+    extra = None
+    if shortfall > 0:
+        extra = await _request_missing_questions_async(prompt, shortfall, difficulty, mcq_percent, questions, rag_context)
+    return _complete_quiz(quiz_json, questions, extra, difficulty, quiz_text)
+
+def _parse_quiz_response(data: Dict[str, Any]) -> Tuple[Dict[str, Any], List[Dict[str, Any]], str]:
+    """Returns (quiz_json, valid questions, raw text) from a quiz completion."""
+    # Extract quiz JSON text (tolerates fences, prose, trailing commas and truncation)
     quiz_text = data["choices"][0]["message"]["content"]
+    quiz_json, _ = extract_json(quiz_text, expect="object", schema="quiz")
+    if "quiz" not in quiz_json and "questions" in quiz_json:
+        quiz_json = {"quiz": quiz_json}
+    quiz = quiz_json.setdefault("quiz", {})
 
-    try:
-        quiz_json = json.loads(quiz_text)
-        # Ensure 'generated_at' is present for completeness
-        if 'metadata' in quiz_json['quiz']:
-            quiz_json['quiz']['metadata']['generated_at'] = datetime.datetime.now().isoformat()
-    except json.JSONDecodeError:
-        raise ValueError(f"Model returned invalid JSON: {quiz_text}")
+    questions, broken = split_valid_questions(quiz.get("questions"))
+    if broken:
+        record_parse("quiz", "invalid_items", broken)
+    return quiz_json, questions, quiz_text
+
+def _complete_quiz(
+    quiz_json: Dict[str, Any],
+    questions: List[Dict[str, Any]],
+    extra: Optional[List[Dict[str, Any]]],
+    difficulty: str,
+    quiz_text: str
+) -> Dict[str, Any]:
+    """Appends re-requested questions (renumbering ids) and stamps the metadata."""
+    if extra is not None:
+        questions = [dict(q, id=f"q{i + 1}") for i, q in enumerate(questions + extra)]
+    if not questions:
+        raise ValueError(f"Model returned no usable questions: {quiz_text}")
+    quiz = quiz_json["quiz"]
+    quiz["questions"] = questions
+
+    # Ensure 'generated_at' is present for completeness
+    quiz.setdefault("metadata", {"difficulty": difficulty, "num_questions": len(questions)})
+    quiz["metadata"]["generated_at"] = datetime.datetime.now().isoformat()
 
     return quiz_json
 
+def _missing_questions_payload(
+    prompt: str,
+    count: int,
+    difficulty: str,
+    mcq_percent: int,
+    existing: List[Dict[str, Any]],
+    rag_context: Optional[str] = None
+) -> Dict[str, Any]:
+    record_parse("quiz", "rerequested_items", count)
+    payload = _build_quiz_payload(prompt, count, difficulty, mcq_percent, rag_context)
+    if existing:
+        asked = "; ".join(q["question"] for q in existing)
+        payload["messages"][1]["content"] += f"\nDo not repeat any of these questions: {asked}"
+    payload["max_tokens"] = min(8000, 300 + 400 * count)
+    return payload
+
+def _parse_missing_questions(data: Dict[str, Any], count: int) -> List[Dict[str, Any]]:
+    extra_json, _ = extract_json(data["choices"][0]["message"]["content"], expect="object", schema="quiz")
+    extra = extra_json.get("quiz", extra_json).get("questions") if isinstance(extra_json, dict) else None
+    valid, _ = split_valid_questions(extra)
+    return valid[:count]
+
+def _request_missing_questions(
+    prompt: str,
+    count: int,
+    difficulty: str,
+    mcq_percent: int,
+    existing: List[Dict[str, Any]],
+    rag_context: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """Asks for `count` more questions (avoiding the ones we already have). Never raises."""
+    payload = _missing_questions_payload(prompt, count, difficulty, mcq_percent, existing, rag_context)
+    try:
+        return _parse_missing_questions(_post_groq(payload, "quiz", timeout=60), count)
+    except (*_HTTP_ERRORS, KeyError, ValueError) as e:
+        print(f"Re-requesting {count} quiz question(s) failed: {e}")
+        return []
+
+async def _request_missing_questions_async(
+    prompt: str,
+    count: int,
+    difficulty: str,
+    mcq_percent: int,
+    existing: List[Dict[str, Any]],
+    rag_context: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    payload = _missing_questions_payload(prompt, count, difficulty, mcq_percent, existing, rag_context)
+    try:
+        return _parse_missing_questions(await _apost_groq(payload, "quiz", timeout=60), count)
+    except (*_HTTP_ERRORS, KeyError, ValueError) as e:
+        print(f"Re-requesting {count} quiz question(s) failed: {e}")
+        return []
+
 # ----------------------------------------------------------------------
-# NEW GRADING IMPLEMENTATION
+# STREAMING QUIZ GENERATION
 # ----------------------------------------------------------------------
 
-def semantically_grade_short_answer(
-    question: str, 
-    user_answer: str, 
-    correct_answer: str, 
-    explanation: str
-) -> Dict[str, Any]:
+class QuizStreamParser:
     """
-    Calls the Groq LLM to semantically grade a short answer.
-    This is a synchronous, blocking function designed to be run in a thread.
+    Incrementally parses the quiz JSON as the model streams it.
+    Feed it text deltas; it returns the quiz header (title/topic/metadata)
+    once everything before "questions" has arrived, and each valid question
+    object as soon as its closing brace is seen.
+    """
+
+    def __init__(self):
+        self._array = StreamingArrayParser("questions")
+        self.header: Optional[Dict[str, Any]] = None
+        self.questions: List[Dict[str, Any]] = []
+        self.broken = 0
+
+    @property
+    def buffer(self) -> str:
+        return self._array.buffer
+
+    def feed(self, text: str) -> List[Dict[str, Any]]:
+        """Adds a chunk of model output and returns any events it completed."""
+        events: List[Dict[str, Any]] = []
+        had_prefix = self._array.prefix is not None
+        completed = self._array.feed(text)
+
+        if not had_prefix and self._array.prefix is not None:
+            self.header = self._array.parse_prefix("quiz")
+            if self.header is not None:
+                events.append({"event": "meta", "quiz": self.header})
+
+        for question in completed:
+            if not is_valid_question(question):
+                self.broken += 1
+                continue
+            # Positional ids keep streamed and topped-up questions unique
+            question = dict(normalize_question(question, len(self.questions)), id=f"q{len(self.questions) + 1}")
+            self.questions.append(question)
+            events.append({"event": "question", "index": len(self.questions) - 1, "question": question})
+        return events
+
+
+def _iter_groq_stream(payload: Dict[str, Any]):
+    """Yields content deltas from a streaming Groq chat completion (SSE)."""
+    stream_payload = dict(payload, stream=True)
+    start = time.perf_counter()
+    usage: Dict[str, Any] = {}
+    try:
+        response = requests.post(GROQ_API_URL, headers=_groq_headers(), json=stream_payload, stream=True, timeout=60)
+        response.raise_for_status()
+    except Exception:
+        record_llm_call("quiz_stream", ok=False)
+        raise
+    with response:
+        for line in response.iter_lines(decode_unicode=True):
+            if not line or not line.startswith("data:"):
+                continue
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                break
+            try:
+                chunk = json.loads(data)
+            except json.JSONDecodeError:
+                continue
+            # Groq reports token usage on the final chunk
+            usage = (chunk.get("x_groq") or {}).get("usage") or chunk.get("usage") or usage
+            choices = chunk.get("choices") or [{}]
+            delta = choices[0].get("delta", {}).get("content")
+            if delta:
+                yield delta
+    STAGE_SECONDS.observe(time.perf_counter() - start, pipeline="quiz_stream", stage="llm")
+    record_llm_call("quiz_stream", True, usage.get("prompt_tokens"), usage.get("completion_tokens"))
+
+
+def generate_quiz_stream(
+    prompt: str,
+    num_questions: int,
+    difficulty: str,
+    mcq_percent: int,
+    rag_context: Optional[str] = None
+):
+    """
+    Streaming variant of generate_quiz.
+    Yields events as dicts:
+      {"event": "meta", "quiz": {...}}            - title/topic/metadata, once known
+      {"event": "question", "index": i, ...}      - each question as soon as it is complete
+      {"event": "done", "quiz": {...}}            - the full quiz, same shape as generate_quiz()
     """
     if not GROQ_API_KEY:
-        # In a real app, you might fall back to simple string matching here
-        # or raise an error depending on your design.
-        return {'is_correct': False, 'llm_explanation': "Grading failed: Missing API Key."}
+        raise ValueError("Missing GROQ_API_KEY environment variable")
 
-    headers = {
-        "Authorization": f"Bearer {GROQ_API_KEY}",
-        "Content-Type": "application/json"
-    }
+    payload = _build_quiz_payload(prompt, num_questions, difficulty, mcq_percent, rag_context)
+    parser = QuizStreamParser()
+
+    for delta in _iter_groq_stream(payload):
+        for event in parser.feed(delta):
+            yield event
+
+    if parser.broken:
+        record_parse("quiz", "invalid_items", parser.broken)
+
+    # Questions already sent to the client are final; only top up what is missing
+    header = parser.header
+    if header is None:
+        try:
+            full_json, _ = extract_json(parser.buffer, expect="object", schema="quiz")
+            header = {k: v for k, v in full_json.get("quiz", full_json).items() if k != "questions"}
+        except ValueError:
+            header = {}
+
+    shortfall = int(num_questions) - len(parser.questions)
+    if shortfall > 0:
+        for question in _request_missing_questions(prompt, shortfall, difficulty, mcq_percent, parser.questions, rag_context):
+            question = dict(question, id=f"q{len(parser.questions) + 1}")
+            parser.questions.append(question)
+            yield {"event": "question", "index": len(parser.questions) - 1, "question": question}
+    if not parser.questions:
+        raise ValueError(f"Model returned no usable questions: {parser.buffer[:500]}")
+
+    quiz = dict(header, questions=parser.questions)
+    quiz.setdefault("metadata", {"difficulty": difficulty, "num_questions": num_questions})
+    quiz["metadata"]["generated_at"] = datetime.datetime.now().isoformat()
+    yield {"event": "done", "quiz": {"quiz": quiz}}
+
+# ----------------------------------------------------------------------
+# NEW GRADING IMPLEMENTATION
+# ----------------------------------------------------------------------
 
+def _single_grading_payload(question: str, user_answer: str, correct_answer: str, explanation: str) -> Dict[str, Any]:
     system_prompt = f"""
     You are an impartial academic grader. Your task is to evaluate a student's answer based on the provided correct answer and question.
 
@@ -149,7 +420,7 @@ def semantically_grade_short_answer(
     }}
     """
     
-    payload = {
+    return {
         "model": "llama-3.1-8b-instant",
         "messages": [
             {"role": "system", "content": system_prompt},
@@ -159,100 +430,463 @@ def semantically_grade_short_answer(
         "max_tokens": 500
     }
 
+def _parse_single_verdict(data: Dict[str, Any]) -> Dict[str, Any]:
+    # Extract and parse the LLM's JSON response (fences, prose and trailing commas are tolerated)
+    llm_result, _ = extract_json(data["choices"][0]["message"]["content"], expect="object", schema="grading")
+
+    # Return the parsed result, ensuring the keys are present
+    return {
+        'is_correct': llm_result.get('is_correct', False),
+        'llm_explanation': llm_result.get('llm_explanation', "LLM failed to provide specific feedback.")
+    }
+
+def _grading_error_verdict(error: Exception, correct_answer: str) -> Dict[str, Any]:
+    # Catch any errors (API down, timeout, invalid JSON) and fail safely
+    print(f"Error during LLM grading: {error}")
+    return {
+        'is_correct': False,
+        'llm_explanation': f"An error occurred during automated grading ({type(error).__name__}). The expected answer was: {correct_answer}.",
+        'grading_error': True,
+        'graded_by': 'error'
+    }
+
+def _missing_key_verdict() -> Dict[str, Any]:
+    # A configuration problem, not a judgement of the answer: never cached
+    return {
+        'is_correct': False,
+        'llm_explanation': "Grading failed: Missing API Key.",
+        'grading_error': True,
+        'graded_by': 'error'
+    }
+
+def semantically_grade_short_answer(
+    question: str, 
+    user_answer: str, 
+    correct_answer: str, 
+    explanation: str
+) -> Dict[str, Any]:
+    """
+    Calls the Groq LLM to semantically grade a short answer.
+    This is a synchronous, blocking function designed to be run in a thread.
+    """
+    if not GROQ_API_KEY:
+        return _missing_key_verdict()
+
+    payload = _single_grading_payload(question, user_answer, correct_answer, explanation)
     try:
-        response = requests.post(GROQ_API_URL, headers=headers, json=payload, timeout=15)
-        response.raise_for_status()
-        data = response.json()
-        
-        # Extract and parse the LLM's JSON response
-        llm_text = data["choices"][0]["message"]["content"].strip()
-        
-        # Groq often wraps the JSON in markdown blocks, so we clean it up
-        if llm_text.startswith("```json"):
-            llm_text = llm_text[7:-3].strip()
-            
-        llm_result = json.loads(llm_text)
-        
-        # Return the parsed result, ensuring the keys are present
-        return {
-            'is_correct': llm_result.get('is_correct', False),
-            'llm_explanation': llm_result.get('llm_explanation', "LLM failed to provide specific feedback.")
+        return _parse_single_verdict(_post_groq(payload, "grading", timeout=15))
+    except (*_HTTP_ERRORS, json.JSONDecodeError, KeyError, ValueError) as e:
+        return _grading_error_verdict(e, correct_answer)
+
+async def semantically_grade_short_answer_async(
+    question: str,
+    user_answer: str,
+    correct_answer: str,
+    explanation: str
+) -> Dict[str, Any]:
+    """semantically_grade_short_answer as a coroutine (no thread held while waiting)."""
+    if not GROQ_API_KEY:
+        return _missing_key_verdict()
+
+    payload = _single_grading_payload(question, user_answer, correct_answer, explanation)
+    try:
+        return _parse_single_verdict(await _apost_groq(payload, "grading", timeout=15))
+    except (*_HTTP_ERRORS, json.JSONDecodeError, KeyError, ValueError) as e:
+        return _grading_error_verdict(e, correct_answer)
+
+# ----------------------------------------------------------------------
+# BATCH GRADING
+# All pending short answers of a quiz go out in one request (or a few
+# size-bounded chunks); malformed or missing verdicts fall back to
+# per-question grading for those items only.
+# ----------------------------------------------------------------------
+
+BATCH_GRADE_MAX_ITEMS = 10      # max short answers per batch request
+BATCH_GRADE_MAX_CHARS = 6000    # rough prompt budget per batch request
+
+def _chunk_grading_items(items: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+    """Splits pending items into chunks bounded by item count and prompt size."""
+    chunks: List[List[Dict[str, Any]]] = []
+    current: List[Dict[str, Any]] = []
+    current_chars = 0
+    for item in items:
+        item_chars = sum(len(str(v)) for v in item.values())
+        if current and (len(current) >= BATCH_GRADE_MAX_ITEMS or current_chars + item_chars > BATCH_GRADE_MAX_CHARS):
+            chunks.append(current)
+            current, current_chars = [], 0
+        current.append(item)
+        current_chars += item_chars
+    if current:
+        chunks.append(current)
+    return chunks
+
+def _batch_grading_payload(chunk: List[Dict[str, Any]]) -> Dict[str, Any]:
+    system_prompt = """
+    You are an impartial academic grader. You will receive a JSON array of student answers, each with an "id".
+    Evaluate every item against its question and correct answer.
+
+    # Grading Rules
+    1. **Strictness:** Be lenient. If the student captures the core concept, structure, or main keywords of the correct answer, mark it as **True**. Spelling or minor grammatical errors should be ignored.
+    2. **Output:** You MUST respond with ONLY a single JSON object, with exactly one result per input id.
+
+    # Output Schema
+    {
+      "results": [
+        {
+          "id": string (the id of the graded item),
+          "is_correct": boolean,
+          "llm_explanation": string (A 1-2 sentence tailored feedback on why the student was correct/incorrect, referencing the core concept.)
         }
-        
-    except (requests.exceptions.RequestException, json.JSONDecodeError, KeyError, ValueError) as e:
-        # Catch any errors (API down, timeout, invalid JSON) and fail safely
-        print(f"Error during LLM grading: {e}")
-        return {
-            'is_correct': False,
-            'llm_explanation': f"An error occurred during automated grading ({type(e).__name__}). The expected answer was: {correct_answer}."
+      ]
+    }
+    """
+    items_payload = [
+        {
+            "id": item['id'],
+            "question": item['question'],
+            "correct_answer": item['correct_answer'],
+            "explanation": item['explanation'],
+            "student_answer": item['user_answer']
+        }
+        for item in chunk
+    ]
+    return {
+        "model": "llama-3.1-8b-instant",
+        "messages": [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": f"Student answers to grade: {json.dumps(items_payload)}"}
+        ],
+        "temperature": 0.3,
+        "max_tokens": 200 + 150 * len(chunk)
+    }
+
+def _parse_batch_verdicts(data: Dict[str, Any], chunk: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    # A truncated batch still yields the verdicts that were complete
+    parsed, _ = extract_json(data["choices"][0]["message"]["content"], schema="batch_grading")
+
+    raw_results = parsed.get("results") if isinstance(parsed, dict) else parsed
+    if not isinstance(raw_results, list):
+        return {}
+
+    expected_ids = {str(item['id']) for item in chunk}
+    verdicts: Dict[str, Dict[str, Any]] = {}
+    for raw in raw_results:
+        if not isinstance(raw, dict):
+            continue
+        q_id = str(raw.get("id"))
+        if q_id not in expected_ids or not isinstance(raw.get("is_correct"), bool):
+            continue
+        verdicts[q_id] = {
+            'is_correct': raw['is_correct'],
+            'llm_explanation': raw.get('llm_explanation') or "LLM failed to provide specific feedback."
         }
+    return verdicts
 
-def grade_quiz(quiz_data: Dict[str, Any], user_answers: Dict[str, str]) -> Dict[str, Any]:
+def _grade_chunk_in_one_call(chunk: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
     """
-    Compares user answers against the correct answers and generates feedback.
-    Uses concurrent threads for LLM-based semantic grading of short answers.
+    Sends one chunk of short answers in a single structured request.
+    Returns {question_id: verdict} for every item that came back well-formed;
+    items that are missing or malformed are simply absent.
     """
-    
-    def grade_single_question_task(q: Dict[str, Any], user_answer: str) -> Dict[str, Any]:
-        """Handles the grading logic for a single question."""
-        q_id = q['id']
-        correct_answer = q['correct_answer'].strip()
-        explanation = q['explanation']
-        is_correct = False
-        final_explanation = explanation
-        
-        user_answer_stripped = user_answer.strip() 
-
-        if q['type'] == 'mcq':
-            # Case-insensitive string comparison for MCQs
-            is_correct = (user_answer_stripped.lower() == correct_answer.lower())
-            
-        elif q['type'] == 'short_answer':
-            
-            # === THE CRITICAL FIX IS HERE ===
-            if not user_answer_stripped:
-                is_correct = False # An empty answer is never correct for short answer.
-                final_explanation = f"You did not provide an answer. The correct answer was: {correct_answer}. Please review the explanation."
-            else:
-                # Proceed to LLM grading only if an answer was provided
-                llm_result = semantically_grade_short_answer(
-                    q['question'], user_answer_stripped, correct_answer, explanation
-                )
-                is_correct = llm_result.get('is_correct', False)
-                # Overwrite the simple explanation with the richer LLM feedback
-                final_explanation = llm_result['llm_explanation'] 
-
-        return {
-            'id': q_id,
-            'is_correct': is_correct,
-            'user_answer': user_answer_stripped,
-            'correct_answer': correct_answer,
-            'explanation': final_explanation
+    if not GROQ_API_KEY:
+        return {}
+    try:
+        return _parse_batch_verdicts(_post_groq(_batch_grading_payload(chunk), "grading_batch", timeout=30), chunk)
+    except (*_HTTP_ERRORS, json.JSONDecodeError, KeyError, ValueError) as e:
+        print(f"Error during batch LLM grading: {e}")
+        return {}
+
+async def _grade_chunk_in_one_call_async(chunk: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    if not GROQ_API_KEY:
+        return {}
+    try:
+        return _parse_batch_verdicts(await _apost_groq(_batch_grading_payload(chunk), "grading_batch", timeout=30), chunk)
+    except (*_HTTP_ERRORS, json.JSONDecodeError, KeyError, ValueError) as e:
+        print(f"Error during batch LLM grading: {e}")
+        return {}
+
+def _grade_item_individually(item: Dict[str, Any]) -> Dict[str, Any]:
+    return semantically_grade_short_answer(
+        item['question'], item['user_answer'], item['correct_answer'], item['explanation']
+    )
+
+def _timed_out_verdict(item: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'is_correct': False,
+        'llm_explanation': f"Automated grading timed out under heavy load. The expected answer was: {item['correct_answer']}.",
+        'grading_error': True,
+        'graded_by': 'timeout'
+    }
+
+def _with_tier(verdict: Dict[str, Any], graded_by: str) -> Dict[str, Any]:
+    # Timed-out and failed verdicts keep their own tier so they are not counted as LLM gradings
+    return dict(verdict, graded_by=verdict.get('graded_by') or ('error' if verdict.get('grading_error') else graded_by))
+
+def grade_items_individually(items: List[Dict[str, Any]], deadline: Optional[float] = None) -> List[Dict[str, Any]]:
+    """One LLM request per item, run on the shared grading scheduler."""
+    return grading_scheduler.map(_grade_item_individually, items, deadline=deadline, on_timeout=_timed_out_verdict)
+
+def _merge_batch_verdicts(chunk_verdicts: List[Dict[str, Dict[str, Any]]]) -> Dict[str, Dict[str, Any]]:
+    verdicts: Dict[str, Dict[str, Any]] = {}
+    for verdict_map in chunk_verdicts:
+        for q_id, verdict in verdict_map.items():
+            verdicts[q_id] = _with_tier(verdict, 'llm_batch')
+    return verdicts
+
+def batch_grade_short_answers(items: List[Dict[str, Any]], deadline: Optional[float] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    Grades many short answers with as few LLM requests as possible.
+    `items` are dicts with id, question, user_answer, correct_answer, explanation.
+    Returns {question_id: {'is_correct', 'llm_explanation', 'graded_by'}}.
+    """
+    if not items:
+        return {}
+    if deadline is None:
+        deadline = time.monotonic() + GRADING_DEADLINE_SECONDS
+    chunks = _chunk_grading_items(items)
+
+    chunk_verdicts = grading_scheduler.map(
+        _grade_chunk_in_one_call, chunks, deadline=deadline, on_timeout=lambda chunk: {}
+    )
+    verdicts = _merge_batch_verdicts(chunk_verdicts)
+
+    # Only the affected items fall back to per-question grading
+    missing = [item for item in items if str(item['id']) not in verdicts]
+    if missing:
+        print(f"Batch grading fell back to per-question grading for {len(missing)} item(s)")
+        fallback = grade_items_individually(missing, deadline=deadline)
+        for item, verdict in zip(missing, fallback):
+            verdicts[str(item['id'])] = _with_tier(verdict, 'llm')
+
+    return verdicts
+
+# ----------------------------------------------------------------------
+# ASYNC GRADING
+# The same requests as above, awaited on the event loop instead of run on
+# the grading scheduler's threads. The deadline is enforced per call; calls
+# still running when it passes get the timed-out verdict.
+# ----------------------------------------------------------------------
+
+async def _until_deadline(coro, deadline: float, on_timeout):
+    try:
+        return await asyncio.wait_for(coro, timeout=max(0.0, deadline - time.monotonic()))
+    except asyncio.TimeoutError:
+        return on_timeout()
+
+async def grade_items_individually_async(items: List[Dict[str, Any]], deadline: Optional[float] = None) -> List[Dict[str, Any]]:
+    if deadline is None:
+        deadline = time.monotonic() + GRADING_DEADLINE_SECONDS
+    return await gather_limited(
+        [
+            lambda item=item: _until_deadline(
+                semantically_grade_short_answer_async(item['question'], item['user_answer'], item['correct_answer'], item['explanation']),
+                deadline, lambda: _timed_out_verdict(item)
+            )
+            for item in items
+        ],
+        ASYNC_GRADING_CONCURRENCY
+    )
+
+async def batch_grade_short_answers_async(items: List[Dict[str, Any]], deadline: Optional[float] = None) -> Dict[str, Dict[str, Any]]:
+    """batch_grade_short_answers as a coroutine, with the same per-item fallback."""
+    if not items:
+        return {}
+    if deadline is None:
+        deadline = time.monotonic() + GRADING_DEADLINE_SECONDS
+    chunks = _chunk_grading_items(items)
+
+    chunk_verdicts = await gather_limited(
+        [lambda chunk=chunk: _until_deadline(_grade_chunk_in_one_call_async(chunk), deadline, dict) for chunk in chunks],
+        ASYNC_GRADING_CONCURRENCY
+    )
+    verdicts = _merge_batch_verdicts(chunk_verdicts)
+
+    missing = [item for item in items if str(item['id']) not in verdicts]
+    if missing:
+        print(f"Batch grading fell back to per-question grading for {len(missing)} item(s)")
+        fallback = await grade_items_individually_async(missing, deadline=deadline)
+        for item, verdict in zip(missing, fallback):
+            verdicts[str(item['id'])] = _with_tier(verdict, 'llm')
+
+    return verdicts
+
+def _grade_without_llm(q: Dict[str, Any], user_answer: str, embeddings=None) -> Optional[Dict[str, Any]]:
+    """
+    Grades MCQs, empty answers and clear-cut short answers.
+    Returns the result dict, or None if the question needs the LLM.
+    """
+    correct_answer = q['correct_answer'].strip()
+    explanation = q['explanation']
+    result = {
+        'id': q['id'],
+        'is_correct': False,
+        'user_answer': user_answer,
+        'correct_answer': correct_answer,
+        'explanation': explanation,
+        'graded_by': q['type']
+    }
+
+    if q['type'] == 'mcq':
+        # Case-insensitive string comparison for MCQs
+        result['is_correct'] = (user_answer.lower() == correct_answer.lower())
+        return result
+
+    if q['type'] == 'short_answer':
+        if not user_answer:
+            # An empty answer is never correct for short answer.
+            result['explanation'] = f"You did not provide an answer. The correct answer was: {correct_answer}. Please review the explanation."
+            result['graded_by'] = 'empty'
+            return result
+
+        # Clear-cut answers are graded locally; only ambiguous ones reach the LLM
+        local_result = local_grade_short_answer(user_answer, correct_answer, embeddings)
+        if local_result is None:
+            return None
+        result['is_correct'] = local_result['is_correct']
+        result['explanation'] = local_result['llm_explanation'] if local_result['is_correct'] else f"{local_result['llm_explanation']} {explanation}"
+        result['graded_by'] = local_result['tier']
+        return result
+
+    return result
+
+def _grade_locally(questions: List[Dict[str, Any]], user_answers: Dict[str, str], embeddings=None) -> Tuple[Dict[str, Dict[str, Any]], List[Dict[str, Any]]]:
+    """Grades everything that does not need the LLM. Returns (results by id, pending short answers)."""
+    results_by_id: Dict[str, Dict[str, Any]] = {}
+    pending: List[Dict[str, Any]] = []
+    for q in questions:
+        user_answer = user_answers.get(f"answer-{q['id']}", "").strip()
+        with stage("grading", "local"):
+            result = _grade_without_llm(q, user_answer, embeddings)
+        if result is not None:
+            results_by_id[str(q['id'])] = result
+        else:
+            pending.append({
+                'id': q['id'],
+                'question': q['question'],
+                'user_answer': user_answer,
+                'correct_answer': q['correct_answer'].strip(),
+                'explanation': q['explanation']
+            })
+    return results_by_id, pending
+
+def _lookup_cached_verdicts(pending: List[Dict[str, Any]]) -> Tuple[Dict[str, Dict[str, Any]], List[Dict[str, Any]]]:
+    """Reuses verdicts for answers already graded (e.g. the 30th "mitochondria"). Returns (verdicts, uncached)."""
+    verdicts: Dict[str, Dict[str, Any]] = {}
+    uncached: List[Dict[str, Any]] = []
+    for item in pending:
+        item['cache_key'] = verdict_cache_key(item['question'], item['correct_answer'], item['user_answer'])
+        cached = verdict_cache.get(item['cache_key'])
+        if cached is not None:
+            verdicts[str(item['id'])] = dict(cached, graded_by='cache')
+        else:
+            uncached.append(item)
+    return verdicts, uncached
+
+def _store_verdicts(uncached: List[Dict[str, Any]], llm_verdicts: Dict[str, Dict[str, Any]]):
+    for item in uncached:
+        verdict = llm_verdicts[str(item['id'])]
+        if not verdict.get('grading_error'):
+            verdict_cache.put(item['cache_key'], verdict)
+
+def _compile_results(
+    questions: List[Dict[str, Any]],
+    results_by_id: Dict[str, Dict[str, Any]],
+    pending: List[Dict[str, Any]],
+    verdicts: Dict[str, Dict[str, Any]]
+) -> Dict[str, Any]:
+    for item in pending:
+        verdict = verdicts[str(item['id'])]
+        results_by_id[str(item['id'])] = {
+            'id': item['id'],
+            'is_correct': verdict.get('is_correct', False),
+            'user_answer': item['user_answer'],
+            'correct_answer': item['correct_answer'],
+            # Overwrite the simple explanation with the richer LLM feedback
+            'explanation': verdict['llm_explanation'],
+            'graded_by': verdict['graded_by']
         }
 
-    # 1. Prepare data for concurrent execution
-    grading_tasks = []
-    for q in quiz_data['quiz']['questions']:
-        q_id = q['id']
-        # Pass the raw user answer from the dictionary
-        user_answer = user_answers.get(f"answer-{q_id}", "") 
-        # Add the function call arguments to a list for the executor
-        grading_tasks.append((q, user_answer))
-
-    # 2. Run grading tasks concurrently using a ThreadPoolExecutor
-    with ThreadPoolExecutor(max_workers=8) as executor:
-        graded_results: List[Dict[str, Any]] = list(executor.map(
-            lambda args: grade_single_question_task(*args), grading_tasks
-        ))
+    graded_results: List[Dict[str, Any]] = [results_by_id[str(q['id'])] for q in questions]
     
-    # 3. Calculate final score
+    # Calculate final score
     total_questions = len(graded_results)
     correct_count = sum(1 for result in graded_results if result['is_correct'])
+    graded_by_counts: Dict[str, int] = {}
+    for result in graded_results:
+        graded_by_counts[result['graded_by']] = graded_by_counts.get(result['graded_by'], 0) + 1
+    llm_short = graded_by_counts.get('llm', 0) + graded_by_counts.get('llm_batch', 0)
+    local_short = sum(n for tier, n in graded_by_counts.items()
+                      if tier not in ('mcq', 'empty', 'llm', 'llm_batch', 'timeout', 'error'))  # includes cache hits
 
-    # 4. Compile the final score and results
+    # Compile the final score and results
     return {
         'status': 'graded',
         'score': f"{correct_count}/{total_questions}",
         'percent': round((correct_count / total_questions) * 100) if total_questions > 0 else 0,
-        'results': graded_results
-    }
\ No newline at end of file
+        'results': graded_results,
+        'grading_stats': {
+            'graded_by': graded_by_counts,
+            # Counted in questions, not requests: one batched request grades many
+            'llm_graded': llm_short,
+            'locally_graded': local_short,
+            'locally_graded_pct': round(100 * local_short / (local_short + llm_short), 1) if (local_short + llm_short) else 0.0
+        }
+    }
+
+def grade_quiz(quiz_data: Dict[str, Any], user_answers: Dict[str, str], embeddings=None, batch: bool = True) -> Dict[str, Any]:
+    """
+    Compares user answers against the correct answers and generates feedback.
+    Short answers first go through the local grader (exact / numeric / fuzzy /
+    embedding); only ambiguous ones are sent to the LLM. With batch=True they
+    are graded in one structured request per chunk, otherwise one request per
+    question. Verdicts are cached by question, expected answer and normalized
+    student answer, so repeated answers skip the LLM entirely. LLM work runs
+    on the process-wide grading scheduler under a per-request deadline.
+    Each result carries a 'graded_by' tier.
+    """
+    questions = quiz_data['quiz']['questions']
+
+    # 1. Grade everything that does not need the LLM
+    results_by_id, pending = _grade_locally(questions, user_answers, embeddings)
+
+    # 2. Reuse verdicts for answers already graded
+    verdicts, uncached = _lookup_cached_verdicts(pending)
+
+    # 3. Send the remaining short answers to the LLM via the shared grading scheduler
+    if uncached:
+        deadline = time.monotonic() + GRADING_DEADLINE_SECONDS
+        with stage("grading", "llm_fan_out"):
+            if batch:
+                llm_verdicts = batch_grade_short_answers(uncached, deadline=deadline)
+            else:
+                single = grade_items_individually(uncached, deadline=deadline)
+                llm_verdicts = {str(item['id']): _with_tier(v, 'llm') for item, v in zip(uncached, single)}
+        _store_verdicts(uncached, llm_verdicts)
+        verdicts.update(llm_verdicts)
+
+    # 4. Score and compile the results
+    return _compile_results(questions, results_by_id, pending, verdicts)
+
+async def grade_quiz_async(quiz_data: Dict[str, Any], user_answers: Dict[str, str], embeddings=None, batch: bool = True) -> Dict[str, Any]:
+    """
+    grade_quiz for the async serving path. Local grading (which may embed
+    answers) and the verdict cache run on the blocking pool; the LLM calls
+    are awaited instead of occupying grading scheduler threads.
+    """
+    questions = quiz_data['quiz']['questions']
+
+    results_by_id, pending = await run_blocking(_grade_locally, questions, user_answers, embeddings)
+    verdicts, uncached = await run_blocking(_lookup_cached_verdicts, pending)
+
+    if uncached:
+        deadline = time.monotonic() + GRADING_DEADLINE_SECONDS
+        with stage("grading", "llm_fan_out"):
+            if batch:
+                llm_verdicts = await batch_grade_short_answers_async(uncached, deadline=deadline)
+            else:
+                single = await grade_items_individually_async(uncached, deadline=deadline)
+                llm_verdicts = {str(item['id']): _with_tier(v, 'llm') for item, v in zip(uncached, single)}
+        await run_blocking(_store_verdicts, uncached, llm_verdicts)
+        verdicts.update(llm_verdicts)
+
+    return _compile_results(questions, results_by_id, pending, verdicts)
@@ -0,0 +1,118 @@
+# backend/retrieval_filters.py
+#
+# Chapter / page-range filters for book retrieval. Requests may send
+#   "chapter":    index from /book_artifacts/<book> or a chapter title
+#   "page_start", "page_end": 1-based, inclusive (either may be left out)
+# A chapter is resolved to its page range through the book's chapter map
+# and intersected with any explicit range. The range becomes a Chroma
+# `where` clause on the chunks' `page` metadata, so the vector search only
+# scores chunks inside it. Every PyPDFLoader chunk has `page`, so the filter
+# also works on indexes built before chunks carried chapter metadata.
+
+from typing import Any, Dict, NamedTuple, Optional
+
+from backend import book_artifacts
+
+
+class RetrievalFilterError(ValueError):
+    """Invalid or unknown chapter / page range in a request."""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+class PageRange(NamedTuple):
+    start: int                      # 1-based, inclusive
+    end: Optional[int]              # None: to the end of the book
+    chapter: Optional[str] = None   # title, when the range came from a chapter
+
+    def where(self) -> Dict[str, Any]:
+        # PyPDFLoader `page` metadata is 0-based
+        conditions = [{"page": {"$gte": self.start - 1}}]
+        if self.end is not None:
+            conditions.append({"page": {"$lte": self.end - 1}})
+        return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+    def describe(self) -> Dict[str, Any]:
+        return {"page_start": self.start, "page_end": self.end, "chapter": self.chapter}
+
+
+def _page_number(value, field: str) -> Optional[int]:
+    if value is None or value == "":
+        return None
+    try:
+        page = int(value)
+    except (TypeError, ValueError):
+        raise RetrievalFilterError(f"{field} must be a page number")
+    if page < 1:
+        raise RetrievalFilterError(f"{field} must be 1 or more")
+    return page
+
+
+def _find_chapter(book_name: str, chapter) -> Dict[str, Any]:
+    chapters = book_artifacts.chapters_for(book_name)
+    if chapters is None:
+        raise RetrievalFilterError(f"Book '{book_name}' not found", 404)
+    if isinstance(chapter, int) or (isinstance(chapter, str) and chapter.strip().isdigit()):
+        index = int(chapter)
+        for c in chapters:
+            if c["index"] == index:
+                return c
+        raise RetrievalFilterError(f"Chapter {index} does not exist (the book has {len(chapters)})")
+
+    wanted = str(chapter).strip().casefold()
+    exact = [c for c in chapters if c["title"].casefold() == wanted]
+    partial = [c for c in chapters if wanted and wanted in c["title"].casefold()]
+    matches = exact or partial
+    if len(matches) != 1:
+        reason = "matches several chapters" if matches else "matches no chapter"
+        raise RetrievalFilterError(f"'{chapter}' {reason}; see /book_artifacts/{book_name} for the chapter list")
+    return matches[0]
+
+
+def resolve(book_name: str, chapter=None, page_start=None, page_end=None) -> Optional[PageRange]:
+    """PageRange for the given filters, or None when there are none."""
+    start = _page_number(page_start, "page_start")
+    end = _page_number(page_end, "page_end")
+    title = None
+    if chapter is not None and chapter != "":
+        found = _find_chapter(book_name, chapter)
+        title = found["title"]
+        start = max(start or 1, found["start_page"])
+        end = found["end_page"] if end is None else min(end, found["end_page"])
+    if start is None and end is None:
+        return None
+    start = start or 1
+    if end is not None and end < start:
+        raise RetrievalFilterError("The page range is empty" + (f" within '{title}'" if title else ""))
+    return PageRange(start, end, title)
+
+
+def from_request(book_name: Optional[str], data: Dict[str, Any]) -> Optional[PageRange]:
+    """Filters from a JSON request body; only meaningful together with a book."""
+    if not book_name or not any(data.get(k) not in (None, "") for k in ("chapter", "page_start", "page_end")):
+        return None
+    return resolve(book_name, data.get("chapter"), data.get("page_start"), data.get("page_end"))
+
+
+class FilteredIndex:
+    """A Chroma store whose searches only see chunks inside a page range."""
+
+    def __init__(self, db, page_range: PageRange):
+        self._db = db
+        self._where = page_range.where()
+        self.page_range = page_range
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs):
+        return self._db.similarity_search(query, k=k, filter=self._where, **kwargs)
+
+    def similarity_search_by_vector(self, embedding, k: int = 4, **kwargs):
+        return self._db.similarity_search_by_vector(embedding, k=k, filter=self._where, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._db, name)
+
+
+def filtered(db, page_range: Optional[PageRange]):
+    return db if page_range is None else FilteredIndex(db, page_range)
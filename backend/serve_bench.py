@@ -0,0 +1,133 @@
+# backend/serve_bench.py
+#
+# Requests/sec benchmark for the production server (wsgi.py + gunicorn.conf.py).
+#   python -m backend.serve_bench --url http://localhost:5089/list_books
+#   python -m backend.serve_bench --scale 1,2,4,8 --path /list_books
+# --scale starts gunicorn once per worker count, waits for /ready, runs the
+# same load against it and prints one row per run, so the scaling with cores
+# can be read straight off the table.
+
+import os
+import sys
+import json
+import time
+import signal
+import argparse
+import statistics
+import subprocess
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+# ============= SETTINGS ============
+DEFAULT_REQUESTS = 2000
+DEFAULT_CONCURRENCY = 64
+READY_TIMEOUT = 300   # seconds to wait for a freshly started server to load the model
+BENCH_BIND = "127.0.0.1:5099"
+# ==================================
+
+
+def _one_request(url: str, body: bytes = None):
+    start = time.perf_counter()
+    req = urllib.request.Request(url, data=body, headers={'Content-Type': 'application/json'} if body else {})
+    try:
+        with urllib.request.urlopen(req, timeout=60) as resp:
+            resp.read()
+            ok = 200 <= resp.status < 300
+    except (urllib.error.URLError, OSError):
+        ok = False
+    return ok, time.perf_counter() - start
+
+
+def run_load(url: str, requests: int = DEFAULT_REQUESTS, concurrency: int = DEFAULT_CONCURRENCY, body: bytes = None):
+    """Fires `requests` requests at `url` from `concurrency` threads."""
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda _: _one_request(url, body), range(requests)))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(t for ok, t in results if ok)
+    errors = sum(1 for ok, _ in results if not ok)
+
+    def pct(p):
+        return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000, 1) if latencies else None
+
+    return {
+        'requests': requests,
+        'concurrency': concurrency,
+        'errors': errors,
+        'seconds': round(elapsed, 2),
+        'requests_per_sec': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': pct(0.50),
+        'p95_ms': pct(0.95),
+        'mean_ms': round(statistics.mean(latencies) * 1000, 1) if latencies else None,
+    }
+
+
+def _wait_ready(base_url: str, timeout: float = READY_TIMEOUT) -> bool:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        ok, _ = _one_request(base_url + "/ready")
+        if ok:
+            return True
+        time.sleep(0.5)
+    return False
+
+
+def scale(worker_counts, path: str, requests: int, concurrency: int, threads: int = None, body: bytes = None):
+    """Starts gunicorn with each worker count in turn and benchmarks it."""
+    rows = []
+    base_url = f"http://{BENCH_BIND}"
+    for workers in worker_counts:
+        env = dict(os.environ, WEB_CONCURRENCY=str(workers), WEB_BIND=BENCH_BIND, WEB_ACCESS_LOG="/dev/null")
+        if threads:
+            env['WEB_THREADS'] = str(threads)
+        server = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "wsgi:app"],
+            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            if not _wait_ready(base_url):
+                rows.append({'workers': workers, 'error': 'server did not become ready'})
+                continue
+            # Short warm-up so connection setup and first-request costs aren't measured
+            run_load(base_url + path, requests=min(200, requests), concurrency=concurrency, body=body)
+            rows.append({'workers': workers, **run_load(base_url + path, requests, concurrency, body)})
+        finally:
+            server.send_signal(signal.SIGTERM)
+            try:
+                server.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                server.kill()
+    return rows
+
+
+def _print_table(rows):
+    print(f"{'workers':>8} {'req/s':>10} {'p50 ms':>8} {'p95 ms':>8} {'errors':>7}")
+    for row in rows:
+        if 'error' in row:
+            print(f"{row['workers']:>8} {row['error']}")
+            continue
+        print(f"{row['workers']:>8} {row['requests_per_sec']:>10} {row['p50_ms']:>8} {row['p95_ms']:>8} {row['errors']:>7}")
+
+
+# Run standalone: python -m backend.serve_bench --help
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Requests/sec benchmark for the gunicorn deployment")
+    parser.add_argument("--url", help="benchmark an already running server at this URL")
+    parser.add_argument("--scale", help="comma-separated worker counts to start and benchmark, e.g. 1,2,4,8")
+    parser.add_argument("--path", default="/list_books", help="endpoint used with --scale")
+    parser.add_argument("--json-body", help="POST this JSON body instead of issuing GETs")
+    parser.add_argument("--requests", type=int, default=DEFAULT_REQUESTS)
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--threads", type=int, help="WEB_THREADS for --scale runs")
+    args = parser.parse_args()
+
+    body = args.json_body.encode("utf-8") if args.json_body else None
+    if args.scale:
+        counts = [int(n) for n in args.scale.split(",") if n.strip()]
+        _print_table(scale(counts, args.path, args.requests, args.concurrency, args.threads, body))
+    elif args.url:
+        print(json.dumps(run_load(args.url, args.requests, args.concurrency, body), indent=2))
+    else:
+        parser.print_help()
@@ -206,18 +206,19 @@ import os
 import io
 import json
 from datetime import datetime
+from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 # from langchain_core import embeddings
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import letter
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, PageBreak
-from reportlab.lib.enums import TA_CENTER, TA_LEFT
+from backend.llm_json import extract_json, record_parse, is_valid_slide
+from backend.metrics import stage, invoke_llm, ainvoke_llm
+from backend.index_versions import open_index, current_path
+from backend.retrieval_filters import PageRange, filtered
+from backend.tracing import bind_context
+from backend.async_llm import run_blocking, gather_limited
 
-# LangChain / Groq imports
-from langchain_community.vectorstores import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_groq import ChatGroq
+# LangChain / Groq imports are done inside the functions that use them so
+# importing this module (at app startup) stays cheap.
 
 # Load environment variables
 load_dotenv()
@@ -236,27 +237,25 @@ def normalize_book_name(book_name: str) -> str:
 def load_index(embeddings, book_name: str):
     """Load Chroma index for a book."""
     normalized_name = normalize_book_name(book_name)
-    index_folder = os.path.join(INDEX_FOLDER, normalized_name)
-    if not os.path.exists(index_folder) or not os.listdir(index_folder):
+    if current_path(normalized_name, INDEX_FOLDER) is None:
         raise FileNotFoundError(f"No index found for book: {book_name}")
-    return Chroma(persist_directory=index_folder, embedding_function=embeddings)
+    return open_index(normalized_name, embeddings, INDEX_FOLDER)
 
 
 # ----------------- Slide Deck Generation -----------------
-def generate_slide_deck(embeddings, prompt: str, use_rag: bool, book_name: str):
-    if not GROQ_API_KEY:
-        raise ValueError("Missing GROQ_API_KEY in environment")
-
-    llm = ChatGroq(model=LLM_MODEL, groq_api_key=GROQ_API_KEY)
-
-    # Retrieve RAG context if requested
-    context = []
-    if use_rag and book_name:
-        db = load_index(embeddings, book_name)
-        results = db.similarity_search(prompt, k=12)
-        context = [r.page_content for r in results]
-
-    # Build prompt
+def _deck_context(embeddings, book_name: str, query: str, k: int, page_range: Optional[PageRange] = None):
+    """
+    (index, chunks) for RAG decks (blocking: index open and search). With a
+    page_range the returned index only searches those pages, slide bodies included.
+    """
+    with stage("slide_deck", "load_index", book=book_name):
+        db = filtered(load_index(embeddings, book_name), page_range)
+    with stage("slide_deck", "similarity_search", book=book_name, k=k):
+        results = db.similarity_search(query, k=k)
+    return db, [r.page_content for r in results]
+
+
+def _deck_prompt(prompt: str, context: list) -> str:
     final_prompt = f"You are a presentation slide generator.\nTopic: {prompt}\n"
     if context:
         final_prompt += "Use the following context from the book:\n" + "\n".join(context)
@@ -283,105 +282,303 @@ Return output as valid JSON in this exact schema:
   }
 }
 """
+    return final_prompt
+
 
-    response = llm.invoke(final_prompt)
+def _parse_deck(response):
+    """Returns (slide_deck_json, indexes of broken slides)."""
+    slide_deck_json = _parse_llm_json(response, schema="slide_deck")
+    if "slide_deck" not in slide_deck_json and "slides" in slide_deck_json:
+        slide_deck_json = {"slide_deck": slide_deck_json}
+    deck = slide_deck_json.get("slide_deck")
+    if not isinstance(deck, dict) or not isinstance(deck.get("slides"), list) or not deck["slides"]:
+        raise ValueError(f"LLM returned a slide deck without slides: {slide_deck_json}")
 
-    # Convert response to string
-    raw_text = response.content if hasattr(response, "content") else str(response)
-    raw_text = raw_text.strip()
+    broken = [i for i, slide in enumerate(deck["slides"]) if not is_valid_slide(slide)]
+    if broken:
+        record_parse("slide_deck", "invalid_items", len(broken))
+        record_parse("slide_deck", "rerequested_items", len(broken))
+    return slide_deck_json, broken
 
-    # Remove ```json or ``` code fences if present
-    if raw_text.startswith("```"):
-        lines = raw_text.splitlines()
-        if lines[0].startswith("```"):
-            lines = lines[1:]  # remove first ```json line
-        if lines[-1].strip() == "```":
-            lines = lines[:-1]  # remove last ``` line
-        raw_text = "\n".join(lines).strip()
 
-    # Parse JSON
-    try:
-        slide_deck_json = json.loads(raw_text)
-    except json.JSONDecodeError as e:
-        raise ValueError(f"LLM returned invalid JSON:\n{raw_text}\nOriginal error: {str(e)}")
+def _broken_slide(deck: dict, i: int) -> dict:
+    return deck["slides"][i] if isinstance(deck["slides"][i], dict) else {}
 
+
+def generate_slide_deck(embeddings, prompt: str, use_rag: bool, book_name: str, page_range: Optional[PageRange] = None):
+    if not GROQ_API_KEY:
+        raise ValueError("Missing GROQ_API_KEY in environment")
+
+    from langchain_groq import ChatGroq
+    llm = ChatGroq(model=LLM_MODEL, groq_api_key=GROQ_API_KEY)
+
+    # Retrieve RAG context if requested
+    context = []
+    db = None
+    if use_rag and book_name:
+        db, context = _deck_context(embeddings, book_name, prompt, 12, page_range)
+
+    response = invoke_llm(llm, _deck_prompt(prompt, context), "slide_deck")
+    slide_deck_json, broken = _parse_deck(response)
+
+    # Regenerate only the slides that came back broken, not the whole deck
+    deck = slide_deck_json["slide_deck"]
+    deck_title = deck.get("title") or prompt
+    if not broken:
+        return slide_deck_json
+    slides = [_broken_slide(deck, i) for i in broken]
+    with ThreadPoolExecutor(max_workers=min(SLIDE_WORKERS, len(slides))) as executor:
+        bodies = list(executor.map(
+            bind_context(lambda slide: _generate_slide_body(llm, db, prompt, deck_title, slide)),
+            slides
+        ))
+    for i, slide, body in zip(broken, slides, bodies):
+        deck["slides"][i] = dict(body, slide_id=str(slide.get("slide_id") or i + 1))
     return slide_deck_json
 
 
-# ----------------- PDF Generation -----------------
-def create_pdf_from_slides(slide_deck_data):
-    """Generate a PDF from slide deck JSON with 16:9 aspect ratio"""
-    width, height = 612, 612 * 9 / 16
-    pagesize = (width, height)
-
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(
-        buffer,
-        pagesize=pagesize,
-        rightMargin=30,
-        leftMargin=30,
-        topMargin=30,
-        bottomMargin=30
-    )
+def _parse_llm_json(response, schema: str = "slide_deck"):
+    """Find and parse the JSON object in an LLM response (see backend/llm_json.py)."""
+    value, _ = extract_json(response, expect="object", schema=schema)
+    return value
 
-    styles = getSampleStyleSheet()
-    title_style = ParagraphStyle(
-        "CustomTitle", parent=styles["Title"], fontSize=60, leading=50,
-        alignment=TA_CENTER, spaceAfter=0, textColor=colors.HexColor("#9f3dff")
-    )
-    heading_style = ParagraphStyle(
-        "CustomHeading", parent=styles["Heading1"], fontSize=30, leading=34,
-        alignment=TA_CENTER, spaceAfter=15, textColor=colors.HexColor("#333333")
-    )
-    content_style = ParagraphStyle(
-        "CustomContent", parent=styles["Normal"], fontSize=20,
-        alignment=TA_LEFT, spaceAfter=12, leading=24, textColor=colors.HexColor("#666666")
+
+# ----------------- Outline-then-parallel Generation -----------------
+SLIDE_WORKERS = 8          # concurrent slide-body generations per deck
+SLIDE_CONTEXT_K = 4        # chunks retrieved per slide
+SLIDE_TYPES = ("paragraph", "unordered_list", "ordered_list")
+
+
+def _outline_prompt(prompt: str, num_slides, context) -> str:
+    outline_prompt = f"You are a presentation planner.\nTopic: {prompt}\n"
+    if context:
+        outline_prompt += "The deck is based on this book excerpt:\n" + "\n".join(context) + "\n"
+    if num_slides:
+        outline_prompt += f"Plan exactly {num_slides} content slides.\n"
+    outline_prompt += """
+Return ONLY the outline as valid JSON in this exact schema (no slide content):
+{
+  "title": string,
+  "topic": string,
+  "slides": [
+    {
+      "slide_title": string,
+      "slide_type": "paragraph" | "unordered_list" | "ordered_list"
+    }
+  ]
+}
+"""
+    return outline_prompt
+
+
+def _parse_outline(response):
+    outline = _parse_llm_json(response, schema="slide_outline")
+    if not isinstance(outline, dict) or not isinstance(outline.get("slides"), list):
+        raise ValueError(f"LLM returned an invalid outline: {outline}")
+    # A bare string is taken as a slide title; null and other entries are dropped
+    outline["slides"] = [
+        slide if isinstance(slide, dict) else {"slide_title": slide.strip()}
+        for slide in outline["slides"]
+        if isinstance(slide, dict) or (isinstance(slide, str) and slide.strip())
+    ]
+    if not outline["slides"]:
+        raise ValueError(f"LLM returned an invalid outline: {outline}")
+    return outline
+
+
+def _generate_outline(llm, prompt: str, num_slides, context):
+    return _parse_outline(invoke_llm(llm, _outline_prompt(prompt, num_slides, context), "slide_outline"))
+
+
+def _slide_spec(slide: dict):
+    slide_title = slide.get("slide_title", "")
+    slide_type = slide.get("slide_type") if slide.get("slide_type") in SLIDE_TYPES else "unordered_list"
+    return slide_title, slide_type
+
+
+def _slide_context(db, prompt: str, slide_title: str) -> list:
+    if db is None:
+        return []
+    with stage("slide_body", "similarity_search", slide=slide_title, k=SLIDE_CONTEXT_K):
+        results = db.similarity_search(f"{prompt} {slide_title}", k=SLIDE_CONTEXT_K)
+    return [r.page_content for r in results]
+
+
+def _slide_body_prompt(prompt: str, deck_title: str, slide_title: str, slide_type: str, context: list) -> str:
+    content_format = "a single string of 1-2 short paragraphs" if slide_type == "paragraph" else "a JSON array of 3-5 short strings"
+    slide_prompt = f"""You are writing one slide of the presentation "{deck_title}" (topic: {prompt}).
+Slide title: {slide_title}
+Slide type: {slide_type}
+"""
+    if context:
+        slide_prompt += "Use the following context from the book:\n" + "\n".join(context) + "\n"
+    slide_prompt += f"""
+Return ONLY valid JSON in this exact schema, where slide_content is {content_format}:
+{{"slide_content": string | [string]}}
+"""
+    return slide_prompt
+
+
+def _parse_slide_body(response, slide_title: str, slide_type: str):
+    """The slide dict, or raises ValueError so the caller retries."""
+    body = _parse_llm_json(response, schema="slide_body")
+    content = body.get("slide_content") if isinstance(body, dict) else None
+    if isinstance(content, (str, list)) and content:
+        return {"slide_type": slide_type, "slide_title": slide_title, "slide_content": content}
+    raise ValueError(f"missing slide_content in {body}")
+
+
+def _failed_slide(slide_title: str, last_error) -> dict:
+    print(f"Slide '{slide_title}' failed: {last_error}")
+    return {"slide_type": "paragraph", "slide_title": slide_title, "slide_content": "(Content could not be generated for this slide.)"}
+
+
+def _generate_slide_body(llm, db, prompt: str, deck_title: str, slide: dict):
+    """Generates one slide's content with its own targeted retrieval."""
+    slide_title, slide_type = _slide_spec(slide)
+    context = _slide_context(db, prompt, slide_title)
+    slide_prompt = _slide_body_prompt(prompt, deck_title, slide_title, slide_type, context)
+
+    last_error = None
+    for _ in range(2):  # one retry per slide instead of regenerating the whole deck
+        try:
+            return _parse_slide_body(invoke_llm(llm, slide_prompt, "slide_body"), slide_title, slide_type)
+        except Exception as e:
+            last_error = e
+    return _failed_slide(slide_title, last_error)
+
+
+def _assemble_deck(outline: dict, bodies: list, prompt: str):
+    deck_title = outline.get("title") or prompt
+    slides = [dict(body, slide_id=str(i + 1)) for i, body in enumerate(bodies)]
+    return {
+        "slide_deck": {
+            "title": deck_title,
+            "topic": outline.get("topic") or prompt,
+            "metadata": {
+                "created_at": datetime.now().isoformat(),
+                "created_by": "Learnly.AI",
+                "total_slides": len(slides)
+            },
+            "slides": slides
+        }
+    }
+
+
+def generate_slide_deck_parallel(embeddings, prompt: str, use_rag: bool, book_name: str, num_slides: int = None,
+                                 page_range: Optional[PageRange] = None):
+    """
+    Two-phase slide generation: a short outline call, then every slide body
+    generated concurrently with its own retrieval, assembled in outline order.
+    Returns the same schema as generate_slide_deck.
+    """
+    if not GROQ_API_KEY:
+        raise ValueError("Missing GROQ_API_KEY in environment")
+
+    from langchain_groq import ChatGroq
+    llm = ChatGroq(model=LLM_MODEL, groq_api_key=GROQ_API_KEY)
+
+    db = None
+    outline_context = []
+    if use_rag and book_name:
+        db, outline_context = _deck_context(embeddings, book_name, prompt, SLIDE_CONTEXT_K, page_range)
+
+    # Phase 1: outline (titles and slide types only)
+    outline = _generate_outline(llm, prompt, num_slides, outline_context)
+    deck_title = outline.get("title") or prompt
+    print(f"Outline ready: {len(outline['slides'])} slides")
+
+    # Phase 2: slide bodies in parallel
+    with ThreadPoolExecutor(max_workers=min(SLIDE_WORKERS, len(outline["slides"]))) as executor:
+        bodies = list(executor.map(
+            bind_context(lambda slide: _generate_slide_body(llm, db, prompt, deck_title, slide)),
+            outline["slides"]
+        ))
+
+    return _assemble_deck(outline, bodies, prompt)
+
+
+# ----------------- Async variants (asgi.py) -----------------
+# Same prompts and parsing; the LLM calls are awaited and retrieval runs on
+# the blocking pool, so a deck in progress holds no thread while it waits.
+_async_llm = None
+
+
+def _shared_async_llm():
+    # One client per worker on the async path, so its connection pool is reused
+    global _async_llm
+    if _async_llm is None:
+        from langchain_groq import ChatGroq
+        _async_llm = ChatGroq(model=LLM_MODEL, groq_api_key=GROQ_API_KEY)
+    return _async_llm
+
+
+async def _generate_slide_body_async(llm, db, prompt: str, deck_title: str, slide: dict):
+    slide_title, slide_type = _slide_spec(slide)
+    context = await run_blocking(_slide_context, db, prompt, slide_title) if db is not None else []
+    slide_prompt = _slide_body_prompt(prompt, deck_title, slide_title, slide_type, context)
+
+    last_error = None
+    for _ in range(2):
+        try:
+            return _parse_slide_body(await ainvoke_llm(llm, slide_prompt, "slide_body"), slide_title, slide_type)
+        except Exception as e:
+            last_error = e
+    return _failed_slide(slide_title, last_error)
+
+
+async def generate_slide_deck_async(embeddings, prompt: str, use_rag: bool, book_name: str,
+                                    page_range: Optional[PageRange] = None):
+    if not GROQ_API_KEY:
+        raise ValueError("Missing GROQ_API_KEY in environment")
+    llm = _shared_async_llm()
+
+    context = []
+    db = None
+    if use_rag and book_name:
+        db, context = await run_blocking(_deck_context, embeddings, book_name, prompt, 12, page_range)
+
+    response = await ainvoke_llm(llm, _deck_prompt(prompt, context), "slide_deck")
+    slide_deck_json, broken = _parse_deck(response)
+
+    deck = slide_deck_json["slide_deck"]
+    deck_title = deck.get("title") or prompt
+    slides = [_broken_slide(deck, i) for i in broken]
+    bodies = await gather_limited(
+        [lambda slide=slide: _generate_slide_body_async(llm, db, prompt, deck_title, slide) for slide in slides],
+        SLIDE_WORKERS
     )
-    list_style = ParagraphStyle(
-        "ListStyle", parent=content_style, leftIndent=30,
-        spaceAfter=10, leading=24, bulletIndent=15, spaceBefore=5
+    for i, slide, body in zip(broken, slides, bodies):
+        deck["slides"][i] = dict(body, slide_id=str(slide.get("slide_id") or i + 1))
+    return slide_deck_json
+
+
+async def generate_slide_deck_parallel_async(embeddings, prompt: str, use_rag: bool, book_name: str, num_slides: int = None,
+                                             page_range: Optional[PageRange] = None):
+    if not GROQ_API_KEY:
+        raise ValueError("Missing GROQ_API_KEY in environment")
+    llm = _shared_async_llm()
+
+    db = None
+    outline_context = []
+    if use_rag and book_name:
+        db, outline_context = await run_blocking(_deck_context, embeddings, book_name, prompt, SLIDE_CONTEXT_K, page_range)
+
+    outline = _parse_outline(await ainvoke_llm(llm, _outline_prompt(prompt, num_slides, outline_context), "slide_outline"))
+    deck_title = outline.get("title") or prompt
+    print(f"Outline ready: {len(outline['slides'])} slides")
+
+    bodies = await gather_limited(
+        [lambda slide=slide: _generate_slide_body_async(llm, db, prompt, deck_title, slide) for slide in outline["slides"]],
+        SLIDE_WORKERS
     )
+    return _assemble_deck(outline, bodies, prompt)
 
-    story = []
-
-    # First slide: only title
-    title = slide_deck_data["slide_deck"]["title"]
-    story.append(Spacer(1, height / 3))
-    story.append(Paragraph(title, title_style))
-    story.append(PageBreak())
-
-    # Content slides
-    slides = slide_deck_data["slide_deck"]["slides"]
-    for idx, slide in enumerate(slides):
-        slide_title = slide.get("slide_title", "")
-        story.append(Paragraph(slide_title.strip() or "(No Title)", heading_style))
-
-        approx_title_height = 50
-        remaining_height = height - approx_title_height - 60
-        story.append(Spacer(1, remaining_height / 4))
-
-        content = slide.get("slide_content")
-        if isinstance(content, str):
-            paragraphs = [p.strip() for p in content.split("\n\n") if p.strip()] or ["(No content)"]
-            for para in paragraphs:
-                story.append(Paragraph(para, content_style))
-                story.append(Spacer(1, 10))
-        elif isinstance(content, list):
-            content_items = [item.strip() for item in content if item.strip()] or ["(No content)"]
-            for i, item in enumerate(content_items):
-                bullet = f"• {item}" if slide["slide_type"] == "unordered_list" else f"{i+1}. {item}"
-                story.append(Paragraph(bullet, list_style))
-                story.append(Spacer(1, 5))
-        else:
-            story.append(Paragraph("(Invalid content)", content_style))
-
-        if idx < len(slides) - 1:
-            story.append(PageBreak())
-
-    doc.build(story)
-    pdf_bytes = buffer.getvalue()
-    buffer.close()
-    return pdf_bytes
+
+# ----------------- PDF Generation -----------------
+# Rendering lives in backend/slide_pdf.py (styles built once, output cache,
+# process-pool rendering); re-exported here for existing callers.
+from backend.slide_pdf import create_pdf_from_slides, render_pdf_offloaded
 
 
 # ----------------- Standalone Testing -----------------
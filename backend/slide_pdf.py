@@ -0,0 +1,373 @@
+# backend/slide_pdf.py
+
+import os
+import io
+import sys
+import json
+import time
+import zipfile
+import hashlib
+import threading
+import multiprocessing
+from datetime import datetime
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from functools import lru_cache
+
+from backend.metrics import stage, record_cache
+
+# reportlab is imported inside the rendering functions so importing this
+# module (at app startup) stays cheap.
+
+# ============= SETTINGS ============
+PAGE_WIDTH, PAGE_HEIGHT = 612, 612 * 9 / 16                            # 16:9 slides
+PDF_CACHE_MAX_BYTES = int(os.getenv("PDF_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+PDF_RENDER_PROCESSES = int(os.getenv("PDF_RENDER_PROCESSES", str(min(4, os.cpu_count() or 1))))
+# Workers must not be forked from a web process that has threads running
+# (grading scheduler, warm-up, gthread) and torch loaded: that can deadlock
+PDF_RENDER_START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+PDF_RENDER_TIMEOUT = 120                                                # seconds
+BATCH_EXPORT_MAX_DECKS = 200                                            # decks per zip request
+# ==================================
+
+
+# ----------------- Styles (built once per process) -----------------
+@lru_cache(maxsize=1)
+def get_slide_styles():
+    """getSampleStyleSheet() and the four custom styles, built once and reused for every deck."""
+    from reportlab.lib import colors
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.lib.enums import TA_CENTER, TA_LEFT
+
+    styles = getSampleStyleSheet()
+    title_style = ParagraphStyle(
+        "CustomTitle", parent=styles["Title"], fontSize=60, leading=50,
+        alignment=TA_CENTER, spaceAfter=0, textColor=colors.HexColor("#9f3dff")
+    )
+    heading_style = ParagraphStyle(
+        "CustomHeading", parent=styles["Heading1"], fontSize=30, leading=34,
+        alignment=TA_CENTER, spaceAfter=15, textColor=colors.HexColor("#333333")
+    )
+    content_style = ParagraphStyle(
+        "CustomContent", parent=styles["Normal"], fontSize=20,
+        alignment=TA_LEFT, spaceAfter=12, leading=24, textColor=colors.HexColor("#666666")
+    )
+    list_style = ParagraphStyle(
+        "ListStyle", parent=content_style, leftIndent=30,
+        spaceAfter=10, leading=24, bulletIndent=15, spaceBefore=5
+    )
+    return title_style, heading_style, content_style, list_style
+
+
+# ----------------- Rendering -----------------
+def render_pdf(slide_deck_data):
+    """Generate a PDF from slide deck JSON with 16:9 aspect ratio (no caching)."""
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, PageBreak
+
+    width, height = PAGE_WIDTH, PAGE_HEIGHT
+    pagesize = (width, height)
+
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(
+        buffer,
+        pagesize=pagesize,
+        rightMargin=30,
+        leftMargin=30,
+        topMargin=30,
+        bottomMargin=30
+    )
+
+    title_style, heading_style, content_style, list_style = get_slide_styles()
+
+    story = []
+
+    # First slide: only title
+    title = slide_deck_data["slide_deck"]["title"]
+    story.append(Spacer(1, height / 3))
+    story.append(Paragraph(title, title_style))
+    story.append(PageBreak())
+
+    # Content slides
+    slides = slide_deck_data["slide_deck"]["slides"]
+    approx_title_height = 50
+    remaining_height = height - approx_title_height - 60
+    for idx, slide in enumerate(slides):
+        slide_title = slide.get("slide_title", "")
+        story.append(Paragraph(slide_title.strip() or "(No Title)", heading_style))
+        story.append(Spacer(1, remaining_height / 4))
+
+        content = slide.get("slide_content")
+        if isinstance(content, str):
+            paragraphs = [p.strip() for p in content.split("\n\n") if p.strip()] or ["(No content)"]
+            for para in paragraphs:
+                story.append(Paragraph(para, content_style))
+                story.append(Spacer(1, 10))
+        elif isinstance(content, list):
+            content_items = [item.strip() for item in content if item.strip()] or ["(No content)"]
+            for i, item in enumerate(content_items):
+                bullet = f"• {item}" if slide["slide_type"] == "unordered_list" else f"{i+1}. {item}"
+                story.append(Paragraph(bullet, list_style))
+                story.append(Spacer(1, 5))
+        else:
+            story.append(Paragraph("(Invalid content)", content_style))
+
+        if idx < len(slides) - 1:
+            story.append(PageBreak())
+
+    doc.build(story)
+    pdf_bytes = buffer.getvalue()
+    buffer.close()
+    return pdf_bytes
+
+
+# ----------------- Output cache -----------------
+def slide_deck_hash(slide_deck_data) -> str:
+    """Stable hash of the deck JSON (key order does not matter)."""
+    canonical = json.dumps(slide_deck_data, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class PdfCache:
+    """Rendered PDFs by deck hash, evicted least-recently-used once max_bytes is exceeded."""
+
+    def __init__(self, max_bytes: int = PDF_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str):
+        with self._lock:
+            pdf = self._entries.get(key)
+            if pdf is None:
+                self.misses += 1
+                record_cache("pdf", hit=False)
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        record_cache("pdf", hit=True)
+        return pdf
+
+    def put(self, key: str, pdf: bytes):
+        if len(pdf) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._size -= len(self._entries.pop(key))
+            self._entries[key] = pdf
+            self._size += len(pdf)
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._size, 'hits': self.hits, 'misses': self.misses}
+
+
+pdf_cache = PdfCache()
+
+
+def create_pdf_from_slides(slide_deck_data):
+    """Render a deck in the current process, reusing the cached PDF when the same deck was rendered before."""
+    key = slide_deck_hash(slide_deck_data)
+    pdf = pdf_cache.get(key)
+    if pdf is None:
+        with stage("pdf", "render", slides=len(slide_deck_data.get("slide_deck", {}).get("slides", []))):
+            pdf = render_pdf(slide_deck_data)
+        pdf_cache.put(key, pdf)
+    return pdf
+
+
+# ----------------- Off-request rendering -----------------
+_render_pool = None
+_render_pool_lock = threading.Lock()
+
+
+def get_render_pool() -> ProcessPoolExecutor:
+    global _render_pool
+    with _render_pool_lock:
+        if _render_pool is None:
+            _render_pool = ProcessPoolExecutor(
+                max_workers=PDF_RENDER_PROCESSES,
+                mp_context=multiprocessing.get_context(PDF_RENDER_START_METHOD)
+            )
+        return _render_pool
+
+
+def render_pdf_offloaded(slide_deck_data, timeout: float = PDF_RENDER_TIMEOUT):
+    """
+    Same result as create_pdf_from_slides, but cache misses are rendered in
+    the process pool so large decks don't hold the GIL in the web worker.
+    """
+    key = slide_deck_hash(slide_deck_data)
+    pdf = pdf_cache.get(key)
+    if pdf is None:
+        with stage("pdf", "render_offloaded"):
+            pdf = get_render_pool().submit(render_pdf, slide_deck_data).result(timeout=timeout)
+        pdf_cache.put(key, pdf)
+    return pdf
+
+
+# ----------------- Batch export -----------------
+def safe_deck_filename(title: str) -> str:
+    """Sanitized, lower-case file stem for a deck title."""
+    safe_title = "".join(x for x in (title or "") if x.isalnum() or x in (' ', '-', '_')).strip()
+    return safe_title.replace(' ', '_').lower() or "slide_deck"
+
+
+def iter_rendered_pdfs(slide_decks, window: int = None):
+    """
+    Renders many decks in the process pool and yields (index, pdf_bytes, error)
+    as each one finishes. At most `window` renders are in flight, so memory
+    stays bounded however many decks are requested.
+    """
+    window = window or PDF_RENDER_PROCESSES * 2
+    pool = get_render_pool()
+    pending = {}
+    decks = iter(enumerate(slide_decks))
+
+    def submit_next():
+        for index, deck in decks:
+            key = slide_deck_hash(deck)
+            cached = pdf_cache.get(key)
+            if cached is not None:
+                return index, cached
+            pending[pool.submit(render_pdf, deck)] = (index, key)
+            return None
+        return False
+
+    exhausted = False
+    while True:
+        while not exhausted and len(pending) < window:
+            ready = submit_next()
+            if ready is False:
+                exhausted = True
+            elif ready is not None:
+                yield ready[0], ready[1], None
+        if not pending:
+            return
+        done, _ = wait(pending, timeout=PDF_RENDER_TIMEOUT, return_when=FIRST_COMPLETED)
+        if not done:
+            for future, (index, _) in list(pending.items()):
+                future.cancel()
+                yield index, None, "timed out"
+            return
+        for future in done:
+            index, key = pending.pop(future)
+            try:
+                pdf = future.result()
+            except Exception as e:
+                yield index, None, str(e)
+                continue
+            pdf_cache.put(key, pdf)
+            yield index, pdf, None
+
+
+class _ZipChunkBuffer:
+    """Write-only sink for zipfile that hands out what has been written so far."""
+
+    def __init__(self):
+        self._chunks = []
+        self._offset = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._offset
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_zip_of_pdfs(slide_decks):
+    """Yields a zip archive of the rendered decks chunk by chunk, one entry per finished deck."""
+    sink = _ZipChunkBuffer()
+    errors = []
+    width = len(str(len(slide_decks)))
+    with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_STORED) as archive:
+        for index, pdf, error in iter_rendered_pdfs(slide_decks):
+            title = slide_decks[index].get("slide_deck", {}).get("title", "")
+            if error:
+                errors.append(f"{index + 1}. {title or '(untitled)'}: {error}")
+                continue
+            archive.writestr(f"{str(index + 1).zfill(width)}_{safe_deck_filename(title)}.pdf", pdf)
+            yield sink.drain()
+        if errors:
+            archive.writestr("errors.txt", "\n".join(errors) + "\n")
+    yield sink.drain()
+
+
+def batch_zip_filename() -> str:
+    return f"slide_decks_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
+
+
+# ----------------- Benchmark -----------------
+def make_sample_deck(num_slides: int):
+    slide_types = ["paragraph", "unordered_list", "ordered_list"]
+    slides = []
+    for i in range(num_slides):
+        slide_type = slide_types[i % 3]
+        content = (
+            "Amazon EC2 provides resizable compute capacity in the cloud. " * 3
+            if slide_type == "paragraph" else
+            [f"Point {j + 1} about instance types and pricing" for j in range(4)]
+        )
+        slides.append({
+            "slide_id": str(i + 1),
+            "slide_type": slide_type,
+            "slide_title": f"Slide {i + 1}",
+            "slide_content": content
+        })
+    return {"slide_deck": {"title": f"Benchmark Deck ({num_slides} slides)", "topic": "benchmark", "slides": slides}}
+
+
+def benchmark(sizes=(10, 50, 200), repeats: int = 3):
+    """Reports pages/sec for uncached renders and the cached lookup time for each deck size."""
+    results = []
+    get_slide_styles()  # build styles once, as a warm process would have
+    for size in sizes:
+        deck = make_sample_deck(size)
+        pages = size + 1  # title page + one page per slide
+        timings = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            render_pdf(deck)
+            timings.append(time.perf_counter() - start)
+        best = min(timings)
+
+        pdf_cache.put(slide_deck_hash(deck), render_pdf(deck))
+        start = time.perf_counter()
+        create_pdf_from_slides(deck)
+        cached = time.perf_counter() - start
+
+        results.append({
+            'slides': size,
+            'pages': pages,
+            'render_seconds': round(best, 4),
+            'pages_per_sec': round(pages / best, 1),
+            'cached_seconds': round(cached, 6)
+        })
+    return results
+
+
+# Run standalone: python -m backend.slide_pdf --benchmark
+if __name__ == "__main__":
+    if "--benchmark" in sys.argv:
+        for row in benchmark():
+            print(
+                f"{row['slides']:>4} slides: {row['pages_per_sec']:>8} pages/sec "
+                f"({row['render_seconds']}s uncached, {row['cached_seconds']}s cached)"
+            )
+    else:
+        print("Usage: python -m backend.slide_pdf --benchmark")
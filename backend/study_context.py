@@ -0,0 +1,147 @@
+# backend/study_context.py
+#
+# Per-user study context (class, subjects, study topic) entered on the
+# dashboard. It used to live in module globals in app.py, which only worked
+# with a single process and a single user. Contexts are now keyed by a
+# session id kept in the Flask session cookie and stored in a pluggable
+# backend (SQLite books.db by default), with an in-process read-through
+# cache in front. The cookie also carries the context version, so a worker
+# holding an older cached copy notices the change and reads it again.
+
+import os
+import json
+import time
+import uuid
+import secrets
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Tuple
+
+from backend.database import DB_PATH, get_connection
+from backend.metrics import record_cache
+
+# ============= SETTINGS ============
+MEMORY_CACHE_SIZE = 10000   # contexts kept in-process per worker
+SECRET_KEY_PATH = os.path.join(os.path.dirname(str(DB_PATH)), '.flask_secret_key')
+# ==================================
+
+
+def load_secret_key(path: str = SECRET_KEY_PATH) -> str:
+    """
+    FLASK_SECRET_KEY from the environment (set it when running several
+    nodes), otherwise a random key persisted next to books.db so every
+    worker on this machine signs session cookies the same way.
+    """
+    key = os.getenv("FLASK_SECRET_KEY")
+    if key:
+        return key
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            f.write(secrets.token_hex(32))
+    except FileExistsError:
+        pass
+    with open(path) as f:
+        return f.read().strip()
+
+
+class SQLiteContextBackend:
+    """Stores contexts in the study_contexts table of books.db."""
+
+    def __init__(self, db_path=DB_PATH):
+        self.db_path = db_path
+
+    def load(self, session_id: str) -> Optional[Tuple[int, Dict[str, Any]]]:
+        row = get_connection(self.db_path).execute(
+            'SELECT class_name, subjects, study_topic, version FROM study_contexts WHERE session_id = ?',
+            (session_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return row[3], {'class': row[0], 'subjects': json.loads(row[1] or '[]'), 'study_topic': row[2]}
+
+    def save(self, session_id: str, context: Dict[str, Any], version: int):
+        get_connection(self.db_path).execute('''
+            INSERT INTO study_contexts (session_id, class_name, subjects, study_topic, version, updated_at)
+            VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT(session_id) DO UPDATE SET
+                class_name = excluded.class_name,
+                subjects = excluded.subjects,
+                study_topic = excluded.study_topic,
+                version = excluded.version,
+                updated_at = excluded.updated_at
+        ''', (session_id, context.get('class'), json.dumps(context.get('subjects') or []),
+              context.get('study_topic'), version))
+
+
+class StudyContextStore:
+    """
+    Read-through cache over a backend with load(session_id) -> (version, context)
+    and save(session_id, context, version). Any object with those two methods
+    (Redis, a shared SQL server...) can be passed as the backend.
+    """
+
+    def __init__(self, backend=None, memory_size: int = MEMORY_CACHE_SIZE):
+        self.backend = backend or SQLiteContextBackend()
+        self.memory_size = memory_size
+        self._memory: "OrderedDict[str, Tuple[int, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'memory_hits': 0, 'backend_reads': 0, 'misses': 0, 'saves': 0}
+
+    def _remember(self, session_id: str, version: int, context: Dict[str, Any]):
+        with self._lock:
+            self._memory[session_id] = (version, context)
+            self._memory.move_to_end(session_id)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+
+    def get(self, session_id: str, version: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """
+        Returns the context for session_id. `version` is the one the client's
+        cookie says it last saved; a cached copy with a different version is
+        stale (another worker handled the update) and is read again.
+        """
+        with self._lock:
+            cached = self._memory.get(session_id)
+            if cached is not None and (version is None or cached[0] == version):
+                self._memory.move_to_end(session_id)
+                self._stats['memory_hits'] += 1
+                record_cache("study_context", hit=True)
+                return dict(cached[1])
+        record_cache("study_context", hit=False)
+
+        try:
+            loaded = self.backend.load(session_id)
+        except sqlite3.Error as e:
+            print(f"Study context read failed: {e}")
+            loaded = None
+
+        with self._lock:
+            if loaded is None:
+                self._stats['misses'] += 1
+                return None
+            self._stats['backend_reads'] += 1
+        self._remember(session_id, *loaded)
+        return dict(loaded[1])
+
+    def save(self, session_id: str, context: Dict[str, Any]) -> int:
+        """Stores the context and returns its new version."""
+        version = time.time_ns()
+        self.backend.save(session_id, context, version)
+        self._remember(session_id, version, dict(context))
+        with self._lock:
+            self._stats['saves'] += 1
+        return version
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._stats, 'memory_entries': len(self._memory)}
+
+
+def new_session_id() -> str:
+    return uuid.uuid4().hex
+
+
+# Process-wide store
+study_context_store = StudyContextStore()
@@ -0,0 +1,284 @@
+# backend/tracing.py
+#
+# Sampled request tracing. A sampled request records a tree of nested spans
+# (retrieval, every LLM call, each grading task, PDF rendering...) with
+# attributes such as the book, k and token counts, and the finished trace
+# is appended as one JSON line to a size-rotated file. Unsampled requests
+# only pay for a contextvar lookup per span.
+#   TRACE_SAMPLE_RATE   fraction of requests traced (default 0.01, 0 disables)
+#   TRACE_FILE          output file (default traces/traces.jsonl)
+# Summarize: python -m backend.tracing [--top 10] [--name /grade_quiz] [file]
+
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+# ============= SETTINGS ============
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.01"))
+TRACE_FILE = os.getenv("TRACE_FILE", os.path.join("traces", "traces.jsonl"))
+TRACE_MAX_BYTES = int(os.getenv("TRACE_MAX_BYTES", str(20 * 1024 * 1024)))
+TRACE_BACKUPS = 5
+MAX_SPANS_PER_TRACE = 2000   # runaway fan-outs are truncated, not unbounded
+# ==================================
+
+_current_span: "contextvars.ContextVar[Optional[Span]]" = contextvars.ContextVar("current_span", default=None)
+
+
+class Trace:
+    def __init__(self, name: str, attrs: Dict[str, Any]):
+        self.trace_id = uuid.uuid4().hex
+        self.name = name
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.spans: List[Dict[str, Any]] = []
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self.root = Span(self, None, name, attrs)
+
+    def add(self, span_record: Dict[str, Any]):
+        with self._lock:
+            if len(self.spans) >= MAX_SPANS_PER_TRACE:
+                self.dropped += 1
+            else:
+                self.spans.append(span_record)
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: (s['parent_id'] is not None, s['start_ms']))
+        # The root span comes first
+        return {
+            'trace_id': self.trace_id,
+            'name': self.name,
+            'started_at': self.started_at,
+            'duration_ms': spans[0]['duration_ms'] if spans and spans[0]['parent_id'] is None else None,
+            'pid': os.getpid(),
+            'dropped_spans': self.dropped,
+            'spans': spans,
+        }
+
+
+class Span:
+    __slots__ = ("trace", "span_id", "parent_id", "name", "attrs", "start", "error", "thread")
+
+    def __init__(self, trace: Trace, parent: Optional["Span"], name: str, attrs: Dict[str, Any]):
+        self.trace = trace
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.name = name
+        self.attrs = dict(attrs)
+        self.start = time.perf_counter()
+        self.error = None
+        self.thread = threading.current_thread().name
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def finish(self):
+        self.trace.add({
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'start_ms': round((self.start - self.trace.start) * 1000, 3),
+            'duration_ms': round((time.perf_counter() - self.start) * 1000, 3),
+            'thread': self.thread,
+            'attrs': self.attrs,
+            'error': self.error,
+        })
+
+
+# ----------------- Writer -----------------
+_write_lock = threading.Lock()
+
+
+def _rotate(path: str):
+    for i in range(TRACE_BACKUPS - 1, 0, -1):
+        older = f"{path}.{i}"
+        if os.path.exists(older):
+            os.replace(older, f"{path}.{i + 1}")
+    os.replace(path, f"{path}.1")
+
+
+def write_trace(trace: Trace, path: str = TRACE_FILE):
+    line = json.dumps(trace.to_dict(), default=str) + "\n"
+    try:
+        with _write_lock:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            if os.path.exists(path) and os.path.getsize(path) + len(line) > TRACE_MAX_BYTES:
+                _rotate(path)
+            # O_APPEND keeps lines from different gunicorn workers whole
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(line)
+    except OSError as e:
+        print(f"Trace write failed: {e}")
+
+
+# ----------------- API -----------------
+def begin_trace(name: str, sample_rate: Optional[float] = None, **attrs):
+    """
+    Starts a sampled root span and makes it current. Returns a token for
+    end_trace, or None when this request isn't sampled.
+    """
+    rate = TRACE_SAMPLE_RATE if sample_rate is None else sample_rate
+    if rate <= 0 or random.random() >= rate:
+        return None
+    trace = Trace(name, attrs)
+    return trace.root, _current_span.set(trace.root)
+
+
+def end_trace(token, error: Optional[str] = None, **attrs):
+    """Finishes the root span started by begin_trace and writes the trace."""
+    if token is None:
+        return
+    root, var_token = token
+    root.set(**attrs)
+    root.error = error
+    root.finish()
+    try:
+        _current_span.reset(var_token)
+    except ValueError:
+        # Reset from a different context (e.g. after a streamed response)
+        _current_span.set(None)
+    write_trace(root.trace)
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """Records a child span of the current span; a no-op outside a sampled trace."""
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+    current = Span(parent.trace, parent, name, attrs)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current_span.reset(token)
+        current.finish()
+
+
+def set_attributes(**attrs):
+    """Adds attributes to the current span (book, k, prompt_tokens...), if any."""
+    current = _current_span.get()
+    if current is not None:
+        current.set(**attrs)
+
+
+def is_tracing() -> bool:
+    return _current_span.get() is not None
+
+
+def bind_context(fn):
+    """
+    Wraps fn so it runs in the caller's context on another thread (grading
+    workers, slide executors), keeping its spans under the caller's span.
+    """
+    if _current_span.get() is None:
+        return fn
+    ctx = contextvars.copy_context()
+
+    def bound(*args, **kwargs):
+        return ctx.copy().run(fn, *args, **kwargs)
+    return bound
+
+
+# ----------------- Summarizer -----------------
+def load_traces(path: str = TRACE_FILE) -> List[Dict[str, Any]]:
+    traces = []
+    for candidate in [path] + [f"{path}.{i}" for i in range(1, TRACE_BACKUPS + 1)]:
+        if not os.path.exists(candidate):
+            continue
+        with open(candidate, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    traces.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+    return traces
+
+
+def _end(s: Dict[str, Any]) -> float:
+    return s['start_ms'] + s['duration_ms']
+
+
+def critical_path(trace: Dict[str, Any]) -> List[Tuple[int, Dict[str, Any]]]:
+    """
+    The spans that determined the trace's duration, as (depth, span) pairs.
+    Inside each span, walk back from its end: the child that finished last,
+    then the child that finished last before that one started, and so on;
+    each of those is expanded the same way. Parallel siblings that finished
+    earlier were not waited on and are left out.
+    """
+    children: Dict[Optional[str], List[Dict[str, Any]]] = {}
+    for s in trace.get('spans', []):
+        children.setdefault(s['parent_id'], []).append(s)
+    roots = children.get(None, [])
+    if not roots:
+        return []
+
+    def expand(parent: Dict[str, Any], depth: int) -> List[Tuple[int, Dict[str, Any]]]:
+        out = [(depth, parent)]
+        chain = []
+        cutoff = _end(parent) + 0.001
+        candidates = list(children.get(parent['span_id'], []))
+        while candidates:
+            before = [c for c in candidates if _end(c) <= cutoff]
+            if not before:
+                break
+            last = max(before, key=_end)
+            chain.append(last)
+            cutoff = last['start_ms'] + 0.001
+            candidates = [c for c in before if c is not last]
+        for child in reversed(chain):
+            out += expand(child, depth + 1)
+        return out
+
+    return expand(roots[0], 0)
+
+
+def summarize(traces: List[Dict[str, Any]], top: int = 10, name: Optional[str] = None) -> str:
+    if name:
+        traces = [t for t in traces if t.get('name') == name]
+    traces = [t for t in traces if t.get('duration_ms') is not None]
+    traces.sort(key=lambda t: -t['duration_ms'])
+    out = [f"{len(traces)} traces" + (f" for {name}" if name else "")]
+    for t in traces[:top]:
+        started = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(t['started_at']))
+        root_attrs = t['spans'][0].get('attrs', {}) if t['spans'] else {}
+        out.append(f"\n{t['duration_ms']:>10.1f} ms  {t['name']}  {started}  trace={t['trace_id']}  {json.dumps(root_attrs)}")
+        by_name: Dict[str, List[float]] = {}
+        for s in t['spans'][1:]:
+            by_name.setdefault(s['name'], []).append(s['duration_ms'])
+        for span_name, durations in sorted(by_name.items(), key=lambda kv: -sum(kv[1]))[:6]:
+            out.append(f"    {span_name:<34} x{len(durations):<4} total {sum(durations):>9.1f} ms  max {max(durations):>8.1f} ms")
+        out.append("    critical path:")
+        for depth, s in critical_path(t):
+            attrs = f"  {json.dumps(s['attrs'])}" if s.get('attrs') and depth else ""
+            err = f"  ERROR {s['error']}" if s.get('error') else ""
+            out.append(f"      {'  ' * depth}{s['name']}  {s['duration_ms']:.1f} ms{attrs}{err}")
+    return "\n".join(out)
+
+
+# Run standalone: python -m backend.tracing [--top N] [--name ROUTE] [file]
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize the slowest sampled traces")
+    parser.add_argument("file", nargs="?", default=TRACE_FILE)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--name", help="only traces whose root is this route, e.g. /grade_quiz")
+    args = parser.parse_args()
+    traces = load_traces(args.file)
+    if not traces:
+        print(f"No traces found in {args.file}")
+        sys.exit(1)
+    print(summarize(traces, args.top, args.name))
@@ -0,0 +1,266 @@
+# backend/uploads.py
+#
+# Book uploads that never hold the file in memory. Bytes are streamed to a
+# part file under books/.uploads while a SHA-256 is updated on the fly, then
+# moved into books/ with a rename. Large books can be sent as a resumable
+# upload: create it, append chunks at the offset the server reports, and
+# after a dropped connection ask for the offset and carry on from there.
+# When the finished content matches a book that is already indexed, the new
+# name is linked to the existing file and index instead of indexing again.
+# Only the hash computed here over the received bytes is trusted for that;
+# a hash the client declares up front is just checked against it.
+
+import os
+import re
+import uuid
+import fcntl
+import shutil
+import hashlib
+import threading
+from typing import Optional, Dict, Any, Tuple, BinaryIO
+
+from backend import book_catalog
+from backend.database import query_one, query_all, execute
+
+# ============= SETTINGS ============
+BOOKS_FOLDER = "./books"
+INDEX_FOLDER = "./chroma_index"
+UPLOAD_DIR = os.path.join(BOOKS_FOLDER, ".uploads")
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(1024 * 1024 * 1024)))   # 1GB per book
+UPLOAD_CHUNK_BYTES = 8 * 1024 * 1024      # chunk size suggested to clients
+COPY_BUFFER_BYTES = 1024 * 1024
+STALE_UPLOAD_HOURS = 72                    # unfinished uploads are discarded after this
+# ==================================
+
+
+class UploadError(Exception):
+    """Rejected upload; `status` is the HTTP status the route answers with."""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+class UploadOffsetMismatch(UploadError):
+    """The chunk does not start where the part file ends; the client resumes from `offset`."""
+
+    def __init__(self, offset: int):
+        super().__init__(f"Upload is at offset {offset}", status=409)
+        self.offset = offset
+
+
+def _part_path(upload_id: str) -> str:
+    # Upload ids come from the URL; only ids this module issued map to a path
+    if not re.fullmatch(r'[0-9a-f]{32}', upload_id):
+        raise UploadError("Unknown or expired upload", status=404)
+    return os.path.join(UPLOAD_DIR, f"{upload_id}.part")
+
+
+def _copy_hashing(stream: BinaryIO, out: BinaryIO, digest, limit: int) -> int:
+    """Copies stream into out in fixed-size reads, hashing as it goes. Returns bytes copied."""
+    copied = 0
+    while True:
+        block = stream.read(COPY_BUFFER_BYTES)
+        if not block:
+            return copied
+        copied += len(block)
+        if copied > limit:
+            raise UploadError(f"Upload exceeds the {MAX_UPLOAD_BYTES // (1024 * 1024)}MB limit", status=413)
+        out.write(block)
+        digest.update(block)
+
+
+# ----------------- Placing a finished file -----------------
+def _link_to_existing(existing: Dict[str, Any], filename: str) -> Dict[str, Any]:
+    """
+    Makes `filename` another name for an indexed book with the same content:
+    a hard link to its PDF and a symlink to its index folder.
+    """
+    if existing['name'] == filename:
+        return existing
+    source = os.path.join(BOOKS_FOLDER, existing['name'])
+    target = os.path.join(BOOKS_FOLDER, filename)
+    if os.path.exists(target):
+        os.remove(target)
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+
+    index_link = os.path.join(INDEX_FOLDER, book_catalog.index_dir_name(filename))
+    if os.path.islink(index_link):
+        os.remove(index_link)
+    os.symlink(book_catalog.index_dir_name(existing['name']), index_link)
+
+    book_catalog.register_book(target, sha256=existing['sha256'], index_status="indexed")
+    book_catalog.mark_indexed(filename, existing['page_count'], existing['chunk_count'])
+    return book_catalog.get_book(filename)
+
+
+def place_upload(staged_path: str, sha256: str, filename: str) -> Tuple[Dict[str, Any], bool]:
+    """
+    Moves a fully received file into books/ and registers it. Returns
+    (book, duplicate); a duplicate reuses the existing index and the staged
+    copy is discarded.
+    """
+    existing = book_catalog.find_indexed_by_sha256(sha256)
+    index_path = os.path.join(INDEX_FOLDER, book_catalog.index_dir_name(filename))
+    # A name with an index of its own is re-indexed as a new version rather
+    # than linked, so readers of that index are never cut off
+    has_own_index = os.path.isdir(index_path) and not os.path.islink(index_path)
+    if existing and os.path.exists(os.path.join(BOOKS_FOLDER, existing['name'])) and (
+            existing['name'] == filename or not has_own_index):
+        os.remove(staged_path)
+        print(f"Upload of '{filename}' matches indexed book '{existing['name']}', linking")
+        return _link_to_existing(existing, filename), True
+
+    file_path = os.path.join(BOOKS_FOLDER, filename)
+    if os.path.islink(index_path):
+        # The name used to alias another book; new content gets its own index
+        os.remove(index_path)
+    os.replace(staged_path, file_path)
+    return book_catalog.register_book(file_path, sha256=sha256), False
+
+
+def save_stream(stream: BinaryIO, filename: str) -> Tuple[Dict[str, Any], bool]:
+    """Streams a single-request upload (e.g. a multipart file) to disk and places it."""
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    staged_path = _part_path(uuid.uuid4().hex)
+    digest = hashlib.sha256()
+    try:
+        with open(staged_path, 'wb') as out:
+            _copy_hashing(stream, out, digest, MAX_UPLOAD_BYTES)
+        return place_upload(staged_path, digest.hexdigest(), filename)
+    except BaseException:
+        if os.path.exists(staged_path):
+            os.remove(staged_path)
+        raise
+
+
+# ----------------- Resumable uploads -----------------
+# The part file's length is the offset, so any worker can continue an upload.
+# Each worker remembers the running hash of uploads it has appended to; a
+# worker that did not see the previous chunk re-reads the part file once.
+_hashers: Dict[str, Tuple[int, Any]] = {}
+_hashers_lock = threading.Lock()
+
+
+def _upload_row(upload_id: str) -> Dict[str, Any]:
+    row = query_one('SELECT filename, size_bytes, expected_sha256 FROM uploads WHERE upload_id = ?', (upload_id,))
+    if row is None:
+        raise UploadError("Unknown or expired upload", status=404)
+    return {'filename': row[0], 'size': row[1], 'expected_sha256': row[2]}
+
+
+def _hasher_at(upload_id: str, offset: int):
+    with _hashers_lock:
+        cached = _hashers.pop(upload_id, None)
+    if cached is not None and cached[0] == offset:
+        return cached[1]
+    digest = hashlib.sha256()
+    with open(_part_path(upload_id), 'rb') as f:
+        for block in iter(lambda: f.read(COPY_BUFFER_BYTES), b''):
+            digest.update(block)
+    return digest
+
+
+def create_upload(filename: str, size: int, sha256: Optional[str] = None) -> Dict[str, Any]:
+    if not filename.lower().endswith('.pdf'):
+        raise UploadError("Only PDF files are supported")
+    if size <= 0:
+        raise UploadError("Upload size must be positive")
+    if size > MAX_UPLOAD_BYTES:
+        raise UploadError(f"Upload exceeds the {MAX_UPLOAD_BYTES // (1024 * 1024)}MB limit", status=413)
+    upload_id = uuid.uuid4().hex
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    open(_part_path(upload_id), 'wb').close()
+    execute('INSERT INTO uploads (upload_id, filename, size_bytes, expected_sha256) VALUES (?, ?, ?, ?)',
+            (upload_id, filename, size, sha256.lower() if sha256 else None))
+    return {'upload_id': upload_id, 'offset': 0, 'size': size, 'chunk_size': UPLOAD_CHUNK_BYTES}
+
+
+def upload_status(upload_id: str) -> Dict[str, Any]:
+    upload = _upload_row(upload_id)
+    path = _part_path(upload_id)
+    offset = os.path.getsize(path) if os.path.exists(path) else 0
+    return {'upload_id': upload_id, 'offset': offset, 'size': upload['size'], 'filename': upload['filename']}
+
+
+def append_chunk(upload_id: str, offset: int, stream: BinaryIO) -> Dict[str, Any]:
+    """
+    Appends the request body at `offset`. When the last byte arrives the
+    upload is verified and placed; the result then carries the book and
+    whether it was a duplicate.
+    """
+    upload = _upload_row(upload_id)
+    try:
+        # No O_CREAT: a part file that was just finished or aborted stays gone
+        fd = os.open(_part_path(upload_id), os.O_WRONLY | os.O_APPEND)
+    except FileNotFoundError:
+        raise UploadError("Unknown or expired upload", status=404)
+
+    with os.fdopen(fd, 'ab') as out:
+        # Serializes writers to one upload across threads and workers
+        fcntl.flock(out.fileno(), fcntl.LOCK_EX)
+        current = os.fstat(out.fileno()).st_size
+        if current != offset:
+            raise UploadOffsetMismatch(current)
+        digest = _hasher_at(upload_id, current)
+        try:
+            copied = _copy_hashing(stream, out, digest, upload['size'] - current)
+        except UploadError:
+            # Drop the partial chunk so the client can resend it
+            out.truncate(current)
+            raise UploadError("Chunk runs past the declared upload size", status=400)
+        except Exception:
+            # A dropped connection keeps what arrived; the client asks for the
+            # offset and resumes. The next chunk re-reads the part file for the hash.
+            out.flush()
+            raise
+        out.flush()
+        offset = current + copied
+        with _hashers_lock:
+            _hashers[upload_id] = (offset, digest)
+        execute('UPDATE uploads SET updated_at = CURRENT_TIMESTAMP WHERE upload_id = ?', (upload_id,))
+
+        if offset < upload['size']:
+            return {'status': 'in_progress', 'upload_id': upload_id, 'offset': offset, 'size': upload['size']}
+        return _finish(upload_id, upload, digest.hexdigest())
+
+
+def _finish(upload_id: str, upload: Dict[str, Any], sha256: str) -> Dict[str, Any]:
+    with _hashers_lock:
+        _hashers.pop(upload_id, None)
+    execute('DELETE FROM uploads WHERE upload_id = ?', (upload_id,))
+    if upload['expected_sha256'] and upload['expected_sha256'] != sha256:
+        os.remove(_part_path(upload_id))
+        raise UploadError("Uploaded content does not match the declared SHA-256", status=422)
+    book, duplicate = place_upload(_part_path(upload_id), sha256, upload['filename'])
+    return {
+        'status': 'duplicate' if duplicate else 'complete',
+        'upload_id': upload_id,
+        'offset': upload['size'],
+        'size': upload['size'],
+        'sha256': sha256,
+        'book': book,
+    }
+
+
+def abort_upload(upload_id: str) -> bool:
+    with _hashers_lock:
+        _hashers.pop(upload_id, None)
+    deleted = execute('DELETE FROM uploads WHERE upload_id = ?', (upload_id,)).rowcount
+    if os.path.exists(_part_path(upload_id)):
+        os.remove(_part_path(upload_id))
+    return bool(deleted)
+
+
+def expire_stale_uploads(max_age_hours: int = STALE_UPLOAD_HOURS) -> int:
+    """Discards unfinished uploads that have not received a chunk for max_age_hours."""
+    rows = query_all(
+        "SELECT upload_id FROM uploads WHERE updated_at < datetime('now', ?)",
+        (f'-{int(max_age_hours)} hours',)
+    )
+    for (upload_id,) in rows:
+        abort_upload(upload_id)
+    return len(rows)
@@ -0,0 +1,42 @@
+# gunicorn.conf.py
+#
+#   gunicorn -c gunicorn.conf.py wsgi:app
+#   WEB_WORKER_CLASS=uvicorn.workers.UvicornWorker gunicorn -c gunicorn.conf.py asgi:application
+#
+# Every setting can be overridden from the environment:
+#   WEB_CONCURRENCY   worker processes         (default: number of cores)
+#   WEB_THREADS       threads per worker       (default: 8; requests mostly wait on Groq)
+#   WEB_TIMEOUT       worker timeout, seconds  (default: 180; slide decks and quizzes are slow)
+#   WEB_BIND          listen address           (default: 0.0.0.0:5089)
+#   WEB_WORKER_CLASS  worker type              (default: gthread; the async entry point needs
+#                                               uvicorn.workers.UvicornWorker, which ignores WEB_THREADS)
+
+import os
+import multiprocessing
+
+bind = os.getenv("WEB_BIND", "0.0.0.0:5089")
+workers = int(os.getenv("WEB_CONCURRENCY", str(multiprocessing.cpu_count())))
+threads = int(os.getenv("WEB_THREADS", "8"))
+worker_class = os.getenv("WEB_WORKER_CLASS", "gthread")
+timeout = int(os.getenv("WEB_TIMEOUT", "180"))
+graceful_timeout = int(os.getenv("WEB_GRACEFUL_TIMEOUT", "30"))
+keepalive = 5
+
+# Import wsgi (app + MiniLM + index page cache) once in the master, then fork
+preload_app = True
+
+# Recycle workers now and then to cap memory creep from long-lived threads
+max_requests = int(os.getenv("WEB_MAX_REQUESTS", "2000"))
+max_requests_jitter = 200
+
+accesslog = os.getenv("WEB_ACCESS_LOG", "-")
+errorlog = "-"
+
+
+def post_fork(server, worker):
+    # torch must not reuse the master's intra-op thread pool after fork
+    try:
+        import torch
+        torch.set_num_threads(int(os.getenv("OMP_NUM_THREADS", "1")))
+    except ImportError:
+        pass
@@ -1,10 +1,12 @@
 import os
 import glob
 import sys
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
+
+from backend import book_catalog, index_versions, book_artifacts
+from backend.metrics import stage
+from backend.chapters import chapter_map, chapter_for_page
+# PyPDFLoader, the text splitter and Chroma are imported inside the functions
+# that use them so importing the indexer (at app startup) stays cheap.
 
 
 # ============= SETTINGS ============
@@ -23,6 +25,7 @@ def find_book(book_name: str, folder: str):
 
 def load_book(path: str):
     """Load a PDF into LangChain documents (page by page)"""
+    from langchain_community.document_loaders import PyPDFLoader
     loader = PyPDFLoader(path)
     return loader.load()
 
@@ -33,44 +36,79 @@ def indexer(embeddings, BOOK_NAME: str):
         print(f"No PDF found with name containing '{BOOK_NAME}' in {BOOKS_FOLDER}")
         return False
     print(f"Found book: {book_path}")
+    catalog_name = os.path.basename(book_path)
+    book_catalog.mark_indexing(catalog_name)
 
-    # Step 2: Load book (pages)
-    docs = load_book(book_path)
-    print(f"Loaded {len(docs)} pages from PDF")
+    # A malformed PDF or outline fails the book instead of leaving it 'indexing'
+    try:
+        # Step 2: Load book (pages)
+        with stage("indexing", "load_pdf", book=catalog_name):
+            docs = load_book(book_path)
+        print(f"Loaded {len(docs)} pages from PDF")
 
-    if not docs:
-        print("No text extracted from PDF (might be scanned images).")
-        return False
+        if not docs:
+            print("No text extracted from PDF (might be scanned images).")
+            book_catalog.mark_index_failed(catalog_name, "No text extracted from PDF")
+            return False
 
-    # Step 3: Split each page into max 100-token chunks
-    splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
-        chunk_size=100,    # max 100 tokens
-        chunk_overlap=20   # allow some overlap
-    )
-    chunks = splitter.split_documents(docs)
-    print(f"Split {len(docs)} pages into {len(chunks)} chunks (≤100 tokens each)")
+        # Step 3: Detect chapters (PDF outline, else headings) and tag every page
+        # with them; the splitter copies page metadata onto each chunk, so
+        # retrieval can filter by chapter or page range before scoring
+        page_texts = {int(d.metadata.get('page', i)) + 1: d.page_content for i, d in enumerate(docs)}
+        with stage("indexing", "chapters", pages=len(docs)):
+            chapters = chapter_map(book_path, max(page_texts), page_texts)
+        for i, doc in enumerate(docs):
+            page_number = int(doc.metadata.get('page', i)) + 1
+            chapter = chapter_for_page(chapters["chapters"], page_number)
+            doc.metadata['page_number'] = page_number
+            if chapter is not None:
+                doc.metadata['chapter'] = chapter["index"]
+                doc.metadata['chapter_title'] = chapter["title"]
+        print(f"Found {len(chapters['chapters'])} chapters ({chapters['source']})")
 
-    # Step 4: Initialize embeddings
+        # Step 4: Split each page into max 100-token chunks
+        from langchain_text_splitters import RecursiveCharacterTextSplitter
+        splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
+            chunk_size=100,    # max 100 tokens
+            chunk_overlap=20   # allow some overlap
+        )
+        with stage("indexing", "split", pages=len(docs)):
+            chunks = splitter.split_documents(docs)
+        print(f"Split {len(docs)} pages into {len(chunks)} chunks (≤100 tokens each)")
+    except Exception as e:
+        print(f"Error reading '{BOOK_NAME}': {str(e)}")
+        book_catalog.mark_index_failed(catalog_name, str(e))
+        return False
+
+    # Step 5: Initialize embeddings
     # embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
 
-    # Step 5: Save each book in its own folder
-    book_index_folder = os.path.join(INDEX_FOLDER, BOOK_NAME.replace(" ", "_"))
-    
-    # Ensure the book index folder exists and has proper permissions
-    os.makedirs(book_index_folder, exist_ok=True)
-    os.chmod(book_index_folder, 0o777)  # Full read/write permissions
+    # Step 6: Save each book in its own folder, as a new version that
+    # replaces the live one only once it is complete
+    index_name = BOOK_NAME.replace(" ", "_")
     
     try:
-        db = Chroma.from_documents(
-            documents=chunks,
-            embedding=embeddings,
-            persist_directory=book_index_folder
-        )
-        db.persist()
-        print(f"Index for '{BOOK_NAME}' saved in {book_index_folder}")
+        from langchain_community.vectorstores import Chroma
+        with stage("indexing", "embed_and_store", chunks=len(chunks)):
+            with index_versions.build(index_name, INDEX_FOLDER) as book_index_folder:
+                os.chmod(book_index_folder, 0o777)  # Full read/write permissions
+                db = Chroma.from_documents(
+                    documents=chunks,
+                    embedding=embeddings,
+                    persist_directory=book_index_folder
+                )
+                db.persist()
+                del db
+        print(f"Index for '{BOOK_NAME}' saved in {os.path.join(INDEX_FOLDER, index_name)}")
+        book_catalog.mark_indexed(catalog_name, page_count=len(docs), chunk_count=len(chunks))
+        # The map the chunks were tagged with; centroids, summaries and the
+        # default deck follow in the background
+        book_artifacts.store_chapter_map(catalog_name, chapters)
+        book_artifacts.schedule(catalog_name, page_texts)
         return True
     except Exception as e:
         print(f"Error creating index: {str(e)}")
+        book_catalog.mark_index_failed(catalog_name, str(e))
         return False
 
 
@@ -0,0 +1,9 @@
+# tests/conftest.py
+#
+# Makes the repository root importable, so tests can `from backend import ...`
+# the same way app.py does.
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,112 @@
+# tests/test_admission.py
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from backend.admission import AdmissionController, AdmissionRejected
+
+COSTS = {"/cheap": 1, "/deck": 4}
+
+
+def _controller(**kwargs):
+    options = dict(capacity=4, max_queue=2, queue_timeout=2.0, per_client=10, costs=COSTS)
+    options.update(kwargs)
+    return AdmissionController(**options)
+
+
+def _acquire_in_thread(controller, route, client):
+    result = {}
+
+    def run():
+        try:
+            result['ticket'] = controller.acquire(route, client)
+        except AdmissionRejected as e:
+            result['error'] = e
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread, result
+
+
+def _wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.005)
+    return condition()
+
+
+def test_accepts_within_capacity():
+    controller = _controller()
+    tickets = [controller.acquire("/cheap", f"c{i}") for i in range(4)]
+    assert all(t.granted for t in tickets)
+    assert controller.stats()['in_use'] == 4
+
+
+def test_queues_until_capacity_is_released():
+    controller = _controller()
+    running = controller.acquire("/deck", "a")
+    thread, result = _acquire_in_thread(controller, "/cheap", "b")
+    assert _wait_for(lambda: controller.stats()['waiting'] == 1)
+
+    controller.release(running)
+    thread.join(2)
+    assert result['ticket'].granted
+    assert controller.stats()['queued'] == 1
+
+
+def test_rejects_when_the_route_queue_is_full():
+    controller = _controller(max_queue=1)
+    running = controller.acquire("/deck", "a")
+    thread, result = _acquire_in_thread(controller, "/cheap", "b")
+    assert _wait_for(lambda: controller.stats()['waiting'] == 1)
+
+    with pytest.raises(AdmissionRejected) as rejected:
+        controller.acquire("/cheap", "c")
+    assert rejected.value.status == 503
+    assert rejected.value.retry_after >= 1
+
+    controller.release(running)
+    thread.join(2)
+    assert result['ticket'].granted
+
+
+def test_rejects_a_client_over_its_limit():
+    controller = _controller(per_client=2)
+    controller.acquire("/cheap", "greedy")
+    controller.acquire("/cheap", "greedy")
+    with pytest.raises(AdmissionRejected) as rejected:
+        controller.acquire("/cheap", "greedy")
+    assert rejected.value.status == 429
+    assert controller.acquire("/cheap", "someone-else").granted
+
+
+def test_times_out_waiting():
+    controller = _controller(queue_timeout=0.05)
+    controller.acquire("/deck", "a")
+    with pytest.raises(AdmissionRejected) as rejected:
+        controller.acquire("/cheap", "b")
+    assert rejected.value.status == 503
+    assert controller.stats()['timed_out'] == 1
+    assert controller.stats()['waiting'] == 0
+
+
+def test_costlier_than_capacity_runs_alone():
+    controller = _controller(capacity=2)
+    assert controller.acquire("/deck", "a").granted
+
+
+def test_async_waiters_are_woken_in_order():
+    controller = _controller()
+
+    async def scenario():
+        running = await controller.acquire_async("/deck", "a")
+        waiter = asyncio.ensure_future(controller.acquire_async("/cheap", "b"))
+        await asyncio.sleep(0.01)
+        assert not waiter.done()
+        controller.release(running)
+        return await asyncio.wait_for(waiter, 1)
+
+    assert asyncio.run(scenario()).granted
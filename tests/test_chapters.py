@@ -0,0 +1,90 @@
+# tests/test_chapters.py
+
+import pytest
+
+from backend.chapters import heading_chapters, page_window_chapters, chapter_for_page
+
+
+def _summary(chapters):
+    return [(c["title"], c["start_page"], c["end_page"], c.get("part")) for c in chapters]
+
+
+# Pages whose top lines repeat the running header -> (title, start, end, part)
+LAYOUTS = {
+    "parts with running headers": (
+        {
+            1: "Part 1\nFoundations",
+            2: "Part 1\nChapter 1\nBasics",
+            3: "Part 1\nChapter 1\nmore basics",
+            4: "Part 1\nChapter 2\nTools",
+            5: "Part 1\nChapter 2\nmore tools",
+            6: "Part 2\nPractice",
+            7: "Part 2\nChapter 3\nProjects",
+            8: "Part 2\nChapter 3\nmore projects",
+        },
+        [
+            ("Part 1: Foundations", 1, 1, None),
+            ("Chapter 1: Basics", 2, 3, "Part 1: Foundations"),
+            ("Chapter 2: Tools", 4, 5, "Part 1: Foundations"),
+            ("Part 2: Practice", 6, 6, None),
+            ("Chapter 3: Projects", 7, 8, "Part 2: Practice"),
+        ],
+    ),
+    "chapter numbers restart in each part": (
+        {
+            1: "Part I\nChapter 1\nIntro",
+            2: "Chapter 1\ntext",
+            3: "Part II\nChapter 1\nAdvanced",
+            4: "Chapter 1\ntext",
+        },
+        [
+            ("Chapter 1: Intro", 1, 2, "Part I"),
+            ("Chapter 1: Advanced", 3, 4, "Part II"),
+        ],
+    ),
+    "contents page and front matter": (
+        {
+            1: "A Book Title",
+            2: "Contents\nChapter 1 Intro\nChapter 2 Next\nChapter 3 Last",
+            3: "Chapter 1\nIntro",
+            4: "Chapter 1\nbody",
+            5: "Chapter 2: Next",
+            6: "Chapter III Last",
+        },
+        [
+            ("Front matter", 1, 2, None),
+            ("Chapter 1: Intro", 3, 4, None),
+            ("Chapter 2: Next", 5, 5, None),
+            ("Chapter III Last", 6, 6, None),
+        ],
+    ),
+}
+
+
+@pytest.mark.parametrize("name", sorted(LAYOUTS))
+def test_heading_layouts(name):
+    pages, expected = LAYOUTS[name]
+    assert _summary(heading_chapters(pages, max(pages))) == expected
+
+
+def test_sections_attach_to_their_chapter():
+    pages = {
+        1: "Chapter 1\nIntro",
+        2: "Chapter 1\n1.1 Setup\ntext",
+        3: "Chapter 2\nNext",
+        4: "Chapter 2\n2.1 Deeper\ntext",
+        5: "Chapter 2\n1.2 Stray reference",
+    }
+    chapters = heading_chapters(pages, 5)
+    assert [[s["title"] for s in c["sections"]] for c in chapters] == [["1.1 Setup"], ["2.1 Deeper"]]
+
+
+def test_too_few_headings_is_no_map():
+    assert heading_chapters({1: "Chapter 1\nOnly one", 2: "text"}, 2) == []
+
+
+def test_page_windows_cover_every_page():
+    chapters = page_window_chapters(25, window=10)
+    assert [(c["start_page"], c["end_page"]) for c in chapters] == [(1, 10), (11, 20), (21, 25)]
+    assert chapter_for_page(chapters, 15)["index"] == 1
+    assert chapter_for_page(chapters, 26) is None
@@ -0,0 +1,42 @@
+# tests/test_grading_cache.py
+
+import pytest
+
+from backend.grading_cache import VerdictCache, verdict_cache_key
+
+
+@pytest.mark.parametrize("a, b", [
+    ("a*b", "a/b"),
+    ("2^3", "2 3"),
+    ("x+1", "x 1"),
+    ("x-1", "x+1"),
+])
+def test_different_answers_get_different_keys(a, b):
+    assert verdict_cache_key("q", "expected", a) != verdict_cache_key("q", "expected", b)
+
+
+def test_case_and_whitespace_do_not_change_the_key():
+    assert verdict_cache_key("What is  x?", "A*B", "  a *  b ") == verdict_cache_key("what is x?", "a*b", "A * B")
+
+
+def test_question_and_expected_answer_are_part_of_the_key():
+    assert verdict_cache_key("q1", "a", "a") != verdict_cache_key("q2", "a", "a")
+    assert verdict_cache_key("q", "a", "a") != verdict_cache_key("q", "b", "a")
+
+
+def test_verdicts_survive_a_new_memory_tier(tmp_path):
+    db_path = tmp_path / "cache.db"
+    key = verdict_cache_key("q", "a", "a")
+    VerdictCache(db_path).put(key, {'is_correct': True, 'llm_explanation': "Right."})
+
+    fresh = VerdictCache(db_path)
+    assert fresh.get(key) == {'is_correct': True, 'llm_explanation': "Right."}
+    assert fresh.stats()['db_hits'] == 1
+
+
+def test_grading_errors_are_never_cached(tmp_path):
+    cache = VerdictCache(tmp_path / "cache.db")
+    key = verdict_cache_key("q", "a", "b")
+    cache.put(key, {'is_correct': False, 'llm_explanation': "Grading failed: Missing API Key.", 'grading_error': True})
+    assert cache.get(key) is None
+    assert cache.stats()['stores'] == 0
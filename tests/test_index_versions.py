@@ -0,0 +1,65 @@
+# tests/test_index_versions.py
+
+import os
+import time
+
+from backend import index_versions
+
+
+def _make_version(index_folder, name):
+    with index_versions.build(name, str(index_folder)) as staging:
+        with open(os.path.join(staging, "data"), "w") as f:
+            f.write("vectors")
+    return index_versions.current_path(name, str(index_folder))
+
+
+def _wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return condition()
+
+
+def test_rebuild_keeps_leased_version_until_released(tmp_path):
+    old_path = _make_version(tmp_path, "book")
+    lease = index_versions.acquire("book", str(tmp_path))
+    new_path = _make_version(tmp_path, "book")
+
+    assert new_path != old_path
+    assert os.path.isdir(old_path)
+    lease.release()
+    assert _wait_until(lambda: not os.path.exists(old_path))
+    assert os.path.isdir(new_path)
+
+
+def test_retire_book_waits_for_readers(tmp_path):
+    path = _make_version(tmp_path, "book")
+    lease = index_versions.acquire("book", str(tmp_path))
+
+    assert index_versions.retire_book("book", str(tmp_path))
+    assert os.path.isdir(path)
+    assert index_versions.current_version("book", str(tmp_path)) is None
+
+    lease.release()
+    assert _wait_until(lambda: not os.path.exists(os.path.join(str(tmp_path), "book")))
+
+
+def test_retire_book_without_readers_removes_folder(tmp_path):
+    _make_version(tmp_path, "book")
+    assert index_versions.retire_book("book", str(tmp_path))
+    assert not os.path.exists(os.path.join(str(tmp_path), "book"))
+    assert not index_versions.retire_book("book", str(tmp_path))
+
+
+def test_rebuild_after_retire_keeps_folder(tmp_path):
+    _make_version(tmp_path, "book")
+    lease = index_versions.acquire("book", str(tmp_path))
+    index_versions.retire_book("book", str(tmp_path))
+    path = _make_version(tmp_path, "book")
+    lease.release()
+
+    time.sleep(0.2)
+    assert os.path.isdir(path)
+    assert index_versions.current_path("book", str(tmp_path)) == path
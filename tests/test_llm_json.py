@@ -0,0 +1,58 @@
+# tests/test_llm_json.py
+
+import pytest
+
+from backend.llm_json import extract_json, LLMJSONError, StreamingArrayParser
+
+
+class _Message:
+    def __init__(self, content):
+        self.content = content
+
+
+def test_clean_object():
+    assert extract_json('{"a": 1}', expect="object") == ({"a": 1}, "clean")
+
+
+def test_message_content_and_code_fences():
+    text = _Message('Here you go:\n```json\n{"questions": [1, 2]}\n```')
+    assert extract_json(text, expect="object")[0] == {"questions": [1, 2]}
+
+
+def test_prose_brace_before_the_json():
+    text = 'Use {x} notation for sets. Answer: {"answer": "x"}'
+    assert extract_json(text, expect="object")[0] == {"answer": "x"}
+
+
+def test_trailing_commas_are_repaired():
+    value, status = extract_json('{"items": [1, 2, 3,],}', expect="object")
+    assert value == {"items": [1, 2, 3]}
+    assert status == "repaired"
+
+
+def test_truncated_output_is_closed_after_the_last_complete_value():
+    text = '{"cards": [{"q": "a", "r": "1"}, {"q": "b", "r": "2"}, {"q": "c", "r'
+    value, status = extract_json(text, expect="object")
+    assert status == "repaired"
+    assert value == {"cards": [{"q": "a", "r": "1"}, {"q": "b", "r": "2"}, {"q": "c"}]}
+
+
+def test_truncated_output_is_not_replaced_by_an_inner_fragment():
+    text = '{"slides": [{"title": "One"}, {"title": "Two", "body": "cut'
+    value, _ = extract_json(text, expect="object")
+    assert value == {"slides": [{"title": "One"}, {"title": "Two"}]}
+
+
+def test_expect_array_skips_objects():
+    assert extract_json('Result: [{"id": 1}]', expect="array")[0] == [{"id": 1}]
+
+
+def test_nothing_usable_raises():
+    with pytest.raises(LLMJSONError):
+        extract_json("I cannot help with that.", expect="object")
+
+
+def test_streaming_parser_yields_completed_objects():
+    parser = StreamingArrayParser("questions")
+    assert parser.feed('{"questions": [{"q": 1}, {"q"') == [{"q": 1}]
+    assert parser.feed(': 2}]}') == [{"q": 2}]
@@ -0,0 +1,74 @@
+# tests/test_local_grader.py
+
+import pytest
+
+from backend.local_grader import local_grade_short_answer, normalize_answer
+
+
+def _tier(user, correct, embeddings=None):
+    verdict = local_grade_short_answer(user, correct, embeddings)
+    return None if verdict is None else (verdict['tier'], verdict['is_correct'])
+
+
+def test_normalize_answer():
+    assert normalize_answer("  The  Mitochondria! ") == "mitochondria"
+
+
+def test_junk():
+    assert _tier("???", "photosynthesis") == ("junk", False)
+
+
+def test_exact_after_normalization():
+    assert _tier("the Mitochondria.", "Mitochondria") == ("exact", True)
+
+
+@pytest.mark.parametrize("user, correct, expected", [
+    ("42", "42", ("exact", True)),
+    ("42.0", "42", ("numeric", True)),
+    ("42.4", "42", ("numeric", False)),     # integers match exactly
+    ("3.141", "3.14", ("numeric", True)),   # within half a unit of the last decimal
+    ("3.15", "3.14", ("numeric", False)),
+    ("1,000", "1000", ("numeric", True)),
+])
+def test_numeric(user, correct, expected):
+    assert _tier(user, correct) == expected
+
+
+@pytest.mark.parametrize("user, correct", [
+    ("5 m", "5 km"),     # different units
+    ("5", "5 km"),       # a unit on one side only
+])
+def test_numeric_unit_mismatch_goes_to_the_llm(user, correct):
+    assert _tier(user, correct) is None
+
+
+@pytest.mark.parametrize("user, correct", [
+    ("impermeable", "permeable"),
+    ("not permeable", "permeable"),
+    ("it isn't stable", "it is stable"),
+])
+def test_negations_go_to_the_llm(user, correct):
+    assert _tier(user, correct) is None
+
+
+def test_fuzzy_accepts_typos_in_one_word_answers():
+    assert _tier("photosynthsis", "photosynthesis") == ("fuzzy", True)
+
+
+def test_fuzzy_ignores_multi_word_answers():
+    assert _tier("the cell wall divides", "the cell wall divided") is None
+
+
+class _FakeEmbeddings:
+    def __init__(self, similarity):
+        self.similarity = similarity
+
+    def embed_documents(self, texts):
+        s = self.similarity
+        return [[1.0, 0.0], [s, (1 - s * s) ** 0.5]]
+
+
+def test_embedding_tier_accepts_and_rejects():
+    assert _tier("sunlight becomes sugar", "light energy makes glucose", _FakeEmbeddings(0.95)) == ("embedding", True)
+    assert _tier("volcanoes", "light energy makes glucose", _FakeEmbeddings(0.05)) == ("embedding", False)
+    assert _tier("plants eat light", "light energy makes glucose", _FakeEmbeddings(0.5)) is None
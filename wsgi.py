@@ -0,0 +1,53 @@
+# wsgi.py
+#
+# Production entry point: gunicorn -c gunicorn.conf.py wsgi:app
+# The app (and the MiniLM model) is imported once in the gunicorn master
+# before workers are forked, so every worker shares those pages
+# copy-on-write instead of loading its own copy.
+
+import os
+import gc
+
+# Load the model before forking; a warm-up thread would not survive the fork
+os.environ.setdefault("LEARNLY_STARTUP", "eager")
+# One BLAS/OpenMP thread per worker: the workers are the parallelism
+os.environ.setdefault("OMP_NUM_THREADS", "1")
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+from app import app, embeddings, CHROMA_INDEX_DIR  # noqa: E402
+
+PAGE_CACHE_READ_BYTES = 1024 * 1024
+
+
+def warm_index_files(index_dir: str = CHROMA_INDEX_DIR) -> int:
+    """
+    Reads every Chroma index file once so it sits in the OS page cache,
+    which all workers share. No connections are kept open across the fork.
+    """
+    total = 0
+    for root, _, files in os.walk(index_dir):
+        for name in files:
+            try:
+                with open(os.path.join(root, name), "rb") as f:
+                    while True:
+                        chunk = f.read(PAGE_CACHE_READ_BYTES)
+                        if not chunk:
+                            break
+                        total += len(chunk)
+            except OSError as e:
+                print(f"Could not pre-read {name}: {e}")
+    return total
+
+
+def preload_shared_state():
+    """Everything workers should inherit read-only from the master."""
+    embeddings.embed_query("warm up")
+    warmed = warm_index_files()
+    print(f"Preloaded embedding model and {warmed / (1024 * 1024):.1f} MB of index files")
+    # Move everything allocated so far out of the GC's reach so collections
+    # in the workers don't touch (and copy) the shared pages.
+    gc.collect()
+    gc.freeze()
+
+
+preload_shared_state()